@@ -0,0 +1,179 @@
+import argparse
+import random
+import sys
+import time
+import numpy as np
+import computer
+import evaluation
+import zobrist
+
+# Encoded boards hold one int8 per square (row * 8 + col): 0 when empty, otherwise 1 + the piece number of
+# zobrist.PIECES. OFF_BOARD only appears in the padding column the mobility lookups step onto.
+EMPTY, OFF_BOARD = 0, 13
+MOBILITY_WEIGHT = 0  # Centipawns per square of mobility; 0 keeps the scores equal to computer.scoreBoard
+
+_pieceCodes = {name: index + 1 for index, name in enumerate(zobrist.PIECES)}
+_squares = np.arange(64)
+# [encoded piece][square] tables with an all zero row for empty squares
+_mgTable = np.array([[0] * 64] + evaluation.MG_TABLE, dtype=np.int32)
+_egTable = np.array([[0] * 64] + evaluation.EG_TABLE, dtype=np.int32)
+_phase = np.array((0,) + evaluation.PHASE, dtype=np.int32)
+
+
+def _stepTable(dr, dc):
+    """Square reached from each square by one (dr, dc) step, or 64 (the padding column) off the board"""
+    table = np.full(65, 64)
+    for sq in range(64):
+        r, c = sq // 8 + dr, sq % 8 + dc
+        if 0 <= r < 8 and 0 <= c < 8:
+            table[sq] = r * 8 + c
+    return table
+
+
+DIAGONALS = [_stepTable(dr, dc) for dr, dc in ((-1, -1), (-1, 1), (1, -1), (1, 1))]
+ORTHOGONALS = [_stepTable(dr, dc) for dr, dc in ((-1, 0), (1, 0), (0, -1), (0, 1))]
+KNIGHT_JUMPS = [_stepTable(dr, dc) for dr, dc in ((-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                                                   (1, -2), (1, 2), (2, -1), (2, 1))]
+KING_STEPS = DIAGONALS + ORTHOGONALS
+
+
+def encode(states):
+    """(N, 64) int8 array of game states (GameState or BitboardGameState) or 8x8 boards of piece strings"""
+    encoded = np.zeros((len(states), 64), dtype=np.int8)
+    for i, state in enumerate(states):
+        squares = getattr(state, "squares", None)
+        if squares is not None:  # Bitboard engine: piece numbers with -1 for empty squares
+            encoded[i] = np.array(squares) + 1
+            continue
+        board = state if isinstance(state, list) else state.board
+        encoded[i] = [_pieceCodes.get(square, EMPTY) for row in board for square in row]
+    return encoded
+
+
+def toPlanes(encoded):
+    """(N, 12, 64) int8 one-hot planes, one per piece, of an (N, 64) encoding"""
+    return (encoded[:, None, :] == np.arange(1, 13, dtype=np.int8)[None, :, None]).astype(np.int8)
+
+
+def fromPlanes(planes):
+    return (planes.astype(np.int8) * np.arange(1, 13, dtype=np.int8)[None, :, None]).sum(axis=1, dtype=np.int8)
+
+
+def materialAndPST(encoded):
+    """(middlegame, endgame, phase) arrays matching evaluation.computeTotals on every board"""
+    indices = encoded.astype(np.intp)
+    mg = _mgTable[indices, _squares].sum(axis=1)
+    eg = _egTable[indices, _squares].sum(axis=1)
+    phase = _phase[indices].sum(axis=1)
+    return mg, eg, phase
+
+
+def taper(mg, eg, phase):
+    """Vectorized evaluation.taper, rounding towards zero the same way"""
+    phase = np.minimum(phase, evaluation.TOTAL_PHASE)
+    total = mg * phase + eg * (evaluation.TOTAL_PHASE - phase)
+    return np.sign(total) * (np.abs(total) // evaluation.TOTAL_PHASE)
+
+
+def mobility(encoded):
+    """White minus black pseudo-legal destination count of knights, bishops, rooks, queens and kings.
+
+    A cheap proxy: pins, checks and pawns are ignored, and a square counts if it is empty or holds an
+    enemy piece.
+    """
+    padded = np.concatenate([encoded, np.full((len(encoded), 1), OFF_BOARD, dtype=np.int8)], axis=1)
+    total = np.zeros(len(encoded), dtype=np.int32)
+    for color, sign in ((0, 1), (1, -1)):
+        base = color * 6 + 1  # Encoded pawn of this color
+        enemyLow, enemyHigh = 7 - color * 6, 12 - color * 6
+        count = np.zeros((len(encoded), 64), dtype=np.int32)
+
+        def reachable(target):
+            return (target == EMPTY) | ((target >= enemyLow) & (target <= enemyHigh))
+
+        for piece, steps in ((base + 1, KNIGHT_JUMPS), (base + 5, KING_STEPS)):
+            isPiece = encoded == piece
+            for step in steps:
+                count += isPiece & reachable(padded[:, step[:64]])
+        for sliders, rays in (((base + 2, base + 4), DIAGONALS), ((base + 3, base + 4), ORTHOGONALS)):
+            isSlider = np.isin(encoded, sliders)
+            for ray in rays:
+                alive, position = isSlider, _squares
+                for _ in range(7):
+                    position = ray[position]
+                    target = padded[:, position]
+                    count += alive & reachable(target)
+                    alive = alive & (target == EMPTY)
+        total += sign * count.sum(axis=1)
+    return total
+
+
+def evaluateBatch(encoded, mobilityWeight=MOBILITY_WEIGHT):
+    """Scores from white's side of an (N, 64) encoding or (N, 12, 64) planes, equal to GameState.evaluate()
+    of each position when mobilityWeight is 0"""
+    encoded = np.asarray(encoded)
+    if encoded.ndim == 3:
+        encoded = fromPlanes(encoded)
+    scores = taper(*materialAndPST(encoded))
+    if mobilityWeight:
+        scores = scores + mobilityWeight * mobility(encoded)
+    return scores
+
+
+def scorePositions(states, mobilityWeight=MOBILITY_WEIGHT):
+    """computer.scoreBoard of every game state in one pass: the game over flags of each state still decide
+    checkmate and stalemate, so they must be up to date as for scoreBoard"""
+    scores = evaluateBatch(encode(states), mobilityWeight)
+    for i, state in enumerate(states):
+        if state.checkmate:
+            scores[i] = -computer.CHECKMATE if state.whiteToMove else computer.CHECKMATE
+        elif state.stalemate:
+            scores[i] = computer.STALEMATE
+    return scores
+
+
+def randomPositions(engine, fens, count, maxPlies=60, seed=0):
+    """Game states reached by random playouts from fens, with their game over flags set"""
+    from fen import loadFen
+    rng = random.Random(seed)
+    states = []
+    while len(states) < count:
+        gs = loadFen(engine(), rng.choice(fens))
+        for _ in range(rng.randrange(maxPlies)):
+            moves = gs.getValidMoves()
+            if not moves:
+                break
+            gs.makeMove(rng.choice(moves))
+        gs.getValidMoves()
+        states.append(gs)
+    return states
+
+
+def main(argv=None):
+    from perft import ENGINES, POSITIONS
+    parser = argparse.ArgumentParser(description="Batch evaluation speed and agreement with scoreBoard")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="bitboard")
+    parser.add_argument("--positions", type=int, default=2000, help="number of random playout positions")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    states = randomPositions(ENGINES[args.engine], [fen for _, fen, _, _ in POSITIONS], args.positions,
+                             seed=args.seed)
+    expected = [computer.scoreBoard(gs) for gs in states]
+    mismatches = sum(1 for score, want in zip(scorePositions(states).tolist(), expected) if score != want)
+    # The game states keep running totals, so time scoring boards from scratch as a dataset would need
+    boards = [gs.board for gs in states]
+    encoded = encode(boards)
+    start = time.perf_counter()
+    for board in boards:
+        evaluation.taper(*evaluation.computeTotals(board))
+    loopSeconds = time.perf_counter() - start
+    start = time.perf_counter()
+    evaluateBatch(encoded)
+    batchSeconds = time.perf_counter() - start
+    print(f"{len(states)} positions: one at a time {loopSeconds:.3f}s, batch {batchSeconds:.4f}s "
+          f"({loopSeconds / batchSeconds:.0f}x), {mismatches} mismatches with scoreBoard")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
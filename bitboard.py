@@ -0,0 +1,674 @@
+from array import array
+from moves import Move, CastleRights, PROMOTION_SHIFT, CAPTURE, ENPASSANT, CASTLE, DOUBLE_PUSH
+import zobrist
+import evaluation
+from fen import Placement, STARTING_FEN, loadFen
+
+# Squares are numbered row * 8 + col with row 0 being rank 8, the same layout GameState.board uses.
+# Pieces are indices into zobrist.PIECES: 0-5 white pawn..king, 6-11 black pawn..king.
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 0, 1, 2, 3, 4, 5
+EMPTY = -1
+FULL = (1 << 64) - 1
+
+# Castling rights use the bit layout of zobrist.castleIndex: wks, bks, wqs, bqs
+WKS, BKS, WQS, BQS = 1, 2, 4, 8
+
+
+def _onBoard(r, c):
+    return 0 <= r < 8 and 0 <= c < 8
+
+
+def _jumpTable(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for dr, dc in offsets:
+            if _onBoard(r + dr, c + dc):
+                bb |= 1 << ((r + dr) * 8 + c + dc)
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _jumpTable(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = _jumpTable(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+PAWN_ATTACKS = [_jumpTable(((-1, -1), (-1, 1))), _jumpTable(((1, -1), (1, 1)))]  # [color][square]
+
+# Rays for classical sliding attacks. Directions increasing the square index find their first
+# blocker with the lowest set bit, the others with the highest set bit.
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+
+
+def _rayTable(dr, dc):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for i in range(1, 8):
+            if not _onBoard(r + dr * i, c + dc * i):
+                break
+            bb |= 1 << ((r + dr * i) * 8 + c + dc * i)
+        table.append(bb)
+    return table
+
+
+ROOK_RAYS = [(_rayTable(dr, dc), dr * 8 + dc > 0) for dr, dc in ROOK_DIRECTIONS]
+BISHOP_RAYS = [(_rayTable(dr, dc), dr * 8 + dc > 0) for dr, dc in BISHOP_DIRECTIONS]
+
+# Castling rights that survive a move touching each square
+CASTLE_MASK = [WKS | BKS | WQS | BQS] * 64
+CASTLE_MASK[60] &= ~(WKS | WQS)
+CASTLE_MASK[63] &= ~WKS
+CASTLE_MASK[56] &= ~WQS
+CASTLE_MASK[4] &= ~(BKS | BQS)
+CASTLE_MASK[7] &= ~BKS
+CASTLE_MASK[0] &= ~BQS
+
+# King destination -> (rook from, rook to)
+CASTLE_ROOK_SQUARES = {62: (63, 61), 58: (56, 59), 6: (7, 5), 2: (0, 3)}
+ROW_MASKS = [0xFF << (8 * r) for r in range(8)]
+NOT_FILE_A = FULL ^ sum(1 << (r * 8) for r in range(8))
+NOT_FILE_H = FULL ^ sum(1 << (r * 8 + 7) for r in range(8))
+PROMOTION_ORDER = (QUEEN, ROOK, BISHOP, KNIGHT)
+
+
+def slidingAttacks(sq, occupied, rays):
+    attacks = 0
+    for ray, positive in rays:
+        line = ray[sq]
+        blockers = line & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            line ^= ray[blocker]
+        attacks |= line
+    return attacks
+
+
+def _relevantMask(sq, rays):
+    """Squares whose occupancy changes the attacks from sq; the last square of each ray never does"""
+    mask = 0
+    for ray, positive in rays:
+        line = ray[sq]
+        if line:
+            last = line.bit_length() - 1 if positive else (line & -line).bit_length() - 1
+            mask |= line ^ (1 << last)
+    return mask
+
+
+ROOK_MASKS = [_relevantMask(sq, ROOK_RAYS) for sq in range(64)]
+BISHOP_MASKS = [_relevantMask(sq, BISHOP_RAYS) for sq in range(64)]
+ROOK_LINES = [slidingAttacks(sq, 0, ROOK_RAYS) for sq in range(64)]
+BISHOP_LINES = [slidingAttacks(sq, 0, BISHOP_RAYS) for sq in range(64)]
+# Attack sets indexed by the relevant occupancy, filled on first use like a magic table without the multiply
+_rookTable = [{} for _ in range(64)]
+_bishopTable = [{} for _ in range(64)]
+
+
+def _between(a, b):
+    ar, ac = divmod(a, 8)
+    br, bc = divmod(b, 8)
+    dr, dc = br - ar, bc - ac
+    if a == b or not (dr == 0 or dc == 0 or abs(dr) == abs(dc)):
+        return 0
+    dr, dc = (dr > 0) - (dr < 0), (dc > 0) - (dc < 0)
+    bb = 0
+    r, c = ar + dr, ac + dc
+    while (r, c) != (br, bc):
+        bb |= 1 << (r * 8 + c)
+        r, c = r + dr, c + dc
+    return bb
+
+
+BETWEEN = [[_between(a, b) for b in range(64)] for a in range(64)]  # Squares strictly between two aligned squares
+
+
+def bishopAttacks(sq, occupied):
+    occupied &= BISHOP_MASKS[sq]
+    attacks = _bishopTable[sq].get(occupied)
+    if attacks is None:
+        attacks = _bishopTable[sq][occupied] = slidingAttacks(sq, occupied, BISHOP_RAYS)
+    return attacks
+
+
+def rookAttacks(sq, occupied):
+    occupied &= ROOK_MASKS[sq]
+    attacks = _rookTable[sq].get(occupied)
+    if attacks is None:
+        attacks = _rookTable[sq][occupied] = slidingAttacks(sq, occupied, ROOK_RAYS)
+    return attacks
+
+
+# Packed moves for each target set seen so far, so generation extends a cached tuple instead of
+# looping over the bits of every attack set
+_quietCodes = [{} for _ in range(64)]  # [from square][targets]
+_captureCodes = [{} for _ in range(64)]
+_pawnCodes = {}  # [(shift, flags)][targets], from square = to square - shift
+
+
+def _targetCodes(frm, targets, flags):
+    codes = []
+    while targets:
+        bit = targets & -targets
+        targets ^= bit
+        codes.append(frm | ((bit.bit_length() - 1) << 6) | flags)
+    return tuple(codes)
+
+
+def _shiftCodes(targets, shift, flags):
+    cache = _pawnCodes.setdefault((shift, flags), {})
+    codes = cache.get(targets)
+    if codes is None:
+        codes = []
+        bb = targets
+        while bb:
+            bit = bb & -bb
+            bb ^= bit
+            to = bit.bit_length() - 1
+            codes.append((to - shift) | (to << 6) | flags)
+        codes = cache[targets] = tuple(codes)
+    return codes
+
+
+class BitboardGameState:
+    """Bitboard engine with the same makeMove/undoMove/getValidMoves contract as engine.GameState.
+
+    Search code can skip Move objects entirely through generateLegalMoves/makePackedMove/undoPackedMove,
+    which work on the integer move encoding defined above.
+    """
+
+    def __init__(self, fen=STARTING_FEN):
+        """The starting position, or the position of a FEN string"""
+        loadFen(self, fen)
+
+    def setPosition(self, board, whiteToMove, castleRights, enpassantPossible=(), fiftyMoveCounter=0, fullmoveNumber=1,
+                    placement=None):
+        """Replaces the game with a position given as an 8x8 board of piece strings, or as a fen.Placement
+        that already holds its bitboards"""
+        if placement is None:
+            placement = Placement(board)
+        self.pieces = list(placement.bitboards)
+        self.occupancy = [0, 0]
+        for piece, bits in enumerate(self.pieces):
+            self.occupancy[piece // 6] |= bits
+        self.squares = list(placement.squares)
+        self.whiteToMove = whiteToMove
+        self.castling = zobrist.castleIndex(castleRights)
+        self.epSquare = enpassantPossible[0] * 8 + enpassantPossible[1] if enpassantPossible else EMPTY
+        self.fiftyMoveCounter = fiftyMoveCounter
+        self.moveLog = []
+        self.startPly = 2 * (fullmoveNumber - 1) + (not whiteToMove)  # For the move numbers of toFen
+        self.history = []  # Undo records for every move made, packed or not
+        self.nullMoveLog = []  # (epSquare, zobristKey) before each null move of the search
+        self.inCheck = False
+        self.checkmate, self.stalemate = False, False
+        self._boardView = None
+        self.zobristKey = placement.zobristKey(whiteToMove, castleRights, enpassantPossible)
+        self.positionLog = {self.zobristKey: 1}
+        # Running evaluation totals (see evaluation.py), kept in the undo records like the key
+        self.mgScore, self.egScore, self.phase = placement.totals
+
+    def putPiece(self, piece, sq):
+        self.pieces[piece] |= 1 << sq
+        self.occupancy[piece // 6] |= 1 << sq
+        self.squares[sq] = piece
+
+    def computeKey(self):
+        key = 0
+        for sq in range(64):
+            if self.squares[sq] != EMPTY:
+                key ^= zobrist.pieceKeys[self.squares[sq]][sq]
+        key ^= zobrist.castleKeys[self.castling]
+        if self.epSquare != EMPTY:
+            key ^= zobrist.enpassantKeys[self.epSquare & 7]
+        if not self.whiteToMove:
+            key ^= zobrist.sideKey
+        return key
+
+    # String-board view for the UI and for code written against GameState
+
+    @property
+    def board(self):
+        if self._boardView is None:
+            names = zobrist.PIECES
+            squares = self.squares
+            self._boardView = [[names[squares[r * 8 + c]] if squares[r * 8 + c] != EMPTY else "--"
+                                for c in range(8)] for r in range(8)]
+        return self._boardView
+
+    @property
+    def whiteKingLocation(self):
+        return divmod(self.pieces[KING].bit_length() - 1, 8)
+
+    @property
+    def blackKingLocation(self):
+        return divmod(self.pieces[6 + KING].bit_length() - 1, 8)
+
+    @property
+    def enpassantPossible(self):
+        return divmod(self.epSquare, 8) if self.epSquare != EMPTY else ()
+
+    @property
+    def currentCastleRights(self):
+        return CastleRights(bool(self.castling & WKS), bool(self.castling & BKS),
+                            bool(self.castling & WQS), bool(self.castling & BQS))
+
+    # Attack queries
+
+    def isSquareAttacked(self, sq, byColor, occupied=None):
+        pieces = self.pieces
+        base = byColor * 6
+        if PAWN_ATTACKS[1 - byColor][sq] & pieces[base + PAWN]:
+            return True
+        if KNIGHT_ATTACKS[sq] & pieces[base + KNIGHT]:
+            return True
+        if KING_ATTACKS[sq] & pieces[base + KING]:
+            return True
+        if occupied is None:
+            occupied = self.occupancy[0] | self.occupancy[1]
+        queens = pieces[base + QUEEN]
+        diagonal = pieces[base + BISHOP] | queens
+        if diagonal & BISHOP_LINES[sq] and bishopAttacks(sq, occupied) & diagonal:
+            return True
+        straight = pieces[base + ROOK] | queens
+        if straight & ROOK_LINES[sq] and rookAttacks(sq, occupied) & straight:
+            return True
+        return False
+
+    def kingInCheck(self, color):
+        return self.isSquareAttacked(self.pieces[color * 6 + KING].bit_length() - 1, 1 - color)
+
+    # Move generation
+
+    def generateLegalMoves(self, capturesOnly=False):
+        """Packed legal moves for the side to move.
+
+        Checks and pins are worked out once from the king square, so apart from the rare en passant
+        capture no move has to be made and unmade to prove it legal. With capturesOnly, quiet targets
+        are masked off before any code is built, leaving captures and promotions for quiescence search.
+        """
+        moves = []
+        append, extend = moves.append, moves.extend
+        us = WHITE if self.whiteToMove else BLACK
+        them = 1 - us
+        base, enemyBase = us * 6, them * 6
+        pieces = self.pieces
+        own, enemy = self.occupancy[us], self.occupancy[them]
+        occupied = own | enemy
+        empty = ~occupied & FULL
+        notOwn = ~own & FULL
+        kingBit = pieces[base + KING]
+        king = kingBit.bit_length() - 1
+        diagonal = pieces[enemyBase + BISHOP] | pieces[enemyBase + QUEEN]
+        straight = pieces[enemyBase + ROOK] | pieces[enemyBase + QUEEN]
+
+        # Checkers and pinned pieces
+        checkers = (KNIGHT_ATTACKS[king] & pieces[enemyBase + KNIGHT]) | \
+                   (PAWN_ATTACKS[us][king] & pieces[enemyBase + PAWN])
+        pinned = 0
+        pinMasks = {}
+        snipers = (BISHOP_LINES[king] & diagonal) | (ROOK_LINES[king] & straight)
+        while snipers:
+            bit = snipers & -snipers
+            snipers ^= bit
+            sniper = bit.bit_length() - 1
+            between = BETWEEN[king][sniper]
+            blockers = between & occupied
+            if not blockers:
+                checkers |= bit
+            elif blockers & (blockers - 1) == 0 and blockers & own:
+                pinned |= blockers
+                pinMasks[blockers.bit_length() - 1] = between | bit
+
+        # King moves are checked against the board without the king, so it can't hide behind itself
+        targets = KING_ATTACKS[king] & (enemy if capturesOnly else notOwn)
+        withoutKing = occupied ^ kingBit
+        isSquareAttacked = self.isSquareAttacked
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            to = bit.bit_length() - 1
+            if not isSquareAttacked(to, them, withoutKing):
+                append(king | (to << 6) | (CAPTURE if bit & enemy else 0))
+        if checkers & (checkers - 1):  # Double check: only the king can move
+            return moves
+        if checkers:
+            checker = checkers.bit_length() - 1
+            checkMask = BETWEEN[king][checker] | checkers
+        else:
+            checkMask = FULL
+            if not capturesOnly:
+                self.addCastleMoves(moves, us, them, occupied)
+
+        # Pawns: free pawns move set-wise, pinned ones one by one along their pin
+        pawns = pieces[base + PAWN]
+        freePawns = pawns & ~pinned
+        if us == WHITE:
+            forward, promotionRow, startRow = -8, 0, 6
+            single = (freePawns >> 8) & empty
+            double = ((single & ROW_MASKS[5]) >> 8) & empty & checkMask
+            leftCaptures = ((freePawns & NOT_FILE_A) >> 9) & enemy & checkMask
+            rightCaptures = ((freePawns & NOT_FILE_H) >> 7) & enemy & checkMask
+            leftShift, rightShift = -9, -7
+        else:
+            forward, promotionRow, startRow = 8, 7, 1
+            single = (freePawns << 8) & empty
+            double = ((single & ROW_MASKS[2]) << 8) & empty & checkMask
+            leftCaptures = ((freePawns & NOT_FILE_A) << 7) & enemy & checkMask
+            rightCaptures = ((freePawns & NOT_FILE_H) << 9) & enemy & checkMask
+            leftShift, rightShift = 7, 9
+        single &= checkMask
+        promotionMask = ROW_MASKS[promotionRow]
+        if capturesOnly:  # Promotions are the only pushes kept
+            single &= promotionMask
+            double = 0
+        for targets, shift, flags in ((single, forward, 0), (leftCaptures, leftShift, CAPTURE),
+                                      (rightCaptures, rightShift, CAPTURE), (double, 2 * forward, DOUBLE_PUSH)):
+            promotions = targets & promotionMask
+            if targets ^ promotions:
+                extend(_shiftCodes(targets ^ promotions, shift, flags))
+            while promotions:
+                bit = promotions & -promotions
+                promotions ^= bit
+                to = bit.bit_length() - 1
+                for promotion in PROMOTION_ORDER:
+                    append((to - shift) | (to << 6) | (promotion << PROMOTION_SHIFT) | flags)
+        pinnedPawns = pawns & pinned
+        while pinnedPawns:
+            bit = pinnedPawns & -pinnedPawns
+            pinnedPawns ^= bit
+            frm = bit.bit_length() - 1
+            allowed = pinMasks[frm] & checkMask
+            to = frm + forward
+            if empty >> to & 1 and (not capturesOnly or to >> 3 == promotionRow):
+                if allowed >> to & 1:
+                    self.addPawnMove(moves, frm, to, promotionRow, 0)
+                to += forward
+                if frm >> 3 == startRow and empty >> to & 1 and allowed >> to & 1:
+                    append(frm | (to << 6) | DOUBLE_PUSH)
+            targets = PAWN_ATTACKS[us][frm] & enemy & allowed
+            while targets:
+                target = targets & -targets
+                targets ^= target
+                self.addPawnMove(moves, frm, target.bit_length() - 1, promotionRow, CAPTURE)
+        if self.epSquare != EMPTY:
+            attackers = PAWN_ATTACKS[them][self.epSquare] & pawns
+            while attackers:
+                bit = attackers & -attackers
+                attackers ^= bit
+                code = (bit.bit_length() - 1) | (self.epSquare << 6) | CAPTURE | ENPASSANT
+                # Removing two pawns from one rank can expose the king, so test this one by making it
+                self.makePackedMove(code)
+                if not self.kingInCheck(us):
+                    append(code)
+                self.undoPackedMove()
+
+        # Knights, bishops, rooks and queens
+        quietMask, captureMask = 0 if capturesOnly else empty & checkMask, enemy & checkMask
+        queens = pieces[base + QUEEN]
+        for bb, attacks in ((pieces[base + KNIGHT] & ~pinned, None),  # A pinned knight can never move
+                            (pieces[base + BISHOP] | queens, bishopAttacks),
+                            (pieces[base + ROOK] | queens, rookAttacks)):
+            while bb:
+                bit = bb & -bb
+                bb ^= bit
+                frm = bit.bit_length() - 1
+                targets = KNIGHT_ATTACKS[frm] if attacks is None else attacks(frm, occupied)
+                if bit & pinned:
+                    targets &= pinMasks[frm]
+                quiet = targets & quietMask
+                if quiet:
+                    cache = _quietCodes[frm]
+                    codes = cache.get(quiet)
+                    if codes is None:
+                        codes = cache[quiet] = _targetCodes(frm, quiet, 0)
+                    extend(codes)
+                captures = targets & captureMask
+                if captures:
+                    cache = _captureCodes[frm]
+                    codes = cache.get(captures)
+                    if codes is None:
+                        codes = cache[captures] = _targetCodes(frm, captures, CAPTURE)
+                    extend(codes)
+        return moves
+
+    @staticmethod
+    def addPawnMove(moves, frm, to, promotionRow, flags):
+        if to >> 3 == promotionRow:
+            for promotion in PROMOTION_ORDER:
+                moves.append(frm | (to << 6) | (promotion << PROMOTION_SHIFT) | flags)
+        else:
+            moves.append(frm | (to << 6) | flags)
+
+    def addCastleMoves(self, moves, us, them, occupied):
+        """Castling when not in check: the squares between must be empty and the king's path unattacked"""
+        castling = self.castling
+        if us == WHITE:
+            if castling & WKS and not occupied & 0x6000000000000000 and \
+                    not self.isSquareAttacked(61, them) and not self.isSquareAttacked(62, them):
+                moves.append(60 | (62 << 6) | CASTLE)
+            if castling & WQS and not occupied & 0x0E00000000000000 and \
+                    not self.isSquareAttacked(59, them) and not self.isSquareAttacked(58, them):
+                moves.append(60 | (58 << 6) | CASTLE)
+        else:
+            if castling & BKS and not occupied & 0x60 and \
+                    not self.isSquareAttacked(5, them) and not self.isSquareAttacked(6, them):
+                moves.append(4 | (6 << 6) | CASTLE)
+            if castling & BQS and not occupied & 0x0E and \
+                    not self.isSquareAttacked(3, them) and not self.isSquareAttacked(2, them):
+                moves.append(4 | (2 << 6) | CASTLE)
+
+    # Making and unmaking packed moves
+
+    def makePackedMove(self, code):
+        frm = code & 63
+        to = (code >> 6) & 63
+        pieces, squares, occupancy = self.pieces, self.squares, self.occupancy
+        pieceKeys = zobrist.pieceKeys
+        piece = squares[frm]
+        color = piece // 6
+        captureSq = to
+        if code & ENPASSANT:
+            captureSq = to + 8 if color == WHITE else to - 8
+        captured = squares[captureSq]
+        self.history.append((code, captured, self.castling, self.epSquare, self.fiftyMoveCounter,
+                             self.zobristKey, self.mgScore, self.egScore, self.phase, False))
+        mgTable, egTable, phaseWeights = evaluation.MG_TABLE, evaluation.EG_TABLE, evaluation.PHASE
+        mg, eg, phase = self.mgScore, self.egScore, self.phase
+
+        key = self.zobristKey ^ zobrist.sideKey ^ zobrist.castleKeys[self.castling]
+        if self.epSquare != EMPTY:
+            key ^= zobrist.enpassantKeys[self.epSquare & 7]
+        if captured != EMPTY:
+            pieces[captured] ^= 1 << captureSq
+            occupancy[1 - color] ^= 1 << captureSq
+            squares[captureSq] = EMPTY
+            key ^= pieceKeys[captured][captureSq]
+            mg -= mgTable[captured][captureSq]
+            eg -= egTable[captured][captureSq]
+            phase -= phaseWeights[captured]
+        fromTo = (1 << frm) | (1 << to)
+        occupancy[color] ^= fromTo
+        squares[frm] = EMPTY
+        promotion = (code >> PROMOTION_SHIFT) & 7
+        if promotion:
+            placed = color * 6 + promotion
+            pieces[piece] ^= 1 << frm
+            pieces[placed] ^= 1 << to
+        else:
+            placed = piece
+            pieces[piece] ^= fromTo
+        squares[to] = placed
+        key ^= pieceKeys[piece][frm] ^ pieceKeys[placed][to]
+        mg += mgTable[placed][to] - mgTable[piece][frm]
+        eg += egTable[placed][to] - egTable[piece][frm]
+        phase += phaseWeights[placed] - phaseWeights[piece]
+
+        if code & CASTLE:
+            rookFrom, rookTo = CASTLE_ROOK_SQUARES[to]
+            rook = color * 6 + ROOK
+            rookBits = (1 << rookFrom) | (1 << rookTo)
+            pieces[rook] ^= rookBits
+            occupancy[color] ^= rookBits
+            squares[rookFrom], squares[rookTo] = EMPTY, rook
+            key ^= pieceKeys[rook][rookFrom] ^ pieceKeys[rook][rookTo]
+            mg += mgTable[rook][rookTo] - mgTable[rook][rookFrom]
+            eg += egTable[rook][rookTo] - egTable[rook][rookFrom]
+        self.mgScore, self.egScore, self.phase = mg, eg, phase
+
+        self.castling &= CASTLE_MASK[frm] & CASTLE_MASK[to]
+        key ^= zobrist.castleKeys[self.castling]
+        if code & DOUBLE_PUSH:
+            self.epSquare = (frm + to) >> 1
+            key ^= zobrist.enpassantKeys[self.epSquare & 7]
+        else:
+            self.epSquare = EMPTY
+        if captured != EMPTY or piece % 6 == PAWN:
+            self.fiftyMoveCounter = 0
+        else:
+            self.fiftyMoveCounter += 1
+        self.whiteToMove = not self.whiteToMove
+        self.zobristKey = key
+        self.positionLog[key] = self.positionLog.get(key, 0) + 1
+        self._boardView = None
+
+    def undoPackedMove(self):
+        code, captured, castling, epSquare, fiftyMoveCounter, key, mg, eg, phase, logged = self.history.pop()
+        self.positionLog[self.zobristKey] -= 1
+        frm = code & 63
+        to = (code >> 6) & 63
+        pieces, squares, occupancy = self.pieces, self.squares, self.occupancy
+        placed = squares[to]
+        color = placed // 6
+        fromTo = (1 << frm) | (1 << to)
+        occupancy[color] ^= fromTo
+        if code >> PROMOTION_SHIFT & 7:
+            piece = color * 6 + PAWN
+            pieces[placed] ^= 1 << to
+            pieces[piece] ^= 1 << frm
+        else:
+            piece = placed
+            pieces[piece] ^= fromTo
+        squares[frm], squares[to] = piece, EMPTY
+        if captured != EMPTY:
+            captureSq = to
+            if code & ENPASSANT:
+                captureSq = to + 8 if color == WHITE else to - 8
+            pieces[captured] |= 1 << captureSq
+            occupancy[1 - color] |= 1 << captureSq
+            squares[captureSq] = captured
+        if code & CASTLE:
+            rookFrom, rookTo = CASTLE_ROOK_SQUARES[to]
+            rook = color * 6 + ROOK
+            rookBits = (1 << rookFrom) | (1 << rookTo)
+            pieces[rook] ^= rookBits
+            occupancy[color] ^= rookBits
+            squares[rookFrom], squares[rookTo] = rook, EMPTY
+        self.castling, self.epSquare, self.fiftyMoveCounter = castling, epSquare, fiftyMoveCounter
+        self.zobristKey = key
+        self.mgScore, self.egScore, self.phase = mg, eg, phase
+        self.whiteToMove = not self.whiteToMove
+        self._boardView = None
+        return logged
+
+    def makeNullMove(self):
+        """Passes the turn without moving, for null move pruning in the search"""
+        self.nullMoveLog.append((self.epSquare, self.zobristKey))
+        key = self.zobristKey ^ zobrist.sideKey
+        if self.epSquare != EMPTY:
+            key ^= zobrist.enpassantKeys[self.epSquare & 7]
+        self.epSquare = EMPTY
+        self.zobristKey = key
+        self.whiteToMove = not self.whiteToMove
+
+    def undoNullMove(self):
+        self.epSquare, self.zobristKey = self.nullMoveLog.pop()
+        self.whiteToMove = not self.whiteToMove
+
+    # GameState contract
+
+    def makeMove(self, move, choice=None):
+        self.makePackedMove(move.pack(choice))
+        self.history[-1] = self.history[-1][:-1] + (True,)
+        self.moveLog.append(move)
+
+    def undoMove(self):
+        if len(self.history) != 0:
+            if self.undoPackedMove():
+                self.moveLog.pop()
+            self.checkmate, self.stalemate = False, False
+
+    def getValidMoves(self):
+        """Gets all legal moves as Move objects; promotions appear once and take their piece from makeMove"""
+        codes = self.generateLegalMoves()
+        self.updateGameOver(codes)
+        board = self.board
+        return [Move.fromPacked(code, board) for code in codes
+                if (code >> PROMOTION_SHIFT) & 7 in (0, QUEEN)]
+
+    def getValidMovesPacked(self):
+        """Gets all legal moves as packed ints, one per promotion piece"""
+        codes = array('I', self.generateLegalMoves())
+        self.updateGameOver(codes)
+        return codes
+
+    def getCapturesPacked(self):
+        """Legal captures and promotions only, without updating the game over flags"""
+        return array('I', self.generateLegalMoves(True))
+
+    def isInCheck(self):
+        return self.kingInCheck(WHITE if self.whiteToMove else BLACK)
+
+    def movedIntoCheck(self):
+        """Whether the last move left the king of the side that made it attacked, which makes it illegal"""
+        return self.kingInCheck(BLACK if self.whiteToMove else WHITE)
+
+    def getPieceTypes(self, code):
+        """(moving piece type, captured piece type or -1) of a packed move"""
+        moved = self.squares[code & 63] % 6
+        if code & ENPASSANT:
+            return moved, PAWN
+        captured = self.squares[(code >> 6) & 63]
+        return moved, captured % 6 if captured != EMPTY else -1
+
+    def updateGameOver(self, legalMoves):
+        """Sets inCheck, checkmate and stalemate (including the draw rules) for the current position"""
+        self.inCheck = self.kingInCheck(WHITE if self.whiteToMove else BLACK)
+        self.checkmate = len(legalMoves) == 0 and self.inCheck
+        self.stalemate = (len(legalMoves) == 0 and not self.inCheck) or self.fiftyMoveCounter >= 100 or \
+            self.positionLog.get(self.zobristKey, 0) >= 3 or self.insufficientMaterial()
+
+    def evaluate(self):
+        """Tapered material and piece-square score from white's side, read from the running totals"""
+        return evaluation.taper(self.mgScore, self.egScore, self.phase)
+
+    def hasNonPawnMaterial(self):
+        """Whether the side to move has a piece besides pawns and king, so passing is rarely its best move"""
+        base = 0 if self.whiteToMove else 6
+        pieces = self.pieces
+        return bool(pieces[base + KNIGHT] | pieces[base + BISHOP] | pieces[base + ROOK] | pieces[base + QUEEN])
+
+    def insufficientMaterial(self):
+        pieces = self.pieces
+        if pieces[PAWN] | pieces[ROOK] | pieces[QUEEN] | pieces[6 + PAWN] | pieces[6 + ROOK] | pieces[6 + QUEEN]:
+            return False
+        minors = (pieces[KNIGHT] | pieces[BISHOP] | pieces[6 + KNIGHT] | pieces[6 + BISHOP]).bit_count()
+        return minors <= 1
+
+    def perft(self, depth):
+        """Counts leaf nodes of the legal move tree, the standard move generator benchmark"""
+        if depth == 0:
+            return 1
+        moves = self.generateLegalMoves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for code in moves:
+            self.makePackedMove(code)
+            nodes += self.perft(depth - 1)
+            self.undoPackedMove()
+        return nodes
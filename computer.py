@@ -1,9 +1,47 @@
 import random
+import time
+from transposition import TranspositionTable, EXACT, LOWERBOUND, UPPERBOUND
+from ordering import MoveOrderer, MAX_PLY
+from moves import CAPTURE, PROMOTION_PIECES, PROMOTION_SHIFT
+from evaluation import EG_VALUES
+import tablebase
 
-pieceScore = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
-CHECKMATE = 1000
+CHECKMATE = 30000  # Scores are in centipawns (see evaluation.py)
 STALEMATE = 0
 DEPTH = 2
+MAX_DEPTH = 64
+ASPIRATION_WINDOW = 50  # Half width of the first root window around the previous iteration's score
+ASPIRATION_MIN_DEPTH = 3  # Shallower iterations are cheap and too unstable to guess a window from
+NULL_MOVE_PRUNING = True
+NULL_MOVE_REDUCTION = 3  # Extra plies taken off the search after passing the turn
+LATE_MOVE_REDUCTIONS = True
+LMR_FULL_DEPTH_MOVES = 3  # Moves searched to full depth at each node before quiet moves are reduced
+LMR_MIN_DEPTH = 3
+TABLEBASES = True  # Score positions the loaded endgame tables cover from them instead of searching
+DELTA_MARGIN = 200  # Captures that can't lift the score to within this of alpha aren't searched in quiescence
+HASH_SIZE_MB = 16
+MOVES_TO_GO = 30  # Number of moves the remaining clock is budgeted over
+TIME_SAFETY_MARGIN = 0.1  # Seconds always left on the clock for making the move and redrawing
+TIME_CHECK_NODES = 64  # Nodes searched between looks at the clock
+RANDOM_TIE_BREAK = True  # Vary play between equally ordered moves
+transpositionTable = TranspositionTable(HASH_SIZE_MB)  # Kept between moves so later searches reuse earlier work
+moveOrderer = MoveOrderer(RANDOM_TIE_BREAK)
+deadline = None  # perf_counter time at which the running search gives up
+stopEvent = None  # threading.Event another thread sets to cancel the running search
+nodeLimit = None  # Node count at which the running search gives up
+nodes = 0
+quiescenceNodes = 0
+researches = 0  # Null window scouts that failed high and were searched again with the full window
+aspirationFailures = 0
+nullMoveCutoffs = 0
+reductions = 0
+reductionResearches = 0  # Reduced moves that beat alpha and were searched again to full depth
+tablebaseHits = 0  # Positions scored from the endgame tables
+searchInfo = {}  # Depth, score, nodes, seconds and principal variation of the last completed iteration
+
+class SearchTimeout(Exception):
+    """Raised inside alphaBeta once the hard time limit has passed or the search is cancelled"""
+
 def findRandomMove(validMoves):
     return random.choice(validMoves)
 #
@@ -67,29 +105,299 @@ def findRandomMove(validMoves):
 #     return maxScore
 
 def findBestMoveAlphaBeta(gs, validMoves , depth):
-    global nextMove
-    nextMove = None
-    random.shuffle(validMoves)
-    global DEPTH
-    DEPTH = depth
-    # print(DEPTH)
-    alphaBeta(gs, validMoves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
-    return nextMove
-
-def alphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier):
-    global nextMove
-    if depth == 0:
+    """Searches on packed moves and only turns the chosen one back into one of validMoves"""
+    return findBestMoveIterative(gs, validMoves, depth)
+
+def findBestMoveTimed(gs, validMoves, timeLeft, increment=0.0, maxDepth=MAX_DEPTH, stop=None):
+    """Deepens until the share of the clock given to this move is used up"""
+    softTime, hardTime = allocateTime(timeLeft, increment)
+    return findBestMoveIterative(gs, validMoves, maxDepth, softTime, hardTime, stop)
+
+def allocateTime(timeLeft, increment=0.0):
+    """Returns (soft, hard) seconds for one move.
+
+    No new iteration starts after the soft limit, and the search is abandoned at the hard limit,
+    which always leaves TIME_SAFETY_MARGIN on the clock.
+    """
+    available = max(0.0, timeLeft - TIME_SAFETY_MARGIN)
+    softTime = min(available, timeLeft / MOVES_TO_GO + increment * 0.8)
+    hardTime = min(available, softTime * 3, timeLeft / 4 + increment)
+    return softTime, max(hardTime, softTime)
+
+def findBestMoveIterative(gs, validMoves, maxDepth, softTime=None, hardTime=None, stop=None, maxNodes=None,
+                          onIteration=None):
+    """Iterative deepening: every completed depth leaves a best move and fills the transposition table,
+    which orders the next, deeper iteration. If the hard time limit cuts an iteration short, the move
+    from the last completed one is returned.
+
+    Setting the threading.Event stop cancels the search from another thread; the move returned is then
+    None if not even depth 1 finished. maxNodes limits the nodes searched the way hardTime limits the
+    time, and onIteration is called with searchInfo after every completed depth.
+    """
+    global nextMove, DEPTH, deadline, stopEvent, nodeLimit, nodes, quiescenceNodes, researches, aspirationFailures
+    global nullMoveCutoffs, reductions, reductionResearches, tablebaseHits
+    start = time.perf_counter()
+    deadline = nodeLimit = None
+    nodes = quiescenceNodes = researches = aspirationFailures = 0
+    nullMoveCutoffs = reductions = reductionResearches = tablebaseHits = 0
+    packedMoves = gs.getValidMovesPacked()
+    transpositionTable.newSearch()
+    moveOrderer.newSearch()
+    bestMove, bestScore = None, 0
+    searchInfo.update(depth=0, score=0, nodes=0, seconds=0.0, pv=[], ebf=0.0, iterations=[], tablebase=False)
+    if len(packedMoves) == 1:
+        return findMove(validMoves, packedMoves[0])
+    tableMove = findTablebaseMove(gs, validMoves, packedMoves)
+    if tableMove is not None:
+        return tableMove
+    stopEvent = stop
+    for depth in range(1, maxDepth + 1):
+        if bestMove is not None:  # Principal variation move first
+            i = packedMoves.index(bestMove)
+            packedMoves[0], packedMoves[i] = packedMoves[i], packedMoves[0]
+        DEPTH = depth
+        try:
+            score = aspirationSearch(gs, packedMoves, depth, bestScore)
+        except SearchTimeout:
+            break
+        bestMove, bestScore = nextMove, score
+        elapsed = time.perf_counter() - start
+        searchInfo.update(depth=depth, score=bestScore, nodes=nodes, quiescenceNodes=quiescenceNodes,
+                          researches=researches, aspirationFailures=aspirationFailures,
+                          nullMoveCutoffs=nullMoveCutoffs, reductions=reductions,
+                          reductionResearches=reductionResearches, tablebaseHits=tablebaseHits, seconds=elapsed,
+                          pv=principalVariation(gs, depth), ebf=nodes ** (1 / depth), **moveOrderer.stats())
+        searchInfo["iterations"].append((depth, nodes, elapsed))  # Time to depth
+        if onIteration is not None:
+            onIteration(searchInfo)
+        if hardTime is not None:
+            deadline = start + hardTime  # The first iteration always completes so there is a move
+        nodeLimit = maxNodes
+        if abs(bestScore) >= CHECKMATE or (softTime is not None and elapsed >= softTime) or \
+                (maxNodes is not None and nodes >= maxNodes):
+            break
+    deadline = stopEvent = nodeLimit = None
+    return findMove(validMoves, bestMove)
+
+def findTablebaseMove(gs, validMoves, packedMoves):
+    """The move the endgame tables rate best, if they cover the position, so it is played without searching"""
+    if not TABLEBASES or gs.phase > tablebase.MAX_PHASE:
+        return None
+    code = tablebase.bestMove(gs, packedMoves)
+    if code is None:
+        return None
+    searchInfo.update(score=tablebase.probe(gs), pv=[code], tablebase=True)
+    return findMove(validMoves, code)
+
+def aspirationSearch(gs, packedMoves, depth, previousScore):
+    """Searches the root in a narrow window around the previous iteration's score, since most moves
+    are then refuted faster. The side that fails is widened until the score falls inside the window.
+    """
+    global nextMove, aspirationFailures
+    turnMultiplier = 1 if gs.whiteToMove else -1
+    if depth < ASPIRATION_MIN_DEPTH or abs(previousScore) >= CHECKMATE:
+        nextMove = None
+        return alphaBeta(gs, packedMoves, depth, -CHECKMATE, CHECKMATE, turnMultiplier)
+    window = ASPIRATION_WINDOW
+    alpha, beta = max(previousScore - window, -CHECKMATE), min(previousScore + window, CHECKMATE)
+    while True:
+        nextMove = None
+        score = alphaBeta(gs, packedMoves, depth, alpha, beta, turnMultiplier)
+        if score <= alpha and alpha > -CHECKMATE:
+            alpha = max(previousScore - 2 * window, -CHECKMATE)
+        elif score >= beta and beta < CHECKMATE:
+            beta = min(previousScore + 2 * window, CHECKMATE)
+        else:
+            return score
+        aspirationFailures += 1
+        window *= 2
+
+def principalVariation(gs, depth):
+    """Follows best moves stored in the transposition table from the current position"""
+    pv = []
+    for _ in range(depth):
+        entry = transpositionTable.probe(gs.zobristKey)
+        if entry is None or not entry[3] or entry[3] not in gs.getValidMovesPacked():
+            break
+        pv.append(entry[3])
+        gs.makePackedMove(entry[3])
+    for _ in pv:
+        gs.undoPackedMove()
+    return pv
+
+def findMove(validMoves, code):
+    """The Move in validMoves with the same start and end squares as a packed move, promoting to the piece
+    the packed move does, so makeMove plays what the search chose"""
+    if code is None:
+        return None
+    start, end = code & 63, (code >> 6) & 63
+    promotion = (code >> PROMOTION_SHIFT) & 7
+    for move in validMoves:
+        if move.startRow * 8 + move.startCol == start and move.endRow * 8 + move.endCol == end:
+            return move.withPromotion(PROMOTION_PIECES[promotion]) if promotion else move
+    return None
+
+def setHashSize(sizeMB):
+    transpositionTable.resize(sizeMB)
+
+def newGame():
+    """Forgets everything learned about positions of the previous game"""
+    transpositionTable.clear()
+    moveOrderer.clear()
+
+def checkTime():
+    if (deadline is not None and time.perf_counter() > deadline) or (stopEvent is not None and stopEvent.is_set()) \
+            or (nodeLimit is not None and nodes >= nodeLimit):
+        raise SearchTimeout
+
+def alphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier, ply=0, allowNullMove=True):
+    """Negamax alpha-beta over packed moves (see moves.py) so no Move objects are built while searching.
+
+    Principal variation search: only the first move gets the full window. The rest are scouted with a
+    null window that just proves them no better than alpha, and are searched again if that fails.
+    Null move pruning and late move reductions (see NULL_MOVE_PRUNING and LATE_MOVE_REDUCTIONS) cut the
+    search short where a move is unlikely to matter.
+    """
+    global nextMove, nodes, researches, nullMoveCutoffs, reductions, reductionResearches, tablebaseHits
+    if ply and TABLEBASES and gs.phase <= tablebase.MAX_PHASE:
+        score = tablebase.probe(gs)
+        if score is not None:
+            tablebaseHits += 1
+            return score
+    if depth == 0 and not (gs.checkmate or gs.stalemate):
+        return quiescence(gs, alpha, beta, turnMultiplier, ply)
+    nodes += 1
+    if nodes % TIME_CHECK_NODES == 0:
+        checkTime()
+    isRoot = ply == 0
+    inCheck = gs.inCheck
+    if (gs.checkmate or gs.stalemate) and not isRoot:
         return turnMultiplier * scoreBoard(gs)
+
+    # Reuse what an earlier visit of this position found
+    alphaOriginal = alpha
+    ttMove = 0
+    entry = transpositionTable.probe(gs.zobristKey)
+    if entry is not None:
+        ttDepth, ttScore, ttBound, ttMove = entry
+        if ttDepth >= depth and not isRoot:
+            if ttBound == EXACT:
+                return ttScore
+            elif ttBound == LOWERBOUND:
+                alpha = max(alpha, ttScore)
+            else:
+                beta = min(beta, ttScore)
+            if alpha >= beta:
+                return ttScore
+
+    # Null move: if passing still fails high, a real move would too. Only tried when the static score already
+    # beats beta, and never in check or without pieces, where having to move can be the problem (zugzwang)
+    if NULL_MOVE_PRUNING and allowNullMove and not isRoot and not inCheck and depth > NULL_MOVE_REDUCTION and \
+            beta < CHECKMATE and gs.hasNonPawnMaterial() and turnMultiplier * gs.evaluate() >= beta:
+        gs.makeNullMove()
+        try:
+            nextMoves = gs.getValidMovesPacked()
+            score = -alphaBeta(gs, nextMoves, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + 1, -turnMultiplier,
+                               ply + 1, False)
+        finally:
+            gs.undoNullMove()
+        if score >= beta:
+            nullMoveCutoffs += 1
+            return beta if score >= CHECKMATE else score
+
+    killers = moveOrderer.killers[ply] if ply < MAX_PLY else ()
     maxScore = -CHECKMATE
-    for move in validMoves:
-        gs.makeMove(move)
-        nextMoves = gs.getValidMoves()
-        score = -alphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
-        if score > maxScore:
+    bestMove = None
+    for moveNumber, move in enumerate(moveOrderer.orderMoves(gs, validMoves, ply, ttMove), 1):
+        gs.makePackedMove(move)
+        try:
+            nextMoves = gs.getValidMovesPacked()
+            if moveNumber == 1:
+                score = -alphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier, ply + 1)
+            else:
+                # Late move reductions: quiet moves ordered late are searched a ply shallower
+                reduction = 0
+                if LATE_MOVE_REDUCTIONS and moveNumber > LMR_FULL_DEPTH_MOVES and depth >= LMR_MIN_DEPTH and \
+                        not inCheck and not gs.inCheck and not move & CAPTURE and \
+                        not (move >> PROMOTION_SHIFT) & 7 and move not in killers:
+                    reduction = 1
+                    reductions += 1
+                score = -alphaBeta(gs, nextMoves, depth - 1 - reduction, -alpha - 1, -alpha, -turnMultiplier,
+                                   ply + 1)
+                if reduction and score > alpha:
+                    reductionResearches += 1
+                    nextMoves = gs.getValidMovesPacked()
+                    score = -alphaBeta(gs, nextMoves, depth - 1, -alpha - 1, -alpha, -turnMultiplier, ply + 1)
+                if alpha < score < beta:
+                    researches += 1
+                    nextMoves = gs.getValidMovesPacked()  # The scout left the game over flags of a deeper position
+                    score = -alphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier, ply + 1)
+        finally:  # Also unwinds the board when the search times out
+            gs.undoPackedMove()
+        if score > maxScore or bestMove is None:
             maxScore = score
-            if depth == DEPTH:
+            bestMove = move
+            if isRoot:
                 nextMove = move
-        gs.undoMove()
+        alpha = max(alpha, maxScore)
+        if alpha >= beta:
+            moveOrderer.recordCutoff(gs, move, ply, depth, moveNumber)
+            break
+
+    if maxScore <= alphaOriginal:
+        bound = UPPERBOUND
+    elif maxScore >= beta:
+        bound = LOWERBOUND
+    else:
+        bound = EXACT
+    transpositionTable.store(gs.zobristKey, depth, maxScore, bound, bestMove or 0)
+    return maxScore
+
+def quiescence(gs, alpha, beta, turnMultiplier, ply):
+    """Searches captures and promotions until the position is quiet, so no score is taken in the middle
+    of an exchange. The side to move may stand pat on the static score instead of capturing, unless it
+    is in check, when every evasion is searched.
+    """
+    global nodes, quiescenceNodes, tablebaseHits
+    if TABLEBASES and gs.phase <= tablebase.MAX_PHASE:
+        score = tablebase.probe(gs)
+        if score is not None:
+            tablebaseHits += 1
+            return score
+    nodes += 1
+    quiescenceNodes += 1
+    if nodes % TIME_CHECK_NODES == 0:
+        checkTime()
+    inCheck = gs.isInCheck()
+    if inCheck:
+        moves = gs.getValidMovesPacked()
+        if gs.checkmate or gs.stalemate:
+            return turnMultiplier * scoreBoard(gs)
+        standPat = maxScore = -CHECKMATE
+    else:
+        # The game over flags belong to whichever position last generated all moves, so don't use scoreBoard
+        standPat = maxScore = turnMultiplier * gs.evaluate()
+        if standPat >= beta:
+            return standPat
+        alpha = max(alpha, standPat)
+        moves = gs.getCapturesPacked()
+
+    for move in moveOrderer.orderMoves(gs, moves, ply):
+        if not inCheck:
+            # Delta pruning: skip captures that can't win back enough material even unopposed
+            gain = EG_VALUES[gs.getPieceTypes(move)[1]] if move & CAPTURE else 0
+            promotion = (move >> PROMOTION_SHIFT) & 7
+            if promotion:
+                gain += EG_VALUES[promotion] - EG_VALUES[0]
+            if standPat + gain + DELTA_MARGIN <= alpha:
+                continue
+        gs.makePackedMove(move)
+        try:
+            score = -quiescence(gs, -beta, -alpha, -turnMultiplier, ply + 1)
+        finally:
+            gs.undoPackedMove()
+        if score > maxScore:
+            maxScore = score
         alpha = max(alpha, maxScore)
         if alpha >= beta:
             break
@@ -103,16 +411,4 @@ def scoreBoard(gs):
             return CHECKMATE
     elif gs.stalemate:
         return STALEMATE
-    score = scoreMaterial(gs.board)
-    return score
-
-# Score the board based on material
-def scoreMaterial(board):
-    score = 0
-    for row in board:
-        for square in row:
-            if square[0] == 'w':
-                score += pieceScore[square[1]]
-            elif square[0] == 'b':
-                score -= pieceScore[square[1]]
-    return score
\ No newline at end of file
+    return gs.evaluate()
\ No newline at end of file
@@ -1,35 +1,72 @@
-from moves import MoveGenerator, Move, CastleRights
+from array import array
+from moves import MoveGenerator, Move, CastleRights, PROMOTION_SHIFT, PROMOTION_CHOICES, PIECE_TYPES, ENPASSANT
+from moves import rookRays, bishopRays, queenRays, knightJumps, kingSteps
+import zobrist
+import evaluation
+from fen import Placement, STARTING_FEN, loadFen
 
 class GameState(MoveGenerator):
     
-    def __init__(self):
+    def __init__(self, fen=STARTING_FEN):
+        """The starting position, or the position of a FEN string"""
         super().__init__()
-        self.board = [
-            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
-            ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
-            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]]
-
         self.moveFunctions = {"p": self.getPawnMoves, "R": self.getRookMoves, "N": self.getKnightMoves,
                               "B": self.getBishopMoves, "Q": self.getQueenMoves, "K": self.getKingMoves}
-        self.whiteToMove = True
+        loadFen(self, fen)
+
+    def setPosition(self, board, whiteToMove, castleRights, enpassantPossible=(), fiftyMoveCounter=0, fullmoveNumber=1,
+                    placement=None):
+        """Replaces the game with a position given as an 8x8 board of piece strings, or as a fen.Placement
+        that already holds what is derived from the board"""
+        if placement is None:
+            placement = Placement(board)
+        self.board = [list(row) for row in placement.board]
+        self.whiteToMove = whiteToMove
+        self.whiteKingLocation, self.blackKingLocation = placement.whiteKing, placement.blackKing
         self.moveLog = []
-        self.whiteKingLocation , self.blackKingLocation = (7, 4), (0, 4)
+        self.startPly = 2 * (fullmoveNumber - 1) + (not whiteToMove)  # For the move numbers of toFen
         self.inCheck = False
         self.checkmate, self.stalemate = False, False
         self.pins, self.checks = [], []
-        self.enpassantPossible = ()  # Coordinates for the square where en passant capture is possible
-        self.currentCastleRights = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastleRights.wks, self.currentCastleRights.bks,
-                                             self.currentCastleRights.wqs, self.currentCastleRights.bqs)]
-        self.fiftyMoveCounter = 0
-        self.positionLog = {}
-
-    def makeMove(self, move, choice='Q'):
+        self.checkCache = None  # (Zobrist key, checkForPinsAndChecks result) of the last isInCheck
+        self.enpassantPossible = enpassantPossible  # Coordinates for the square where en passant capture is possible
+        self.enpassantPossibleLog = [enpassantPossible]
+        self.currentCastleRights = CastleRights(castleRights.wks, castleRights.bks, castleRights.wqs, castleRights.bqs)
+        self.castleRightsLog = [CastleRights(castleRights.wks, castleRights.bks, castleRights.wqs, castleRights.bqs)]
+        self.fiftyMoveCounter = fiftyMoveCounter
+        self.fiftyMoveCounterLog = [fiftyMoveCounter]
+        # 64-bit Zobrist key of the current position, updated incrementally by makeMove/undoMove
+        self.zobristKey = placement.zobristKey(whiteToMove, castleRights, enpassantPossible)
+        self.zobristKeyLog = []
+        self.positionLog = {self.zobristKey: 1}  # Zobrist key -> number of times the position occurred
+        self.attackMaps = {}  # Attacking color -> (Zobrist key, attacked squares) of the last map built
+        # Running evaluation totals (see evaluation.py), updated by makeMove/undoMove
+        self.mgScore, self.egScore, self.phase = placement.totals
+        self.evalLog = []
+
+    def makeMove(self, move, choice=None):
+        """Makes move, promoting to choice if given or else to the piece the move carries"""
+        key = self.zobristKey
+        self.zobristKeyLog.append(key)
+        pieceKeys = zobrist.pieceKeys
+        # Remove the old castling rights, en passant file and side to move from the key
+        key ^= zobrist.castleKeys[zobrist.castleIndex(self.currentCastleRights)] ^ zobrist.sideKey
+        if self.enpassantPossible:
+            key ^= zobrist.enpassantKeys[self.enpassantPossible[1]]
+        self.evalLog.append((self.mgScore, self.egScore, self.phase))
+        mgTable, egTable = evaluation.MG_TABLE, evaluation.EG_TABLE
+        moved = zobrist.pieceIndex[move.pieceMoved]
+        start = move.startRow * 8 + move.startCol
+        key ^= pieceKeys[moved][start]
+        mg, eg, phase = self.mgScore - mgTable[moved][start], self.egScore - egTable[moved][start], self.phase
+        if move.pieceCaptured != "--":
+            captureRow = move.startRow if move.isEnpassantMove else move.endRow
+            captured = zobrist.pieceIndex[move.pieceCaptured]
+            key ^= pieceKeys[captured][captureRow * 8 + move.endCol]
+            mg -= mgTable[captured][captureRow * 8 + move.endCol]
+            eg -= egTable[captured][captureRow * 8 + move.endCol]
+            phase -= evaluation.PHASE[captured]
+
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move)
@@ -40,6 +77,7 @@ class GameState(MoveGenerator):
             self.blackKingLocation = (move.endRow, move.endCol)
         
         if move.isPawnPromotion:
+            choice = choice or move.promotionChoice
             promote = ''
             if choice == 'B':
                 promote = move.pieceMoved[0] + 'B'
@@ -51,7 +89,13 @@ class GameState(MoveGenerator):
                 promote = move.pieceMoved[0] + 'Q'
             
             self.board[move.endRow][move.endCol] = promote
-            
+        placed = zobrist.pieceIndex[self.board[move.endRow][move.endCol]]
+        end = move.endRow * 8 + move.endCol
+        key ^= pieceKeys[placed][end]
+        mg += mgTable[placed][end]
+        eg += egTable[placed][end]
+        phase += evaluation.PHASE[placed] - evaluation.PHASE[moved]
+
         if move.isEnpassantMove:
             self.board[move.startRow][move.endCol] = "--" # Capturing the pawn
         
@@ -60,32 +104,41 @@ class GameState(MoveGenerator):
             self.enpassantPossible = ((move.startRow + move.endRow) // 2, move.startCol)
         else:
             self.enpassantPossible = ()
+        self.enpassantPossibleLog.append(self.enpassantPossible)
+        if self.enpassantPossible:
+            key ^= zobrist.enpassantKeys[self.enpassantPossible[1]]
         
         if move.isCastleMove:
             if move.endCol - move.startCol == 2: # King side castle
-                self.board[move.endRow][move.endCol-1] = self.board[move.endRow][move.endCol+1]
-                self.board[move.endRow][move.endCol+1] = '--'
+                rookStartCol, rookEndCol = move.endCol + 1, move.endCol - 1
             else: # Queen side castle
-                self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-2]
-                self.board[move.endRow][move.endCol-2] = '--'
+                rookStartCol, rookEndCol = move.endCol - 2, move.endCol + 1
+            rook = self.board[move.endRow][rookStartCol]
+            self.board[move.endRow][rookEndCol] = rook
+            self.board[move.endRow][rookStartCol] = '--'
+            rookKeys = pieceKeys[zobrist.pieceIndex[rook]]
+            key ^= rookKeys[move.endRow * 8 + rookStartCol] ^ rookKeys[move.endRow * 8 + rookEndCol]
+            rookMg, rookEg = mgTable[zobrist.pieceIndex[rook]], egTable[zobrist.pieceIndex[rook]]
+            mg += rookMg[move.endRow * 8 + rookEndCol] - rookMg[move.endRow * 8 + rookStartCol]
+            eg += rookEg[move.endRow * 8 + rookEndCol] - rookEg[move.endRow * 8 + rookStartCol]
+        self.mgScore, self.egScore, self.phase = mg, eg, phase
         
         # Update castling rights - whenever it is a rook or a king move
         self.updateCastleRights(move)
         self.castleRightsLog.append(CastleRights(self.currentCastleRights.wks, self.currentCastleRights.bks,
                                                  self.currentCastleRights.wqs, self.currentCastleRights.bqs))
+        key ^= zobrist.castleKeys[zobrist.castleIndex(self.currentCastleRights)]
+        self.zobristKey = key
 
         # Update fifty-move rule counter
         if move.pieceCaptured == "--" and move.pieceMoved[1] != 'p':
             self.fiftyMoveCounter += 1
         else:
             self.fiftyMoveCounter = 0
+        self.fiftyMoveCounterLog.append(self.fiftyMoveCounter)
 
         # Update position log for threefold repetition
-        board_tuple = tuple(tuple(row) for row in self.board)
-        if board_tuple in self.positionLog:
-            self.positionLog[board_tuple] += 1
-        else:
-            self.positionLog[board_tuple] = 1
+        self.positionLog[key] = self.positionLog.get(key, 0) + 1
 
     def undoMove(self):
         if len(self.moveLog) != 0:
@@ -101,10 +154,9 @@ class GameState(MoveGenerator):
             if move.isEnpassantMove:
                 self.board[move.endRow][move.endCol] = "--" # Leave landing square blank
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
-                self.enpassantPossible = (move.endRow, move.endCol)
-            # Undo 2 square pawn advance
-            if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:
-                self.enpassantPossible = ()
+            # Restore the en passant square of the previous position
+            self.enpassantPossibleLog.pop()
+            self.enpassantPossible = self.enpassantPossibleLog[-1]
             # Undo castling rights
             self.castleRightsLog.pop() # Get rid of new castle rights from the move we are undoing
             castleRights = self.castleRightsLog[-1] # Set the current castle rights to the last one in the list
@@ -119,16 +171,78 @@ class GameState(MoveGenerator):
                     self.board[move.endRow][move.endCol+1] = '--'
             self.checkmate, self.stalemate = False, False
 
-            # Update fifty-move rule counter
-            if move.pieceCaptured == "--" and move.pieceMoved[1] != 'p':
-                self.fiftyMoveCounter -= 1
-            else:
-                self.fiftyMoveCounter = 0
+            # Restore the fifty-move rule counter, which a capture or pawn move had reset
+            self.fiftyMoveCounterLog.pop()
+            self.fiftyMoveCounter = self.fiftyMoveCounterLog[-1]
 
             # Update position log for threefold repetition
-            board_tuple = tuple(tuple(row) for row in self.board)
-            if board_tuple in self.positionLog:
-                self.positionLog[board_tuple] -= 1
+            if self.positionLog.get(self.zobristKey, 0) > 0:
+                self.positionLog[self.zobristKey] -= 1
+            self.zobristKey = self.zobristKeyLog.pop()
+            self.mgScore, self.egScore, self.phase = self.evalLog.pop()
+
+    def evaluate(self):
+        """Tapered material and piece-square score from white's side, read from the running totals"""
+        return evaluation.taper(self.mgScore, self.egScore, self.phase)
+
+    def getValidMoves(self):
+        """Gets all moves considering checks as Move objects, for the UI and notation; promotions appear once
+        and take their piece from makeMove"""
+        board = self.board
+        return [Move.fromPacked(code, board) for code in self.getValidMovesPacked()
+                if (code >> PROMOTION_SHIFT) & 7 in (0, PROMOTION_CHOICES['Q'])]
+
+    def getCapturesPacked(self):
+        """Legal captures and promotions only, without updating the game over flags"""
+        return array('I', self.generateLegalMoves(True))
+
+    def isInCheck(self):
+        """Whether the side to move is in check. The pins and checks found are kept for the next move
+        generation in the same position, which quiescence search runs straight after"""
+        inCheck, pins, checks = self.checkForPinsAndChecks()
+        self.checkCache = (self.zobristKey, (inCheck, pins, checks))
+        return inCheck
+
+    def movedIntoCheck(self):
+        """Whether the last move left the king of the side that made it attacked, which makes it illegal"""
+        row, col = self.blackKingLocation if self.whiteToMove else self.whiteKingLocation
+        return self.attackedBy(row, col, 'w' if self.whiteToMove else 'b')
+
+    def makePackedMove(self, code):
+        self.makeMove(Move.fromPacked(code, self.board))
+
+    def undoPackedMove(self):
+        self.undoMove()
+
+    def makeNullMove(self):
+        """Passes the turn without moving, for null move pruning in the search"""
+        self.zobristKeyLog.append(self.zobristKey)
+        if self.enpassantPossible:
+            self.zobristKey ^= zobrist.enpassantKeys[self.enpassantPossible[1]]
+        self.zobristKey ^= zobrist.sideKey
+        self.enpassantPossible = ()
+        self.enpassantPossibleLog.append(self.enpassantPossible)
+        self.whiteToMove = not self.whiteToMove
+
+    def undoNullMove(self):
+        self.whiteToMove = not self.whiteToMove
+        self.enpassantPossibleLog.pop()
+        self.enpassantPossible = self.enpassantPossibleLog[-1]
+        self.zobristKey = self.zobristKeyLog.pop()
+
+    def hasNonPawnMaterial(self):
+        """Whether the side to move has a piece besides pawns and king, so passing is rarely its best move"""
+        color = 'w' if self.whiteToMove else 'b'
+        return any(square[0] == color and square[1] not in "pK" for row in self.board for square in row)
+
+    def getPieceTypes(self, code):
+        """(moving piece type, captured piece type or -1) of a packed move, numbered as in PIECE_TYPES"""
+        start, end = code & 63, (code >> 6) & 63
+        moved = PIECE_TYPES[self.board[start >> 3][start & 7][1]]
+        if code & ENPASSANT:
+            return moved, PIECE_TYPES['p']
+        captured = self.board[end >> 3][end & 7]
+        return moved, PIECE_TYPES[captured[1]] if captured != "--" else -1
 
     def updateCastleRights(self, move):
         if move.pieceMoved == 'wK':
@@ -147,14 +261,56 @@ class GameState(MoveGenerator):
                     self.currentCastleRights.bqs = False
                 elif move.startCol == 7:
                     self.currentCastleRights.bks = False
+        # A rook captured on its starting square takes its side's castling right with it
+        if move.pieceCaptured == 'wR' and move.endRow == 7:
+            if move.endCol == 0:
+                self.currentCastleRights.wqs = False
+            elif move.endCol == 7:
+                self.currentCastleRights.wks = False
+        elif move.pieceCaptured == 'bR' and move.endRow == 0:
+            if move.endCol == 0:
+                self.currentCastleRights.bqs = False
+            elif move.endCol == 7:
+                self.currentCastleRights.bks = False
 
-    def getValidMoves(self):
+    def getValidMovesPacked(self):
+        """Gets all moves considering checks as packed ints, the form the search works on, one per promotion
+        piece"""
+        moves = self.generateLegalMoves()
+        if len(moves) == 0:  # Either checkmate or stalemate
+            if self.inCheck:
+                self.checkmate = True
+            else:
+                self.stalemate = True
+        else:
+            self.checkmate, self.stalemate = False, False
+
+        # Check for fifty-move rule (the counter is in plies, like the FEN halfmove clock)
+        if self.fiftyMoveCounter >= 100:
+            self.stalemate = True
+
+        # Check for threefold repetition
+        if self.positionLog.get(self.zobristKey, 0) >= 3:
+            self.stalemate = True
+
+        # Check for insufficient material
+        if self.insufficientMaterial():
+            self.stalemate = True
+
+        return array('I', moves)
+
+    def generateLegalMoves(self, capturesOnly=False):
+        """Packed legal moves for the side to move, without updating the game over flags. With capturesOnly
+        the generators skip quiet moves and castling, leaving captures and promotions for quiescence search."""
         tempEnpassantPossible = self.enpassantPossible
         tempCastleRights = CastleRights(self.currentCastleRights.wks, self.currentCastleRights.bks,
                                         self.currentCastleRights.wqs, self.currentCastleRights.bqs)
-        """Gets all moves considering checks"""
         moves = []
-        self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        if self.checkCache is not None and self.checkCache[0] == self.zobristKey:  # Found by isInCheck
+            self.inCheck, self.pins, self.checks = self.checkCache[1]
+        else:
+            self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
+        self.checkCache = None  # The generators use up the pins list
 
         # Updates king locations
         if self.whiteToMove:
@@ -164,7 +320,7 @@ class GameState(MoveGenerator):
 
         if self.inCheck:
             if len(self.checks) == 1:  # Only 1 check: block check or move king
-                moves = self.getAllPossibleMoves()
+                moves = self.getAllPossibleMoves(capturesOnly)
                 check = self.checks[0]
                 check_row, check_column = check[0], check[1]
                 piece_checking = self.board[check_row][check_column]  # Enemy piece causing check
@@ -177,47 +333,32 @@ class GameState(MoveGenerator):
                         valid_squares.append(valid_square)
                         if valid_square[0] == check_row and valid_square[1] == check_column:
                             break
+                board = self.board
                 for i in range(len(moves) - 1, -1, -1):  # Gets rid of move not blocking, checking, or moving king
-                    if moves[i].pieceMoved[1] != 'K':
-                        if not (moves[i].endRow, moves[i].endCol) in valid_squares:
-                            moves.remove(moves[i])
+                    start, end = moves[i] & 63, (moves[i] >> 6) & 63
+                    if board[start >> 3][start & 7][1] != 'K':
+                        # En passant takes a checking pawn from beside the square it lands on
+                        captured = (start >> 3, end & 7) if moves[i] & ENPASSANT else (end >> 3, end & 7)
+                        if not (end >> 3, end & 7) in valid_squares and captured != (check_row, check_column):
+                            del moves[i]
             else:  # Double check, king must move
-                self.getKingMoves(king_row, king_column, moves, self.board, self.whiteToMove)
+                self.getKingMoves(king_row, king_column, moves, self.board, self.whiteToMove, capturesOnly)
         else:  # Not in check
-            moves = self.getAllPossibleMoves()
+            moves = self.getAllPossibleMoves(capturesOnly)
 
-        if len(moves) == 0:  # Either checkmate or stalemate
-            if self.inCheck:
-                self.checkmate = True
+        if not capturesOnly:
+            if self.whiteToMove:
+                self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves, self.board,
+                                    self.whiteToMove)
             else:
-                self.stalemate = True
-        else:
-            self.checkmate, self.stalemate = False, False
-            
-        if self.whiteToMove:
-            self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves, self.board, self.whiteToMove)
-        else:
-            self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves, self.board, self.whiteToMove)
-        
-        self.enpassantPossible = tempEnpassantPossible
-        self.currentCastleRights = tempCastleRights 
-
-        # Check for fifty-move rule
-        if self.fiftyMoveCounter >= 50:
-            self.stalemate = True
-
-        # Check for threefold repetition
-        board_tuple = tuple(tuple(row) for row in self.board)
-        if self.positionLog.get(board_tuple, 0) >= 3:
-            self.stalemate = True
-
-        # Check for insufficient material
-        if self.insufficientMaterial():
-            self.stalemate = True
+                self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves, self.board,
+                                    self.whiteToMove)
 
+        self.enpassantPossible = tempEnpassantPossible
+        self.currentCastleRights = tempCastleRights
         return moves
 
-    def getAllPossibleMoves(self):
+    def getAllPossibleMoves(self, capturesOnly=False):
         """Gets all moves without considering checks"""
         moves = []
         for row in range(len(self.board)):  # Number of rows
@@ -225,7 +366,7 @@ class GameState(MoveGenerator):
                 turn = self.board[row][column][0]
                 if (turn == 'w' and self.whiteToMove) or (turn == 'b' and not self.whiteToMove):
                     piece = self.board[row][column][1]
-                    self.moveFunctions[piece](row, column, moves, self.board, self.whiteToMove)  # Calls move function based on piece type
+                    self.moveFunctions[piece](row, column, moves, self.board, self.whiteToMove, capturesOnly)  # Calls move function based on piece type
         return moves
     
     def checkForPinsAndChecks(self):
@@ -243,60 +384,102 @@ class GameState(MoveGenerator):
             ally = 'b'
             startRow, startCol = self.blackKingLocation
 
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            d = directions[j]
+        for d, ray in queenRays[startRow][startCol]:
+            orthogonal = d[0] == 0 or d[1] == 0
             possiblePin = ()  # Resets possible pins
-            for i in range(1, len(self.board)):
-                endRow = startRow + d[0] * i
-                endCol = startCol + d[1] * i
-                if 0 <= endRow < len(self.board) and 0 <= endCol < len(self.board):
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == ally and endPiece[1] != 'K':
-                        if possiblePin == ():  # 1st ally piece can be pinned
-                            possiblePin = (endRow, endCol, d[0], d[1])
-                        else:  # 2nd ally piece, so no pin or check possible
+            for i, (endRow, endCol) in enumerate(ray, 1):
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == ally and endPiece[1] != 'K':
+                    if possiblePin == ():  # 1st ally piece can be pinned
+                        possiblePin = (endRow, endCol, d[0], d[1])
+                    else:  # 2nd ally piece, so no pin or check possible
+                        break
+                elif endPiece[0] == opponent:
+                    pieceType = endPiece[1]
+                    # A pawn only checks from the diagonal square in front of the king
+                    if (orthogonal and pieceType == 'R') or (not orthogonal and pieceType == 'B') or \
+                            (i == 1 and pieceType == 'p' and not orthogonal and
+                             d[0] == (1 if opponent == 'w' else -1)) or \
+                            (pieceType == 'Q') or (i == 1 and pieceType == 'K'):
+                        if possiblePin == ():  # no piece blocking, so check
+                            inCheck = True
+                            checks.append((endRow, endCol, d[0], d[1]))
                             break
-                    elif endPiece[0] == opponent:
-                        pieceType = endPiece[1]
-                        if (0 <= j <= 3 and pieceType == 'R') or (4 <= j <= 7 and pieceType == 'B') or \
-                                (i == 1 and pieceType == 'p' and ((opponent == 'w' and 6 <= j <= 7)
-                                                                   or (opponent == 'b' and 4 <= j <= 5))) or \
-                                (pieceType == 'Q') or (i == 1 and pieceType == 'K'):
-                            if possiblePin == ():  # no piece blocking, so check
-                                inCheck = True
-                                checks.append((endRow, endCol, d[0], d[1]))
-                                break
-                            else:  # Piece blocking, so pin
-                                pins.append(possiblePin)
-                                break
-                        else:  # Enemy piece but not applying check
+                        else:  # Piece blocking, so pin
+                            pins.append(possiblePin)
                             break
-                else:  # Off board
-                    break
+                    else:  # Enemy piece but not applying check
+                        break
 
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-        for move in knightMoves:
-            endRow = startRow + move[0]
-            endCol = startCol + move[1]
-            if 0 <= endRow < len(self.board) and 0 <= endCol < len(self.board):
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] == opponent and endPiece[1] == 'N':
-                    inCheck = True
-                    checks.append((endRow, endCol, move[0], move[1]))
+        for endRow, endCol, move in knightJumps[startRow][startCol]:
+            endPiece = self.board[endRow][endCol]
+            if endPiece[0] == opponent and endPiece[1] == 'N':
+                inCheck = True
+                checks.append((endRow, endCol, move[0], move[1]))
 
         return inCheck, pins, checks
     
     def squareUnderAttack(self, row, col):
         """Determine if a square is under attack by any of the opponent's pieces"""
-        self.whiteToMove = not self.whiteToMove  # Switch to opponent's turn
-        opponent_moves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove  # Switch turns back
-        for move in opponent_moves:
-            if move.endRow == row and move.endCol == col:
+        return self.attackedBy(row, col, 'b' if self.whiteToMove else 'w')
+
+    def attackedBy(self, row, col, attacker):
+        """Looks outwards from (row, col) for knights, kings, pawns and sliders of the attacking color"""
+        board = self.board
+        knight, king, pawn = attacker + 'N', attacker + 'K', attacker + 'p'
+        for endRow, endCol, _ in knightJumps[row][col]:
+            if board[endRow][endCol] == knight:
+                return True
+        for endRow, endCol, _ in kingSteps[row][col]:
+            if board[endRow][endCol] == king:
+                return True
+        pawnRow = row + 1 if attacker == 'w' else row - 1  # Pawns attack towards the other side
+        if 0 <= pawnRow < len(board):
+            if (col > 0 and board[pawnRow][col - 1] == pawn) or (col < 7 and board[pawnRow][col + 1] == pawn):
                 return True
+        for d, ray in queenRays[row][col]:
+            slider = 'R' if d[0] == 0 or d[1] == 0 else 'B'
+            for endRow, endCol in ray:
+                piece = board[endRow][endCol]
+                if piece != "--":
+                    if piece[0] == attacker and (piece[1] == slider or piece[1] == 'Q'):
+                        return True
+                    break
         return False
 
+    def getAttackMap(self, attacker):
+        """Set of squares attacked by attacker ('w' or 'b'), built once per position"""
+        cached = self.attackMaps.get(attacker)
+        if cached is not None and cached[0] == self.zobristKey:
+            return cached[1]
+        board = self.board
+        attacked = set()
+        for r in range(len(board)):
+            for c in range(len(board[r])):
+                piece = board[r][c]
+                if piece[0] != attacker:
+                    continue
+                pieceType = piece[1]
+                if pieceType == 'p':
+                    endRow = r - 1 if attacker == 'w' else r + 1
+                    if 0 <= endRow < len(board):
+                        if c > 0:
+                            attacked.add((endRow, c - 1))
+                        if c < 7:
+                            attacked.add((endRow, c + 1))
+                elif pieceType == 'N' or pieceType == 'K':
+                    for endRow, endCol, _ in (knightJumps if pieceType == 'N' else kingSteps)[r][c]:
+                        attacked.add((endRow, endCol))
+                else:
+                    rays = rookRays if pieceType == 'R' else bishopRays if pieceType == 'B' else queenRays
+                    for d, ray in rays[r][c]:
+                        for square in ray:
+                            attacked.add(square)
+                            if board[square[0]][square[1]] != "--":
+                                break
+        self.attackMaps[attacker] = (self.zobristKey, attacked)
+        return attacked
+
     def insufficientMaterial(self):
         """Check for insufficient material to checkmate"""
         pieces = [piece for row in self.board for piece in row if piece != "--"]
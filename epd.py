@@ -0,0 +1,159 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import shlex
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import computer
+from fen import loadFen
+from pgn import codeToSan, sanToCode
+
+WORKERS = os.cpu_count() or 1
+DEFAULT_SECONDS = 1.0  # Search time per position when neither --time, --nodes nor --depth is given
+FIELDS = ["id", "fen", "bm", "am", "move", "solved", "depth", "seconds", "nodes", "nps", "solvedSeconds",
+          "solvedNodes", "solvedDepth", "error"]
+MOVE_MASK = 0x7FFF  # Squares and promotion piece of a packed move, without the flags
+
+
+def parseEpd(line):
+    """(FEN, operations) of an EPD line: the four position fields, then opcodes with their operands
+    such as bm Nf3 Qd4; id "WAC.001";. hmvc and fmvn fill in the FEN clocks."""
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError(f"Invalid EPD: {line!r}")
+    operations = {}
+    for operation in _splitOperations(fields[4] if len(fields) > 4 else ""):
+        words = shlex.split(operation)
+        if words:
+            operations[words[0]] = words[1:]
+    fen = " ".join(fields[:4] + [operations.get("hmvc", ["0"])[0], operations.get("fmvn", ["1"])[0]])
+    return fen, operations
+
+
+def _splitOperations(text):
+    """Operations of an EPD line, split at the semicolons outside quoted strings"""
+    operations, current, quoted = [], "", False
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        if char == ";" and not quoted:
+            operations.append(current.strip())
+            current = ""
+        else:
+            current += char
+    if current.strip():
+        operations.append(current.strip())
+    return operations
+
+
+def readEpd(path):
+    """(FEN, operations) of every position in an EPD file"""
+    with open(path) as file:
+        return [parseEpd(line) for line in file if line.strip() and not line.startswith("#")]
+
+
+def solve(engine, fen, operations, depth, seconds, nodes, seed=0):
+    """Searches one position and returns its result row (see FIELDS). The solution time is when the search
+    first settled on a move that is one of the bm moves and none of the am moves, and kept it to the end."""
+    random.seed(seed)
+    computer.newGame()  # Every position starts from empty tables, so runs are repeatable
+    row = dict.fromkeys(FIELDS)
+    row.update(id=" ".join(operations.get("id", [])), fen=fen, bm=" ".join(operations.get("bm", [])),
+               am=" ".join(operations.get("am", [])), move="", solved=False)
+    try:
+        gs = loadFen(engine(), fen)
+        best = {sanToCode(gs, san) & MOVE_MASK for san in operations.get("bm", [])}
+        avoid = {sanToCode(gs, san) & MOVE_MASK for san in operations.get("am", [])}
+    except (ValueError, KeyError) as error:  # Reported in the row rather than stopping the suite
+        row["error"] = str(error)
+        return row
+
+    def isSolution(code):
+        return code is not None and (not best or code & MOVE_MASK in best) and code & MOVE_MASK not in avoid
+
+    solvedAt = []  # (seconds, nodes, depth) of the iteration that found the final solution, if any
+
+    def onIteration(info):
+        code = info["pv"][0] if info["pv"] else None
+        if not isSolution(code):
+            solvedAt.clear()
+        elif not solvedAt:
+            solvedAt.append((info["seconds"], info["nodes"], info["depth"]))
+
+    start = time.perf_counter()
+    validMoves = gs.getValidMoves()
+    move = computer.findBestMoveIterative(gs, validMoves, depth, seconds, seconds, None, nodes, onIteration)
+    elapsed = time.perf_counter() - start
+    info = computer.searchInfo
+    code = info["pv"][0] if info.get("pv") else (move.pack() if move is not None else None)
+    if info.get("tablebase") or not info["depth"]:  # Answered without iterations
+        solvedAt[:] = [(elapsed, 0, 0)] if isSolution(code) else []
+    solved = isSolution(code) and bool(solvedAt)
+    searched = computer.nodes
+    row.update(move=codeToSan(gs, code) if code is not None else "", solved=solved, depth=info["depth"],
+               seconds=round(elapsed, 4), nodes=searched, nps=int(searched / elapsed) if elapsed > 0 else 0)
+    if solved:
+        row.update(solvedSeconds=round(solvedAt[0][0], 4), solvedNodes=solvedAt[0][1], solvedDepth=solvedAt[0][2])
+    return row
+
+
+def runSuite(positions, engine=None, depth=computer.MAX_DEPTH, seconds=None, nodes=None, workers=WORKERS):
+    """Result rows of every (FEN, operations) position, in order, searched over a pool of processes"""
+    if engine is None:
+        from bitboard import BitboardGameState
+        engine = BitboardGameState
+    if seconds is None and nodes is None and depth == computer.MAX_DEPTH:
+        seconds = DEFAULT_SECONDS
+    context = multiprocessing.get_context("spawn")  # Like parallel.py, safe next to the pygame threads
+    with ProcessPoolExecutor(workers, mp_context=context) as pool:
+        futures = [pool.submit(solve, engine, fen, operations, depth, seconds, nodes, index)
+                   for index, (fen, operations) in enumerate(positions)]
+        return [future.result() for future in futures]
+
+
+def writeResults(rows, file, outputFormat="csv"):
+    if outputFormat == "json":
+        json.dump(rows, file, indent=1)
+        file.write("\n")
+        return
+    writer = csv.DictWriter(file, FIELDS, lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def main(argv=None):
+    from perft import ENGINES
+    parser = argparse.ArgumentParser(description="Run EPD test suites (bm/am opcodes) over a process pool")
+    parser.add_argument("epd", nargs="+", help="EPD files")
+    parser.add_argument("--time", type=float, help="seconds per position (default %s unless --nodes or --depth "
+                                                   "is given)" % DEFAULT_SECONDS)
+    parser.add_argument("--nodes", type=int, help="nodes per position")
+    parser.add_argument("--depth", type=int, default=computer.MAX_DEPTH, help="maximum depth per position")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="bitboard")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--format", choices=("csv", "json"), default="csv")
+    parser.add_argument("--output", help="file for the per position results (default standard output)")
+    args = parser.parse_args(argv)
+    positions = [position for path in args.epd for position in readEpd(path)]
+    start = time.perf_counter()
+    rows = runSuite(positions, ENGINES[args.engine], args.depth, args.time, args.nodes, args.workers)
+    wall = time.perf_counter() - start
+    if args.output:
+        with open(args.output, "w", newline="") as file:
+            writeResults(rows, file, args.format)
+    else:
+        writeResults(rows, sys.stdout, args.format)
+    solved = sum(row["solved"] for row in rows)
+    nodes = sum(row["nodes"] or 0 for row in rows)
+    seconds = sum(row["seconds"] or 0 for row in rows)
+    print(f"Solved {solved}/{len(rows)} in {wall:.1f}s, {nodes} nodes, "
+          f"{nodes / seconds if seconds else 0:,.0f} nodes/sec per worker", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import zobrist
+
+# Centipawn values by piece type number (see moves.PIECE_TYPES) for the middlegame and the endgame
+MG_VALUES = (100, 320, 330, 500, 900, 0)
+EG_VALUES = (120, 290, 310, 530, 940, 0)
+# Game phase: 24 with all pieces on the board, falling to 0 with only kings and pawns
+PHASE_WEIGHTS = (0, 1, 1, 2, 4, 0)
+TOTAL_PHASE = 24
+
+# Piece-square tables from white's side, a8 first like the board rows; black uses them mirrored
+PAWN_MG = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    10, 10, 20, 30, 30, 20, 10, 10,
+    5, 5, 10, 25, 25, 10, 5, 5,
+    0, 0, 0, 20, 20, 0, 0, 0,
+    5, -5, -10, 0, 0, -10, -5, 5,
+    5, 10, 10, -20, -20, 10, 10, 5,
+    0, 0, 0, 0, 0, 0, 0, 0)
+PAWN_EG = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    80, 80, 80, 80, 80, 80, 80, 80,
+    50, 50, 50, 50, 50, 50, 50, 50,
+    30, 30, 30, 30, 30, 30, 30, 30,
+    15, 15, 15, 15, 15, 15, 15, 15,
+    5, 5, 5, 5, 5, 5, 5, 5,
+    0, 0, 0, 0, 0, 0, 0, 0,
+    0, 0, 0, 0, 0, 0, 0, 0)
+KNIGHT = (
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20, 0, 0, 0, 0, -20, -40,
+    -30, 0, 10, 15, 15, 10, 0, -30,
+    -30, 5, 15, 20, 20, 15, 5, -30,
+    -30, 0, 15, 20, 20, 15, 0, -30,
+    -30, 5, 10, 15, 15, 10, 5, -30,
+    -40, -20, 0, 5, 5, 0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50)
+BISHOP = (
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 10, 10, 5, 0, -10,
+    -10, 5, 5, 10, 10, 5, 5, -10,
+    -10, 0, 10, 10, 10, 10, 0, -10,
+    -10, 10, 10, 10, 10, 10, 10, -10,
+    -10, 5, 0, 0, 0, 0, 5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20)
+ROOK = (
+    0, 0, 0, 0, 0, 0, 0, 0,
+    5, 10, 10, 10, 10, 10, 10, 5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    -5, 0, 0, 0, 0, 0, 0, -5,
+    0, 0, 0, 5, 5, 0, 0, 0)
+QUEEN = (
+    -20, -10, -10, -5, -5, -10, -10, -20,
+    -10, 0, 0, 0, 0, 0, 0, -10,
+    -10, 0, 5, 5, 5, 5, 0, -10,
+    -5, 0, 5, 5, 5, 5, 0, -5,
+    0, 0, 5, 5, 5, 5, 0, -5,
+    -10, 5, 5, 5, 5, 5, 0, -10,
+    -10, 0, 5, 0, 0, 0, 0, -10,
+    -20, -10, -10, -5, -5, -10, -10, -20)
+KING_MG = (
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+    20, 20, 0, 0, 0, 0, 20, 20,
+    20, 30, 10, 0, 0, 10, 30, 20)
+KING_EG = (
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10, 0, 0, -10, -20, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 30, 40, 40, 30, -10, -30,
+    -30, -10, 20, 30, 30, 20, -10, -30,
+    -30, -30, 0, 0, 0, 0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50)
+MG_PST = (PAWN_MG, KNIGHT, BISHOP, ROOK, QUEEN, KING_MG)
+EG_PST = (PAWN_EG, KNIGHT, BISHOP, ROOK, QUEEN, KING_EG)
+
+
+def _pieceTables(values, tables):
+    """[piece][square] value plus square bonus, positive for white pieces and negative for black, with
+    pieces numbered as in zobrist.PIECES and squares as row * 8 + col"""
+    white = [[values[t] + tables[t][sq] for sq in range(64)] for t in range(6)]
+    black = [[-(values[t] + tables[t][sq ^ 56]) for sq in range(64)] for t in range(6)]
+    return white + black
+
+
+MG_TABLE = _pieceTables(MG_VALUES, MG_PST)
+EG_TABLE = _pieceTables(EG_VALUES, EG_PST)
+PHASE = PHASE_WEIGHTS * 2  # By piece number
+
+
+def computeTotals(board):
+    """(middlegame score, endgame score, phase) of an 8x8 board of piece strings, from white's side.
+    The engines keep these up to date in makeMove and undoMove after setting up a position.
+    """
+    mg = eg = phase = 0
+    for row in range(8):
+        for col in range(8):
+            if board[row][col] != "--":
+                piece = zobrist.pieceIndex[board[row][col]]
+                mg += MG_TABLE[piece][row * 8 + col]
+                eg += EG_TABLE[piece][row * 8 + col]
+                phase += PHASE[piece]
+    return mg, eg, phase
+
+
+def taper(mg, eg, phase):
+    """Blends the middlegame and endgame scores by how much material is left"""
+    phase = min(phase, TOTAL_PHASE)  # Early promotions can push it past the starting total
+    total = mg * phase + eg * (TOTAL_PHASE - phase)
+    return total // TOTAL_PHASE if total >= 0 else -(-total // TOTAL_PHASE)  # Rounds the same way for both sides
@@ -0,0 +1,154 @@
+from moves import Move, CastleRights
+import evaluation
+import zobrist
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+PLACEMENT_CACHE_SIZE = 4096  # Distinct piece placements kept parsed; the cache is emptied when it fills up
+_FEN_PIECES = {char: ('w' if char.isupper() else 'b') + ('p' if char in 'pP' else char.upper())
+               for char in "PNBRQKpnbrqk"}
+_placements = {}
+
+
+class Placement:
+    """Everything the engines derive from where the pieces stand, worked out in one pass over the board:
+    the 8x8 board, the square list and bitboards of the bitboard engine, the king squares, the Zobrist
+    key of the pieces and the evaluation totals. Setting up a position copies these instead of
+    scanning the board again. A board without exactly one king per side raises ValueError, since neither
+    engine can generate moves for it.
+    """
+
+    def __init__(self, board):
+        self.board = tuple(tuple(row) for row in board)
+        squares = [-1] * 64
+        bitboards = [0] * len(zobrist.PIECES)
+        key = mg = eg = phase = kings = 0
+        self.whiteKing = self.blackKing = None
+        for r, row in enumerate(self.board):
+            for c, name in enumerate(row):
+                if name == "--":
+                    continue
+                piece, sq = zobrist.pieceIndex[name], r * 8 + c
+                squares[sq] = piece
+                bitboards[piece] |= 1 << sq
+                key ^= zobrist.pieceKeys[piece][sq]
+                mg += evaluation.MG_TABLE[piece][sq]
+                eg += evaluation.EG_TABLE[piece][sq]
+                phase += evaluation.PHASE[piece]
+                if name == "wK":
+                    self.whiteKing = (r, c)
+                    kings += 1
+                elif name == "bK":
+                    self.blackKing = (r, c)
+                    kings += 1
+        if kings != 2 or self.whiteKing is None or self.blackKing is None:
+            raise ValueError("Invalid position: each side needs exactly one king")
+        self.squares, self.bitboards = tuple(squares), tuple(bitboards)
+        self.pieceKey, self.totals = key, (mg, eg, phase)
+
+    def zobristKey(self, whiteToMove, castleRights, enpassantPossible):
+        """Full Zobrist key, equal to zobrist.computeKey of the position"""
+        key = self.pieceKey ^ zobrist.castleKeys[zobrist.castleIndex(castleRights)]
+        if enpassantPossible:
+            key ^= zobrist.enpassantKeys[enpassantPossible[1]]
+        return key if whiteToMove else key ^ zobrist.sideKey
+
+
+def parsePlacement(field):
+    """Placement of the first field of a FEN, parsed once and then served from a cache, so positions
+    that share their pieces (a test suite searched again, a worker sent the same position) cost a lookup"""
+    placement = _placements.get(field)
+    if placement is not None:
+        return placement
+    board = []
+    for rank in field.split('/'):
+        row = []
+        for char in rank:
+            if char.isdigit():
+                row.extend(["--"] * int(char))
+            elif char in _FEN_PIECES:
+                row.append(_FEN_PIECES[char])
+            else:
+                raise ValueError(f"Invalid FEN piece {char!r}")
+        if len(row) != 8:
+            raise ValueError(f"Invalid FEN rank {rank!r}")
+        board.append(row)
+    if len(board) != 8:
+        raise ValueError(f"Invalid FEN board: {field!r}")
+    if len(_placements) >= PLACEMENT_CACHE_SIZE:
+        _placements.clear()
+    placement = _placements[field] = Placement(board)
+    return placement
+
+
+def parseFields(fen):
+    """Splits a FEN string into (Placement, whiteToMove, castleRights, enpassantPossible, halfmoveClock,
+    fullmoveNumber)"""
+    fields = fen.split()
+    if len(fields) < 4:
+        raise ValueError(f"Invalid FEN: {fen!r}")
+    placement = parsePlacement(fields[0])
+    if fields[1] not in ('w', 'b'):
+        raise ValueError(f"Invalid FEN side to move: {fields[1]!r}")
+    whiteToMove = fields[1] == 'w'
+    castling, board = fields[2], placement.board
+    # A castling right whose king or rook has left its home square can't be used, so it is dropped
+    whiteKing, blackKing = board[7][4] == 'wK', board[0][4] == 'bK'
+    castleRights = CastleRights('K' in castling and whiteKing and board[7][7] == 'wR',
+                                'k' in castling and blackKing and board[0][7] == 'bR',
+                                'Q' in castling and whiteKing and board[7][0] == 'wR',
+                                'q' in castling and blackKing and board[0][0] == 'bR')
+    enpassantPossible = ()
+    if fields[3] != '-':
+        if len(fields[3]) != 2 or fields[3][0] not in Move.filesToCols or fields[3][1] not in Move.ranksToRows:
+            raise ValueError(f"Invalid FEN en passant square: {fields[3]!r}")
+        enpassantPossible = (Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]])
+    halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+    fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+    return placement, whiteToMove, castleRights, enpassantPossible, halfmoveClock, fullmoveNumber
+
+
+def parseFen(fen):
+    """Splits a FEN string into (board, whiteToMove, castleRights, enpassantPossible, halfmoveClock, fullmoveNumber)"""
+    placement, *fields = parseFields(fen)
+    return [list(row) for row in placement.board], *fields
+
+
+def loadFen(gs, fen):
+    """Sets up gs (either engine) in the position described by fen and returns it. The board, king squares,
+    Zobrist key and evaluation totals come straight from the parsed placement, without replaying moves
+    or scanning the board."""
+    placement, whiteToMove, castleRights, enpassantPossible, halfmoveClock, fullmoveNumber = parseFields(fen)
+    gs.setPosition(placement.board, whiteToMove, castleRights, enpassantPossible, halfmoveClock, fullmoveNumber,
+                   placement)
+    return gs
+
+
+def toFen(gs, fullmoveNumber=None):
+    """FEN of the current position of gs (either engine); the move number is counted on from the position it
+    was set up from if not given"""
+    ranks = []
+    for row in gs.board:
+        rank, empty = "", 0
+        for square in row:
+            if square == "--":
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            char = square[1].upper() if square[1] != 'p' else 'P'
+            rank += char if square[0] == 'w' else char.lower()
+        ranks.append(rank + (str(empty) if empty else ""))
+    rights = gs.currentCastleRights
+    castling = ("K" if rights.wks else "") + ("Q" if rights.wqs else "") + \
+               ("k" if rights.bks else "") + ("q" if rights.bqs else "")
+    enpassant = "-"
+    if gs.enpassantPossible:
+        row, col = gs.enpassantPossible
+        enpassant = Move.colsToFiles[col] + Move.rowsToRanks[row]
+    if fullmoveNumber is None:
+        fullmoveNumber = 1 + (gs.startPly + len(gs.moveLog)) // 2
+    return f"{'/'.join(ranks)} {'w' if gs.whiteToMove else 'b'} {castling or '-'} {enpassant} " \
+           f"{gs.fiftyMoveCounter} {fullmoveNumber}"
@@ -1,7 +1,12 @@
+import copy
+import threading
 import time
 import pygame as p
+import book
 import computer
+import parallel
 from engine import GameState
+from bitboard import BitboardGameState
 from moves import MoveGenerator, Move
 
 WIDTH = HEIGHT = 512
@@ -9,15 +14,27 @@ SIDEBAR_WIDTH = 300
 DIMENSION = 8  # Chess board is 8x8
 SQ_SIZE = HEIGHT // DIMENSION
 MAX_FPS = 15  # For animations later on
+AI_MOVE_EVENT = p.USEREVENT + 1  # Posted by the search thread with the move it found
 IMAGES = {}
+SMALL_IMAGES = {}  # Half size pieces for the captured lists
+# Sidebar regions redrawn when what they show changes
+TURN_RECT = p.Rect(WIDTH, 0, SIDEBAR_WIDTH, 70)
+WHITE_CAPTURED_RECT = p.Rect(WIDTH, 120, SIDEBAR_WIDTH, 150)
+BLACK_CAPTURED_RECT = p.Rect(WIDTH, HEIGHT - 180, SIDEBAR_WIDTH, 180)
+WHITE_TIMER_RECT = p.Rect(WIDTH + 10, 235, SIDEBAR_WIDTH - 10, 60)
+BLACK_TIMER_RECT = p.Rect(WIDTH + 10, 450, SIDEBAR_WIDTH - 10, 60)
 depth = 2
+useBitboards = False  # Play on the bitboard engine instead of the string-board GameState
+searchWorkers = 1  # Processes the AI search is split over; more than one uses parallel.py
+BOOK_PATH = "book.bin"  # Polyglot opening book the AI plays from before searching (see book.py)
+openingBook = book.loadBook(BOOK_PATH)
 FirstName = "Computer"
 SecondName = "Computer"
 class ChessGame:
     def __init__(self):
         self.screen = None
         self.clock = None
-        self.gs = GameState()
+        self.gs = self.newGameState()
         self.validMoves = self.gs.getValidMoves()
         self.moveMade = False
         self.sqSelected = None  # tuple: (row, col)
@@ -30,11 +47,25 @@ class ChessGame:
         self.timeLeft = {"w": 900, "b": 900}  # 15 minutes (900 seconds) for each player
         self.lastUpdateTime = time.time()  # To track elapsed time
         self.timerRunning = True  # Timer state
+        self.searchThread = None  # Worker thread of the running AI search
+        self.searchStop = None  # Event that cancels it
+
+        # Dirty rectangle drawing: what each square and sidebar widget showed when last drawn, and the
+        # screen areas changed this frame. fullRedraw repaints everything after a window drew over the game.
+        self.drawnSquares = {}
+        self.drawnWidgets = []
+        self.dirtyRects = []
+        self.fullRedraw = True
+
+    @staticmethod
+    def newGameState():
+        return BitboardGameState() if useBitboards else GameState()
 
     def loadImages(self):
         pieces = ["wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"]
         for piece in pieces:
             IMAGES[piece] = p.transform.scale(p.image.load("images/" + piece + ".png"), (SQ_SIZE, SQ_SIZE))
+            SMALL_IMAGES[piece] = p.transform.scale(IMAGES[piece], (SQ_SIZE // 2, SQ_SIZE // 2))
 
     def initializeGame(self):
         p.init()
@@ -43,6 +74,7 @@ class ChessGame:
         self.clock = p.time.Clock()
         self.screen.fill(p.Color("white"))
         self.loadImages()
+        self.renderStaticLayers()
         self.playerOne, self.playerTwo = self.showStartWindow()
 
     def updateTimers(self):
@@ -60,24 +92,13 @@ class ChessGame:
 
 
 
-    def drawTimers(self):
-        # Fonts for the timers
-        font = p.font.SysFont("Helvetica", 28, True, False)
-        timerFont = p.font.SysFont("Helvetica", 24, True, False)
-
-        # White Timer
-        whiteTimerText = font.render("White Time:", 0, p.Color("white"))
-        self.screen.blit(whiteTimerText, (WIDTH + 10, 235))
-        whiteTime = self.formatTime(self.timeLeft["w"])
-        whiteTimerValue = timerFont.render(whiteTime, 0, p.Color("white"))
-        self.screen.blit(whiteTimerValue, (WIDTH + 10, 265))
-
-        # Black Timer
-        blackTimerText = font.render("Black Time:", 0, p.Color("black"))
-        self.screen.blit(blackTimerText, (WIDTH + 10, 450))
-        blackTime = self.formatTime(self.timeLeft["b"])
-        blackTimerValue = timerFont.render(blackTime, 0, p.Color("black"))
-        self.screen.blit(blackTimerValue, (WIDTH + 10, 480))
+    def drawTimer(self, color):
+        titleColor = p.Color("white" if color == "w" else "black")
+        rect = WHITE_TIMER_RECT if color == "w" else BLACK_TIMER_RECT
+        title = self.fonts["title"].render("White Time:" if color == "w" else "Black Time:", 0, titleColor)
+        self.screen.blit(title, rect.topleft)
+        value = self.fonts["timer"].render(self.formatTime(self.timeLeft[color]), 0, titleColor)
+        self.screen.blit(value, rect.move(0, 30).topleft)
 
     @staticmethod
     def formatTime(seconds):
@@ -91,14 +112,18 @@ class ChessGame:
             humanTurn = (self.gs.whiteToMove and self.playerOne) or (not self.gs.whiteToMove and self.playerTwo)
             for e in p.event.get():
                 if e.type == p.QUIT:
+                    self.cancelAISearch()
                     running = False
                 elif e.type == p.MOUSEBUTTONDOWN:
                     if humanTurn:
                         self.handleMouseClick(e)
                 elif e.type == p.KEYDOWN:
                     self.handleKeyPress(e)
+                elif e.type == AI_MOVE_EVENT:
+                    if e.stop is self.searchStop:  # Ignore results of cancelled searches
+                        self.makeAIMove(e.move)
 
-            if not humanTurn:
+            if not humanTurn and running and not self.moveMade:
                 self.handleAIMove()
 
             # Update timers only during active gameplay
@@ -119,7 +144,7 @@ class ChessGame:
                 running = False
 
             self.clock.tick(MAX_FPS)
-            p.display.flip()
+            self.updateDisplay()
 
     def handleMouseClick(self, event):
         location = p.mouse.get_pos()  # location of the mouse (x, y)
@@ -140,6 +165,7 @@ class ChessGame:
                     if move == self.validMoves[i]:
                         if move.isPawnPromotion:
                             choice = self.showPromotionChoices(self.gs.whiteToMove)
+                            self.fullRedraw = True  # The choices were drawn over the sidebar
                             self.gs.makeMove(self.validMoves[i], choice)
                         else:
                             self.gs.makeMove(self.validMoves[i])
@@ -160,6 +186,7 @@ class ChessGame:
 
     def handleKeyPress(self, event):
         if event.key == p.K_z:
+            self.cancelAISearch()
             self.gs.undoMove()
             self.moveMade = True
             self.animate = False
@@ -167,12 +194,43 @@ class ChessGame:
             self.resetGame()
 
     def handleAIMove(self):
-        self.lastUpdateTime = time.time()
-        AIMove = computer.findBestMoveAlphaBeta(self.gs, self.validMoves , depth)
+        """Starts the search in a worker thread on a copy of the game, so the window keeps drawing and
+        the clock keeps running while it thinks. The move comes back as an AI_MOVE_EVENT.
+        """
+        if self.searchThread is not None:
+            return
+        if openingBook is not None:
+            bookMove = openingBook.findMove(self.gs, self.validMoves)
+            if bookMove is not None:
+                self.makeAIMove(bookMove)
+                return
+        # The search deepens until its share of the remaining clock is used, up to the chosen level's depth
+        clock = self.timeLeft["w" if self.gs.whiteToMove else "b"]
+        gs, validMoves, stop = copy.deepcopy(self.gs), self.validMoves, threading.Event()
+
+        def search():
+            if searchWorkers > 1:
+                move = parallel.findBestMoveTimed(gs, validMoves, clock, maxDepth=depth, stop=stop,
+                                                  workers=searchWorkers)
+            else:
+                move = computer.findBestMoveTimed(gs, validMoves, clock, maxDepth=depth, stop=stop)
+            p.event.post(p.event.Event(AI_MOVE_EVENT, move=move, stop=stop))
+
+        self.searchStop = stop
+        self.searchThread = threading.Thread(target=search, daemon=True)
+        self.searchThread.start()
+
+    def cancelAISearch(self):
+        """Stops the running search and waits for it, so two searches never share the engine's tables"""
+        if self.searchThread is not None:
+            self.searchStop.set()
+            self.searchThread.join()
+            self.searchThread, self.searchStop = None, None
+
+    def makeAIMove(self, AIMove):
+        self.searchThread, self.searchStop = None, None
         if AIMove is None:
             AIMove = computer.findRandomMove(self.validMoves)
-        if self.timerRunning:
-            self.updateTimers()
         self.gs.makeMove(AIMove)
         self.moveMade = True
         if AIMove.pieceCaptured != "--":
@@ -230,74 +288,125 @@ class ChessGame:
 
         return text
     def resetGame(self):
-        self.gs = GameState()
+        self.cancelAISearch()
+        self.gs = self.newGameState()
+        computer.newGame()
+        parallel.newGame()
         self.validMoves = self.gs.getValidMoves()
         self.sqSelected = None
         self.playerClicks = []
         self.selectedPieceMoves = []
         self.capturedPieces = {"w": [], "b": []}
         self.moveMade = False
-    # highlight moves
-    def highlightSquares(self):
-        if self.sqSelected != None:
-            r, c = self.sqSelected
-            if self.gs.board[r][c][0] == ('w' if self.gs.whiteToMove else 'b'):
-                s = p.Surface((SQ_SIZE, SQ_SIZE))
-                s.set_alpha(150)
-                s.fill(p.Color('blue'))
-                self.screen.blit(s, (c * SQ_SIZE, r * SQ_SIZE))
-                s.fill(p.Color('yellow'))
-                for move in self.validMoves:
-                    if move.startRow == r and move.startCol == c:
-                    #     if (move.endRow+move.endCol)%2 == 0:
-                    #         s.fill(p.Color('blue'))
-                    #     else:
-                    #         s.fill(p.Color('lightblue'))
-                        self.screen.blit(s, (move.endCol * SQ_SIZE, move.endRow * SQ_SIZE))
-
-    def drawGameState(self):
-        self.drawBoard()
-        self.highlightSquares()
-        self.drawPieces()
-        self.drawSidebar()
-        self.drawTimers()
-
-    def drawBoard(self):
+        self.fullRedraw = True
+
+    def renderStaticLayers(self):
+        """Draws what never changes once: the squares, their coordinates and the sidebar panels with their
+        titles. Frames copy areas of these instead of drawing them again."""
+        self.fonts = {"title": p.font.SysFont("Helvetica", 28, True, False),
+                      "timer": p.font.SysFont("Helvetica", 24, True, False),
+                      "label": p.font.SysFont("Helvetica", 18, True, False)}
         colors = [p.Color((235,236,208)), p.Color((115,149,82))]
-        checkColor = p.Color("red")  # Color for the king in check
-        font = p.font.SysFont("Helvetica", 18, True, False)
+        self.boardSurface = p.Surface((WIDTH, HEIGHT))
+        self.labelSurface = p.Surface((WIDTH, HEIGHT), p.SRCALPHA)  # Kept apart so they show on the check color
         for r in range(DIMENSION):
             for c in range(DIMENSION):
-                color = colors[((r + c) % 2)]
-                p.draw.rect(self.screen, color, p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-                # Check Color
-                if self.gs.inCheck and ((self.gs.whiteToMove and (r, c) == self.gs.whiteKingLocation) or
-                                        (not self.gs.whiteToMove and (r, c) == self.gs.blackKingLocation)):
-                    color = checkColor
-                # Check Sound
-                if self.gs.inCheck and not hasattr(self.gs, 'checkSoundPlayed'):
-                    p.mixer.Sound('sounds/move-check.mp3').play()
-                    self.gs.checkSoundPlayed = True
-                elif not self.gs.inCheck:
-                    if hasattr(self.gs, 'checkSoundPlayed'):
-                        del self.gs.checkSoundPlayed
-                # Checkmate Sound
-                if self.gs.checkmate and not hasattr(self.gs, 'checkmateSoundPlayed'):
-                    p.mixer.Sound('sounds/chess_com_checkmate.mp3').play()
-                    self.gs.checkmateSoundPlayed = True
-                elif not self.gs.checkmate:
-                    if hasattr(self.gs, 'checkmateSoundPlayed'):
-                        del self.gs.checkmateSoundPlayed
-                p.draw.rect(self.screen, color, p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+                p.draw.rect(self.boardSurface, colors[(r + c) % 2], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
                 # Draw file and rank labels
-                color= (115,149,82) if (r+c)%2 == 0 else (235,236,208)
+                color = (115,149,82) if (r+c)%2 == 0 else (235,236,208)
                 if r == DIMENSION - 1:  # Draw file labels (a-h) at the bottom
-                    file_label = font.render(chr(c + ord('a')), True, p.Color(color))
-                    self.screen.blit(file_label, (c * SQ_SIZE +54, HEIGHT - 20))
+                    file_label = self.fonts["label"].render(chr(c + ord('a')), True, p.Color(color))
+                    self.labelSurface.blit(file_label, (c * SQ_SIZE +54, HEIGHT - 20))
                 if c == 0:  # Draw rank labels (1-8) on the left
-                    rank_label = font.render(str(DIMENSION - r), True, p.Color(color))
-                    self.screen.blit(rank_label, (5, r * SQ_SIZE + 5))
+                    rank_label = self.fonts["label"].render(str(DIMENSION - r), True, p.Color(color))
+                    self.labelSurface.blit(rank_label, (5, r * SQ_SIZE + 5))
+        self.highlights = {}
+        for name, color in (("selected", "blue"), ("target", "yellow")):
+            s = p.Surface((SQ_SIZE, SQ_SIZE))
+            s.set_alpha(150)
+            s.fill(p.Color(color))
+            self.highlights[name] = s
+
+        # Sidebar panels, in coordinates of the sidebar surface
+        self.sidebarSurface = p.Surface((SIDEBAR_WIDTH, HEIGHT))
+        self.sidebarSurface.fill(p.Color("lightgray"))
+        p.draw.rect(self.sidebarSurface, p.Color("Black"), p.Rect(0, 72, SIDEBAR_WIDTH, 220))
+        p.draw.rect(self.sidebarSurface, p.Color("white"), p.Rect(0, 72+220, SIDEBAR_WIDTH, 220))
+        whiteTitle = self.fonts["title"].render("White Captured Pieces", 0, p.Color("white"))
+        self.sidebarSurface.blit(whiteTitle, (10, 80))
+        blackTitle = self.fonts["title"].render("Black Captured Pieces", 0, p.Color("black"))
+        self.sidebarSurface.blit(blackTitle, (10, HEIGHT - 220))
+        # Add separators between sections for clarity
+        p.draw.line(self.sidebarSurface, p.Color("black"), (0, 70), (SIDEBAR_WIDTH, 70), 2)  # Top divider
+        p.draw.line(self.sidebarSurface, p.Color("black"), (0, HEIGHT - 250), (SIDEBAR_WIDTH, HEIGHT - 250), 2)
+
+    def squareStates(self):
+        """(piece, in check, selected, move target) of every square, the things that decide how it looks"""
+        board = self.gs.board
+        selected, targets = None, set()
+        if self.sqSelected is not None:
+            r, c = self.sqSelected
+            if board[r][c][0] == ('w' if self.gs.whiteToMove else 'b'):
+                selected = self.sqSelected
+                targets = {(move.endRow, move.endCol) for move in self.validMoves
+                           if move.startRow == r and move.startCol == c}
+        check = None
+        if self.gs.inCheck:
+            check = self.gs.whiteKingLocation if self.gs.whiteToMove else self.gs.blackKingLocation
+        return {(r, c): (board[r][c], (r, c) == check, (r, c) == selected, (r, c) in targets)
+                for r in range(DIMENSION) for c in range(DIMENSION)}
+
+    def drawSquare(self, r, c, state):
+        piece, inCheck, selected, target = state
+        rect = p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        self.screen.blit(self.boardSurface, rect, rect)
+        if inCheck:
+            p.draw.rect(self.screen, p.Color("red"), rect)  # Color for the king in check
+        self.screen.blit(self.labelSurface, rect, rect)
+        if selected:
+            self.screen.blit(self.highlights["selected"], rect)
+        elif target:
+            self.screen.blit(self.highlights["target"], rect)
+        if piece != "--":
+            self.screen.blit(IMAGES[piece], rect)
+        self.dirtyRects.append(rect)
+
+    def drawGameState(self):
+        """Draws only the squares and sidebar widgets that changed since the last frame"""
+        self.playCheckSounds()
+        if self.fullRedraw:
+            self.screen.blit(self.boardSurface, (0, 0))
+            self.screen.blit(self.sidebarSurface, (WIDTH, 0))
+            self.drawnSquares, self.drawnWidgets = {}, []
+            self.dirtyRects.append(p.Rect(0, 0, WIDTH + SIDEBAR_WIDTH, HEIGHT))
+            self.fullRedraw = False
+        for square, state in self.squareStates().items():
+            if self.drawnSquares.get(square) != state:
+                self.drawSquare(*square, state)
+                self.drawnSquares[square] = state
+        self.drawSidebar()
 
+    def updateDisplay(self):
+        """Pushes the areas drawn this frame to the screen; nothing at all when nothing changed"""
+        if self.dirtyRects:
+            p.display.update(self.dirtyRects)
+            self.dirtyRects = []
+
+    def playCheckSounds(self):
+        # Check Sound
+        if self.gs.inCheck and not hasattr(self.gs, 'checkSoundPlayed'):
+            p.mixer.Sound('sounds/move-check.mp3').play()
+            self.gs.checkSoundPlayed = True
+        elif not self.gs.inCheck:
+            if hasattr(self.gs, 'checkSoundPlayed'):
+                del self.gs.checkSoundPlayed
+        # Checkmate Sound
+        if self.gs.checkmate and not hasattr(self.gs, 'checkmateSoundPlayed'):
+            p.mixer.Sound('sounds/chess_com_checkmate.mp3').play()
+            self.gs.checkmateSoundPlayed = True
+        elif not self.gs.checkmate:
+            if hasattr(self.gs, 'checkmateSoundPlayed'):
+                del self.gs.checkmateSoundPlayed
 
     def drawPieces(self):
         for r in range(DIMENSION):
@@ -306,65 +415,47 @@ class ChessGame:
                 if piece != "--":
                     self.screen.blit(IMAGES[piece], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
 
-    def drawSidebar(self):
-        # Draw the sidebar background
-        sidebarRect = p.Rect(WIDTH, 0, SIDEBAR_WIDTH, HEIGHT)
-        p.draw.rect(self.screen, p.Color("lightgray"), sidebarRect)
-
-        sidebarRect = p.Rect(WIDTH, 72, SIDEBAR_WIDTH, 220)
-        p.draw.rect(self.screen, p.Color("Black"), sidebarRect)
+    def sidebarWidgets(self):
+        """(region, state, draw function) of the parts of the sidebar that change, in drawing order"""
+        return [(TURN_RECT, (self.gs.whiteToMove, FirstName, SecondName), self.drawTurnIndicator),
+                (WHITE_CAPTURED_RECT, tuple(self.capturedPieces["w"]), lambda: self.drawCaptured("w", 120)),
+                (BLACK_CAPTURED_RECT, tuple(self.capturedPieces["b"]), lambda: self.drawCaptured("b", HEIGHT - 180)),
+                (WHITE_TIMER_RECT, self.formatTime(self.timeLeft["w"]), lambda: self.drawTimer("w")),
+                (BLACK_TIMER_RECT, self.formatTime(self.timeLeft["b"]), lambda: self.drawTimer("b"))]
 
-        sidebarRect = p.Rect(WIDTH, 72+220, SIDEBAR_WIDTH, 220)
-        p.draw.rect(self.screen, p.Color("white"), sidebarRect)
-
-        # Set up fonts
-        titleFont = p.font.SysFont("Helvetica", 28, True, False)
-        infoFont = p.font.SysFont("Helvetica", 20, True, False)
-
-        # Draw the turn indicator
+    def drawSidebar(self):
+        """Redraws the region of every widget whose state changed: the static sidebar first, then every
+        widget overlapping the region, clipped to it, so overlapping widgets keep their order"""
+        widgets = self.sidebarWidgets()
+        states = [state for _, state, _ in widgets]
+        dirty = [rect for i, (rect, state, _) in enumerate(widgets)
+                 if i >= len(self.drawnWidgets) or self.drawnWidgets[i] != state]
+        for region in dirty:
+            self.screen.set_clip(region)
+            self.screen.blit(self.sidebarSurface, region, region.move(-WIDTH, 0))
+            for rect, _, draw in widgets:
+                if rect.colliderect(region):
+                    draw()
+        self.screen.set_clip(None)
+        self.drawnWidgets = states
+        self.dirtyRects += dirty
+
+    def drawTurnIndicator(self):
         turnColor = "white" if self.gs.whiteToMove else "black"
         turnIndicatorRect = p.Rect(WIDTH + 20, 20, SIDEBAR_WIDTH - 40, 40)
         p.draw.rect(self.screen, p.Color(turnColor), turnIndicatorRect, border_radius=10)
-        if turnColor.capitalize() == "White" :
-            turnText = titleFont.render(f"{FirstName}'s turn", 1,
-                                    p.Color("black" if turnColor == "white" else "white"))
-        else :
-            turnText = titleFont.render(f"{SecondName}'s turn", 1,
-                                    p.Color("black" if turnColor == "white" else "white"))
+        name = FirstName if turnColor == "white" else SecondName
+        turnText = self.fonts["title"].render(f"{name}'s turn", 1, p.Color("black" if turnColor == "white" else "white"))
         self.screen.blit(turnText, turnIndicatorRect.move(20, 5))
 
-        # Draw White Player Info (Top Half)
-        whiteTitle = titleFont.render("White Captured Pieces", 0, p.Color("white"))
-        self.screen.blit(whiteTitle, (WIDTH + 10, 80))
-
-        # whiteCapturedTitle = infoFont.render("Captured Pieces", 0, p.Color("white"))
-        # self.screen.blit(whiteCapturedTitle, (WIDTH + 10, 110))
-
-        yOffset = 120  # Start below the title
+    def drawCaptured(self, color, yOffset):
         pieceSize = SQ_SIZE // 2  # Smaller size for captured pieces
-        for i, piece in enumerate(self.capturedPieces["w"]):
-            pieceImage = p.transform.scale(IMAGES[piece], (pieceSize, pieceSize))
-            xOffset = WIDTH + 10 + (i % 4) * (pieceSize + 5)  # Move to the right
-            self.screen.blit(pieceImage, (xOffset, yOffset + (i // 4) * (pieceSize + 5)))  # Move to next row
-
-        # Draw Black Player Info (Bottom Half)
-        blackTitle = titleFont.render("Black Captured Pieces", 0, p.Color("black"))
-        self.screen.blit(blackTitle, (WIDTH + 10, HEIGHT - 220))
-
-        # blackCapturedTitle = infoFont.render("", 0, p.Color("black"))
-        # self.screen.blit(blackCapturedTitle, (WIDTH + 10, HEIGHT - 190))
-
-        yOffset = HEIGHT - 180  # Start above the bottom of the sidebar
-        for i, piece in enumerate(self.capturedPieces["b"]):
-            pieceImage = p.transform.scale(IMAGES[piece], (pieceSize, pieceSize))
+        for i, piece in enumerate(self.capturedPieces[color]):
             xOffset = WIDTH + 10 + (i % 4) * (pieceSize + 5)  # Move to the right
-            self.screen.blit(pieceImage, (xOffset, yOffset + (i // 4) * (pieceSize + 5)))  # Move to next row
-
-        # Add separators between sections for clarity
-        p.draw.line(self.screen, p.Color("black"), (WIDTH, 70), (WIDTH + SIDEBAR_WIDTH, 70), 2)  # Top divider
-        p.draw.line(self.screen, p.Color("black"), (WIDTH, HEIGHT - 250), (WIDTH + SIDEBAR_WIDTH, HEIGHT - 250),2)  # Bottom divider
+            self.screen.blit(SMALL_IMAGES[piece], (xOffset, yOffset + (i // 4) * (pieceSize + 5)))  # Move to next row
 
     def showEndGameMessage(self, message, winner):
+        self.cancelAISearch()
         font = p.font.SysFont("Helvetica", 32, True, False)
         if winner:
             if message == "Checkmate":
@@ -595,7 +686,7 @@ class ChessGame:
                     elif blackButton.collidepoint(location):
                         return 3
                     elif redButton.collidepoint(location):
-                        return 4
+                        return computer.MAX_DEPTH  # Hard: limited only by the clock
     def showColorChoiceWindow(self):
         font = p.font.SysFont("Helvetica", 32, True, False)
 
@@ -692,7 +783,8 @@ class ChessGame:
 
         for frame in range(frameCount + 1):
             r, c = (move.startRow + dR * frame / frameCount, move.startCol + dC * frame / frameCount)
-            self.drawBoard()
+            self.screen.blit(self.boardSurface, (0, 0))
+            self.screen.blit(self.labelSurface, (0, 0))
             self.drawPieces()
             # erase the piece from ending square
             color = (move.endRow + move.endCol) % 2
@@ -703,8 +795,9 @@ class ChessGame:
                 self.screen.blit(IMAGES[move.pieceCaptured], endSquare)
             # draw moving piece
             self.screen.blit(IMAGES[move.pieceMoved], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-            p.display.flip()
+            p.display.update(p.Rect(0, 0, WIDTH, HEIGHT))
             self.clock.tick(150)
+        self.drawnSquares = {}  # The animation drew over every square
 
 if __name__ == "__main__":
     game = ChessGame()
@@ -0,0 +1,242 @@
+import argparse
+import ast
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import computer
+from fen import loadFen, STARTING_FEN
+from ordering import MoveOrderer
+from pgn import codeToSan, formatGame, sanToCode
+from transposition import TranspositionTable
+
+WORKERS = os.cpu_count() or 1
+MAX_PLIES = 400  # Games still running after this many plies are adjudicated drawn
+DEFAULT_DEPTH = 3  # Depth of an engine given neither depth nor time
+
+# Short, balanced openings in SAN; every one is played twice with the colors swapped
+OPENINGS = [
+    "e4 e5 Nf3 Nc6 Bb5",
+    "e4 e5 Nf3 Nc6 Bc4",
+    "e4 c5 Nf3 d6 d4",
+    "e4 e6 d4 d5 Nc3",
+    "e4 c6 d4 d5 e5",
+    "d4 d5 c4 e6 Nc3",
+    "d4 Nf6 c4 g6 Nc3",
+    "d4 Nf6 c4 e6 Nf3",
+    "c4 e5 Nc3 Nf6 g3",
+    "Nf3 d5 g3 Nf6 Bg2",
+]
+
+# Per worker process: the Player of every configuration seen, so tables are allocated once
+_players = {}
+
+
+def parseEngine(spec):
+    """(name, options) of an engine given as "name:depth=4,time=0.5,NULL_MOVE_PRUNING=False". Besides depth
+    and time (seconds per move), options set the upper case search settings of computer.py."""
+    name, _, settings = spec.partition(":")
+    options = {}
+    for setting in filter(None, settings.split(",")):
+        key, _, value = setting.partition("=")
+        key = key.strip()
+        try:
+            value = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            raise ValueError(f"Bad value for {key} in engine {spec!r}")
+        if key not in ("depth", "time") and not (key.isupper() and hasattr(computer, key)):
+            raise ValueError(f"Unknown engine option {key!r} in {spec!r}")
+        options[key] = value
+    return name or spec, options
+
+
+class Player:
+    """One engine configuration in a worker process: its own transposition table and move ordering
+    tables, and the computer.py settings it overrides, swapped in around each of its searches."""
+
+    def __init__(self, name, options):
+        self.name = name
+        self.time = options.get("time")
+        self.depth = options.get("depth", computer.MAX_DEPTH if self.time else DEFAULT_DEPTH)
+        self.settings = {key: value for key, value in options.items() if key not in ("depth", "time")}
+        self.table = TranspositionTable(self.settings.get("HASH_SIZE_MB", computer.HASH_SIZE_MB))
+        self.orderer = MoveOrderer(self.settings.get("RANDOM_TIE_BREAK", computer.RANDOM_TIE_BREAK))
+        self.nodes, self.seconds = 0, 0.0
+
+    def newGame(self):
+        self.table.clear()
+        self.orderer.clear()
+        self.nodes, self.seconds = 0, 0.0
+
+    def findMove(self, gs, validMoves):
+        saved = {key: getattr(computer, key) for key in self.settings}
+        saved.update(transpositionTable=computer.transpositionTable, moveOrderer=computer.moveOrderer)
+        for key, value in self.settings.items():
+            setattr(computer, key, value)
+        computer.transpositionTable, computer.moveOrderer = self.table, self.orderer
+        start = time.perf_counter()
+        try:
+            softTime = self.time / 2 if self.time else None  # No new iteration past half the time
+            return computer.findBestMoveIterative(gs, validMoves, self.depth, softTime, self.time)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.nodes += computer.nodes
+            for key, value in saved.items():
+                setattr(computer, key, value)
+
+
+def _player(name, options):
+    key = (name, tuple(sorted(options.items())))
+    if key not in _players:
+        _players[key] = Player(name, options)
+    return _players[key]
+
+
+def startPosition(engine, opening):
+    """(game state, FEN it starts from, SAN moves played) of an opening: a FEN, or SAN moves from the
+    starting position"""
+    if "/" in opening:
+        return loadFen(engine(), opening), opening, []
+    gs, moves = engine(), []
+    for san in opening.split():
+        code = sanToCode(gs, san)
+        moves.append(codeToSan(gs, code))
+        gs.makePackedMove(code)
+    return gs, STARTING_FEN, moves
+
+
+def playGame(engine, white, black, opening, maxPlies=MAX_PLIES, seed=0):
+    """Plays one game between two (name, options) engines, returning (result, termination, SAN moves,
+    start FEN, {name: (nodes, seconds)})"""
+    random.seed(seed)  # Repeatable random tie breaks
+    players = (_player(*white), _player(*black))
+    for player in players:
+        player.newGame()
+    gs, startFen, moves = startPosition(engine, opening)
+    result, termination = "1/2-1/2", "adjudication"
+    while True:
+        validMoves = gs.getValidMoves()
+        if gs.checkmate:
+            result, termination = ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+            break
+        if gs.stalemate or not validMoves:
+            termination = "stalemate" if not validMoves else "draw rule"
+            break
+        if len(moves) >= maxPlies:
+            break
+        move = players[0 if gs.whiteToMove else 1].findMove(gs, validMoves)
+        moves.append(codeToSan(gs, move.pack()))
+        gs.makeMove(move)
+    stats = {player.name: (player.nodes, player.seconds) for player in players}
+    return result, termination, moves, startFen, stats
+
+
+def eloDifference(wins, draws, losses):
+    """(Elo difference, 95% error margin) from a score of wins, draws and losses; infinite when one side
+    scored everything"""
+    games = wins + draws + losses
+    if not games:
+        return 0.0, math.inf
+    score = (wins + draws / 2) / games
+    if score in (0, 1):
+        return (math.inf if score else -math.inf), math.inf
+
+    def elo(p):
+        if p <= 0:
+            return -math.inf
+        if p >= 1:
+            return math.inf
+        return -400 * math.log10(1 / p - 1) + 0.0  # No -0.0 for an even score
+
+    deviation = math.sqrt((wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games)
+    margin = 1.96 * deviation / math.sqrt(games)
+    return elo(score), (elo(score + margin) - elo(score - margin)) / 2
+
+
+def runMatch(first, second, games, openings=OPENINGS, engine=None, workers=WORKERS, maxPlies=MAX_PLIES,
+             pgnPath=None, seed=0, log=print):
+    """Plays games between two (name, options) engines over a pool of processes, alternating colors and
+    playing each opening with both. Returns (wins, draws, losses) of the first engine."""
+    if engine is None:
+        from bitboard import BitboardGameState
+        engine = BitboardGameState
+    context = multiprocessing.get_context("spawn")  # Like parallel.py, safe next to the pygame threads
+    score = [0, 0, 0]
+    nodes = {first[0]: [0, 0.0], second[0]: [0, 0.0]}
+    pgnFile = open(pgnPath, "w") if pgnPath else None
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            futures = {}
+            for index in range(games):
+                white, black = (first, second) if index % 2 == 0 else (second, first)
+                opening = openings[(index // 2) % len(openings)]
+                future = pool.submit(playGame, engine, white, black, opening, maxPlies, seed + index)
+                futures[future] = (index, white[0], black[0])
+            for future in as_completed(futures):
+                index, whiteName, blackName = futures[future]
+                result, termination, moves, startFen, stats = future.result()
+                points = {"1-0": 1.0, "0-1": 0.0}.get(result, 0.5)
+                if whiteName != first[0]:
+                    points = 1 - points
+                score[0 if points == 1 else 1 if points == 0.5 else 2] += 1
+                for name, (playerNodes, seconds) in stats.items():
+                    nodes[name][0] += playerNodes
+                    nodes[name][1] += seconds
+                log(f"Game {index + 1}: {whiteName} - {blackName} {result} ({termination}, {len(moves)} plies)  "
+                    f"+{score[0]} ={score[1]} -{score[2]}")
+                if pgnFile:
+                    tags = {"Event": f"{first[0]} vs {second[0]}", "Site": "match.py",
+                            "Date": time.strftime("%Y.%m.%d"), "Round": index + 1, "White": whiteName,
+                            "Black": blackName, "Termination": termination}
+                    if startFen != STARTING_FEN:
+                        tags.update(SetUp="1", FEN=startFen)
+                    pgnFile.write(formatGame(tags, moves, result) + "\n")
+                    pgnFile.flush()
+    finally:
+        if pgnFile:
+            pgnFile.close()
+    wins, draws, losses = score
+    elo, margin = eloDifference(wins, draws, losses)
+    log(f"{first[0]} vs {second[0]}: +{wins} ={draws} -{losses}, "
+        f"score {(wins + draws / 2) / max(1, games):.1%}, Elo {elo:+.1f} +/- {margin:.1f}")
+    for name, (playerNodes, seconds) in nodes.items():
+        log(f"{name}: {playerNodes} nodes in {seconds:.1f}s, {playerNodes / seconds if seconds else 0:,.0f} nodes/sec")
+    return wins, draws, losses
+
+
+def readOpenings(path):
+    """Openings of a text file, one per line: a FEN, or SAN moves from the starting position"""
+    with open(path) as file:
+        return [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+
+def main(argv=None):
+    from perft import ENGINES
+    parser = argparse.ArgumentParser(description="Play a match between two engine configurations")
+    parser.add_argument("first", help='engine as "name:depth=4,time=0.5,NULL_MOVE_PRUNING=False"')
+    parser.add_argument("second", help="engine to play against, in the same form")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--openings", help="file of openings, one FEN or SAN move sequence per line")
+    parser.add_argument("--pgn", help="file to write the games to")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="bitboard")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES, help="plies after which a game is drawn")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    try:
+        first, second = parseEngine(args.first), parseEngine(args.second)
+    except ValueError as error:
+        parser.error(str(error))
+    if first[0] == second[0]:
+        parser.error("give the two engines different names")
+    openings = readOpenings(args.openings) if args.openings else OPENINGS
+    runMatch(first, second, args.games, openings, ENGINES[args.engine], args.workers, args.max_plies, args.pgn,
+             args.seed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
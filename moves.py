@@ -1,6 +1,53 @@
+import copy
+
+# Packed move encoding used by the search: from square (bits 0-5), to square (6-11),
+# promotion piece type (12-14) and flags. Squares are numbered row * 8 + col.
+PROMOTION_SHIFT = 12
+CAPTURE, ENPASSANT, CASTLE, DOUBLE_PUSH = 1 << 15, 1 << 16, 1 << 17, 1 << 18
+PROMOTION_PIECES = "-NBRQ"  # Promotion piece type -> makeMove choice
+PROMOTION_CHOICES = {'N': 1, 'B': 2, 'R': 3, 'Q': 4}
+PROMOTION_ORDER = (4, 3, 2, 1)  # Every promotion is listed once per piece, queen first, by both engines
+PIECE_TYPES = {'p': 0, 'N': 1, 'B': 2, 'R': 3, 'Q': 4, 'K': 5}  # Numbering shared with the bitboard engine
+
+ROOK_DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_JUMPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))  # L-shaped moves
+KING_STEPS = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def _rays(r, c, directions):
+    """(direction, squares along it nearest first) for every direction that doesn't start off the board"""
+    rays = []
+    for d in directions:
+        squares = []
+        endRow, endCol = r + d[0], c + d[1]
+        while 0 <= endRow < 8 and 0 <= endCol < 8:
+            squares.append((endRow, endCol))
+            endRow, endCol = endRow + d[0], endCol + d[1]
+        if squares:
+            rays.append((d, tuple(squares)))
+    return tuple(rays)
+
+
+def _jumps(r, c, offsets):
+    """(endRow, endCol, offset) for every offset landing on the board"""
+    return tuple((r + dr, c + dc, (dr, dc)) for dr, dc in offsets if 0 <= r + dr < 8 and 0 <= c + dc < 8)
+
+
+# Per-square tables built once at import, so generators never bounds check or rebuild direction tuples
+rookRays = [[_rays(r, c, ROOK_DIRECTIONS) for c in range(8)] for r in range(8)]
+bishopRays = [[_rays(r, c, BISHOP_DIRECTIONS) for c in range(8)] for r in range(8)]
+queenRays = [[_rays(r, c, ROOK_DIRECTIONS + BISHOP_DIRECTIONS) for c in range(8)] for r in range(8)]
+knightJumps = [[_jumps(r, c, KNIGHT_JUMPS) for c in range(8)] for r in range(8)]
+kingSteps = [[_jumps(r, c, KING_STEPS) for c in range(8)] for r in range(8)]
+
+
 class MoveGenerator:
-    
-    def getPawnMoves(self, r, c, moves, board, whiteToMove):
+    """Pseudo-legal move generators of the string board. They append packed ints (see the encoding above)
+    rather than Move objects, which are only built for the UI and notation. With capturesOnly they skip
+    quiet moves except promotions, for quiescence search."""
+
+    def getPawnMoves(self, r, c, moves, board, whiteToMove, capturesOnly=False):
         piecePinned = False
         pinDirection = ()
         for i in range(len(self.pins) - 1, -1, -1):
@@ -9,47 +56,52 @@ class MoveGenerator:
                 pinDirection = (self.pins[i][2], self.pins[i][3])
                 self.pins.remove(self.pins[i])
                 break
-        
+
+        start, first = r * 8 + c, len(moves)
         if whiteToMove:
-            if board[r - 1][c] == "--":  # 1 square move
+            promotion = PROMOTION_CHOICES['Q'] << PROMOTION_SHIFT if r == 1 else 0  # Other pieces added below
+            if board[r - 1][c] == "--" and (promotion or not capturesOnly):  # 1 square move
                 if not piecePinned or pinDirection == (-1, 0):
-                    moves.append(Move((r, c), (r - 1, c), board))
+                    moves.append(start | (start - 8) << 6 | promotion)
                     if r == 6 and board[r-2][c] == "--":  # 2 square move
-                        moves.append(Move((r, c), (r - 2, c), board))
+                        moves.append(start | (start - 16) << 6 | DOUBLE_PUSH)
             if c - 1 >= 0:  # Capture to the left
                 if board[r - 1][c - 1][0] == "b":
                     if not piecePinned or pinDirection == (-1, -1):
-                        moves.append(Move((r, c), (r - 1, c - 1), board))
+                        moves.append(start | (start - 9) << 6 | CAPTURE | promotion)
                 elif (r - 1, c - 1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r - 1, c - 1), board, isEnpassantMove=True))
+                    moves.append(start | (start - 9) << 6 | CAPTURE | ENPASSANT)
             if c + 1 < len(board):  # Capture to the right
                 if board[r - 1][c + 1][0] == "b":
                     if not piecePinned or pinDirection == (-1, 1):
-                        moves.append(Move((r, c), (r - 1, c + 1), board))
+                        moves.append(start | (start - 7) << 6 | CAPTURE | promotion)
                 elif (r - 1, c + 1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r - 1, c + 1), board, isEnpassantMove=True))        
-                
+                    moves.append(start | (start - 7) << 6 | CAPTURE | ENPASSANT)
+
         else:
-            if board[r + 1][c] == "--":  # 1 square move
+            promotion = PROMOTION_CHOICES['Q'] << PROMOTION_SHIFT if r == 6 else 0
+            if board[r + 1][c] == "--" and (promotion or not capturesOnly):  # 1 square move
                 if not piecePinned or pinDirection == (1, 0):
-                    moves.append(Move((r, c), (r + 1, c), board))
+                    moves.append(start | (start + 8) << 6 | promotion)
                     if r == 1 and board[r+2][c] == "--":  # 2 square move
-                        moves.append(Move((r, c), (r + 2, c), board))
+                        moves.append(start | (start + 16) << 6 | DOUBLE_PUSH)
             if c - 1 >= 0:  # Capture to the left
                 if board[r + 1][c - 1][0] == "w":
                     if not piecePinned or pinDirection == (1, -1):
-                        moves.append(Move((r, c), (r + 1, c - 1), board))
+                        moves.append(start | (start + 7) << 6 | CAPTURE | promotion)
                 elif (r + 1, c - 1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r + 1, c - 1), board, isEnpassantMove=True))
+                    moves.append(start | (start + 7) << 6 | CAPTURE | ENPASSANT)
             if c + 1 < len(board):  # Capture to the right
                 if board[r + 1][c + 1][0] == "w":
                     if not piecePinned or pinDirection == (1, 1):
-                        moves.append(Move((r, c), (r + 1, c + 1), board))
+                        moves.append(start | (start + 9) << 6 | CAPTURE | promotion)
                 elif (r + 1, c + 1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r + 1, c + 1), board, isEnpassantMove=True))
-        # TODO: Add pawn promotion      
+                    moves.append(start | (start + 9) << 6 | CAPTURE | ENPASSANT)
+        if promotion:
+            moves[first:] = [code & ~(7 << PROMOTION_SHIFT) | piece << PROMOTION_SHIFT
+                             for code in moves[first:] for piece in PROMOTION_ORDER]
 
-    def getRookMoves(self, r, c, moves, board, whiteToMove):
+    def getRookMoves(self, r, c, moves, board, whiteToMove, capturesOnly=False):
         """Gets all rook moves for the rook located at (r, c) and adds moves to move log"""
         opponent = 'b' if whiteToMove else 'w'
 
@@ -63,25 +115,21 @@ class MoveGenerator:
                     self.pins.remove(self.pins[i])
                 break
 
-        directions = [(-1, 0), (0, -1), (1, 0), (0, 1)]  # Tuples indicate (row, column) movements possible
-        for d in directions:
-            for i in range(1, len(board)):
-                endRow = r + d[0] * i  # Potentially moves up/down to 7 rows
-                endCol = c + d[1] * i  # Potentially moves up/down to 7 columns
-                if 0 <= endRow < len(board) and 0 <= endCol < len(board[0]):  # Makes sure on the board
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece = board[endRow][endCol]
-                        if endPiece == '--':  # Valid move to empty space
-                            moves.append(Move((r, c), (endRow, endCol), board))
-                        elif endPiece[0] == opponent:  # Valid move to capture
-                            moves.append(Move((r, c), (endRow, endCol), board))
-                            break
-                        else:  # Cannot take friendly piece
-                            break
-                else:  # Cannot move off board
-                    break
-
-    def getKnightMoves(self, r, c, moves, board, whiteToMove):
+        start = r * 8 + c
+        for d, ray in rookRays[r][c]:
+            if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
+                for endRow, endCol in ray:
+                    endPiece = board[endRow][endCol]
+                    if endPiece == '--':  # Valid move to empty space
+                        if not capturesOnly:
+                            moves.append(start | (endRow * 8 + endCol) << 6)
+                    elif endPiece[0] == opponent:  # Valid move to capture
+                        moves.append(start | (endRow * 8 + endCol) << 6 | CAPTURE)
+                        break
+                    else:  # Cannot take friendly piece
+                        break
+
+    def getKnightMoves(self, r, c, moves, board, whiteToMove, capturesOnly=False):
         piecePinned = False
         pinDirection = ()
         for i in range(len(self.pins) - 1, -1, -1):
@@ -91,18 +139,18 @@ class MoveGenerator:
                 self.pins.remove(self.pins[i])
                 break
         
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))  # L-shaped moves
         allyColor = "w" if whiteToMove else "b"
-        for m in knightMoves:
-            endRow = r + m[0]
-            endCol = c + m[1]
-            if 0 <= endRow < len(board) and 0 <= endCol < len(board[0]):
-                if not piecePinned or pinDirection == (m[0], m[1]) or pinDirection == (-m[0], -m[1]):
-                    endPiece = board[endRow][endCol]
-                    if endPiece == "--" or endPiece[0] != allyColor:
-                        moves.append(Move((r, c), (endRow, endCol), board))
+        start = r * 8 + c
+        for endRow, endCol, m in knightJumps[r][c]:
+            if not piecePinned or pinDirection == m or pinDirection == (-m[0], -m[1]):
+                endPiece = board[endRow][endCol]
+                if endPiece == "--":
+                    if not capturesOnly:
+                        moves.append(start | (endRow * 8 + endCol) << 6)
+                elif endPiece[0] != allyColor:
+                    moves.append(start | (endRow * 8 + endCol) << 6 | CAPTURE)
         
-    def getBishopMoves(self, r, c, moves, board, whiteToMove):
+    def getBishopMoves(self, r, c, moves, board, whiteToMove, capturesOnly=False):
         """Gets all bishop moves for the bishop located at (r, c) and adds moves to move log"""
         opponent = 'b' if whiteToMove else 'w'
 
@@ -115,73 +163,71 @@ class MoveGenerator:
                 self.pins.remove(self.pins[i])
                 break
 
-        directions = [(-1, -1), (-1, 1), (1, 1), (1, -1)]  # Tuples indicate (row, column) movements possible
-        for d in directions:
-            for i in range(1, len(board)):
-                endRow = r + d[0] * i
-                endCol = c + d[1] * i
-
-                if 0 <= endRow < len(board) and 0 <= endCol < len(board[0]):  # Makes sure on the board
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece = board[endRow][endCol]
-                        if endPiece == '--':  # Valid move to empty space
-                            moves.append(Move((r, c), (endRow, endCol), board))
-                        elif endPiece[0] == opponent:  # Valid move to capture
-                            moves.append(Move((r, c), (endRow, endCol), board))
-                            break
-                        else:  # Cannot take friendly piece
-                            break
-                else:  # Cannot move off board
-                    break
+        start = r * 8 + c
+        for d, ray in bishopRays[r][c]:
+            if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
+                for endRow, endCol in ray:
+                    endPiece = board[endRow][endCol]
+                    if endPiece == '--':  # Valid move to empty space
+                        if not capturesOnly:
+                            moves.append(start | (endRow * 8 + endCol) << 6)
+                    elif endPiece[0] == opponent:  # Valid move to capture
+                        moves.append(start | (endRow * 8 + endCol) << 6 | CAPTURE)
+                        break
+                    else:  # Cannot take friendly piece
+                        break
         
-    def getQueenMoves(self, r, c, moves, board, whiteToMove):
-        self.getRookMoves(r, c, moves, board, whiteToMove)
-        self.getBishopMoves(r, c, moves, board, whiteToMove)
+    def getQueenMoves(self, r, c, moves, board, whiteToMove, capturesOnly=False):
+        self.getRookMoves(r, c, moves, board, whiteToMove, capturesOnly)
+        self.getBishopMoves(r, c, moves, board, whiteToMove, capturesOnly)
 
-    def getKingMoves(self, r, c, moves, board, whiteToMove):
-        kingMoves = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))  # All possible king moves
+    def getKingMoves(self, r, c, moves, board, whiteToMove, capturesOnly=False):
         allyColor = "w" if whiteToMove else "b"
         for i in range(len(self.pins) - 1, -1, -1):
             if self.pins[i][0] == r and self.pins[i][1] == c:
                 self.pins.remove(self.pins[i])
                 break
-        for m in kingMoves:
-            endRow = r + m[0]
-            endCol = c + m[1]
-            if 0 <= endRow < len(board) and 0 <= endCol < len(board[0]):
-                endPiece = board[endRow][endCol]
-                if endPiece == "--" or endPiece[0] != allyColor:
-                    # Place king on end square and check for checks
-                    if whiteToMove:
-                        self.whiteKingLocation = (endRow, endCol)
-                    else:
-                        self.blackKingLocation = (endRow, endCol)
-                    inCheck, pins, checks = self.checkForPinsAndChecks()
-                    if not inCheck:
-                        moves.append(Move((r, c), (endRow, endCol), board))
-                    # Place king back on original location
-                    if whiteToMove:
-                        self.whiteKingLocation = (r, c)
-                    else:
-                        self.blackKingLocation = (r, c)
+        start = r * 8 + c
+        for endRow, endCol, m in kingSteps[r][c]:
+            endPiece = board[endRow][endCol]
+            if endPiece[0] != allyColor and (endPiece != "--" or not capturesOnly):
+                # Place king on end square and check for checks
+                if whiteToMove:
+                    self.whiteKingLocation = (endRow, endCol)
+                else:
+                    self.blackKingLocation = (endRow, endCol)
+                inCheck, pins, checks = self.checkForPinsAndChecks()
+                if not inCheck:
+                    moves.append(start | (endRow * 8 + endCol) << 6 | (CAPTURE if endPiece != "--" else 0))
+                # Place king back on original location
+                if whiteToMove:
+                    self.whiteKingLocation = (r, c)
+                else:
+                    self.blackKingLocation = (r, c)
     
     def getCastleMoves(self, r, c, moves, board, whiteToMove):
-        if self.squareUnderAttack(r, c):
+        kingside = self.currentCastleRights.wks if self.whiteToMove else self.currentCastleRights.bks
+        queenside = self.currentCastleRights.wqs if self.whiteToMove else self.currentCastleRights.bqs
+        if not kingside and not queenside:
+            return
+        if (r, c) in self.getAttackMap('b' if whiteToMove else 'w'):
             return # Can't castle while in check
-        if (self.whiteToMove and self.currentCastleRights.wks) or (not self.whiteToMove and self.currentCastleRights.bks):
+        if kingside:
             self.getKingsideCastleMoves(r, c, moves, board, whiteToMove)
-        if (self.whiteToMove and self.currentCastleRights.wqs) or (not self.whiteToMove and self.currentCastleRights.bqs):
+        if queenside:
             self.getQueensideCastleMoves(r, c, moves, board, whiteToMove)
     
     def getKingsideCastleMoves(self, r, c, moves, board, whiteToMove):
         if board[r][c+1] == "--" and board[r][c+2] == "--":
-            if not self.squareUnderAttack(r, c+1) and not self.squareUnderAttack(r, c+2):
-                moves.append(Move((r, c), (r, c+2), board, isCastleMove=True))
+            attacked = self.getAttackMap('b' if whiteToMove else 'w')
+            if (r, c+1) not in attacked and (r, c+2) not in attacked:
+                moves.append(r * 8 + c | (r * 8 + c + 2) << 6 | CASTLE)
     
     def getQueensideCastleMoves(self, r, c, moves, board, whiteToMove):
         if board[r][c-1] == "--" and board[r][c-2] == "--" and board[r][c-3] == "--":
-            if not self.squareUnderAttack(r, c-1) and not self.squareUnderAttack(r, c-2):
-                moves.append(Move((r, c), (r, c-2), board, isCastleMove=True))
+            attacked = self.getAttackMap('b' if whiteToMove else 'w')
+            if (r, c-1) not in attacked and (r, c-2) not in attacked:
+                moves.append(r * 8 + c | (r * 8 + c - 2) << 6 | CASTLE)
                 
     
 class CastleRights:
@@ -194,7 +240,7 @@ class Move():
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
     
-    def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False):
+    def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False, promotionChoice='Q'):
         self.startRow = startSq[0]
         self.startCol = startSq[1]
         self.endRow = endSq[0]
@@ -207,8 +253,39 @@ class Move():
             self.pieceCaptured = "wp" if self.pieceMoved == "bp" else "bp"
         # Castle move
         self.isCastleMove = isCastleMove
+        self.promotionChoice = promotionChoice  # Piece a promotion makes unless makeMove is given another
         self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
         
+    @classmethod
+    def fromPacked(cls, code, board):
+        """Builds the Move for a packed move, for when the UI or notation needs one"""
+        start, end = code & 63, (code >> 6) & 63
+        promotion = (code >> PROMOTION_SHIFT) & 7
+        return cls((start >> 3, start & 7), (end >> 3, end & 7), board,
+                   isEnpassantMove=bool(code & ENPASSANT), isCastleMove=bool(code & CASTLE),
+                   promotionChoice=PROMOTION_PIECES[promotion] if promotion else 'Q')
+
+    def withPromotion(self, choice):
+        """A copy of this move that promotes to choice, for picking one of the promotions a packed list holds"""
+        move = copy.copy(self)
+        move.promotionChoice = choice
+        return move
+
+    def pack(self, choice=None):
+        choice = choice or self.promotionChoice
+        code = (self.startRow * 8 + self.startCol) | ((self.endRow * 8 + self.endCol) << 6)
+        if self.pieceCaptured != "--":
+            code |= CAPTURE
+        if self.isEnpassantMove:
+            code |= ENPASSANT
+        if self.isCastleMove:
+            code |= CASTLE
+        if self.isPawnPromotion:
+            code |= PROMOTION_CHOICES.get(choice, PROMOTION_CHOICES['Q']) << PROMOTION_SHIFT
+        if self.pieceMoved[1] == 'p' and abs(self.startRow - self.endRow) == 2:
+            code |= DOUBLE_PUSH
+        return code
+
     def __eq__(self, other):
         if isinstance(other, Move):
             return self.moveID == other.moveID
@@ -0,0 +1,286 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import computer
+from computer import CHECKMATE, MAX_DEPTH, SearchTimeout
+from fen import loadFen, toFen
+from transposition import SharedTranspositionTable
+
+WORKERS = os.cpu_count() or 1
+LAZY_SMP = True  # findBestMoveTimed runs full searches on a shared table instead of splitting the root moves
+POLL_SECONDS = 0.02  # How often the root waits for results before looking at the stop event again
+
+_pool = None
+_poolKey = None  # (engine class, workers) the pool was started for
+_sharedAlpha = None  # Best root score proven so far in the current iteration, read by every worker
+_stopSearch = None  # multiprocessing.Event that makes all workers abandon their root moves
+_generation = 0  # Bumped by newGame so workers forget their tables
+_table = None  # SharedTranspositionTable every worker attaches to
+_hashSizeMB = computer.HASH_SIZE_MB
+
+# Per worker process
+_engine = None
+_position = None  # (fen, positionLog, generation, game state) of the last position searched
+
+
+def getPool(engine, workers=WORKERS):
+    """Starts the worker processes once and keeps them, so every search after the first finds
+    warm game states and transposition tables
+    """
+    global _pool, _poolKey, _sharedAlpha, _stopSearch, _table
+    if _pool is not None and _poolKey == (engine, workers):
+        return _pool
+    shutdown()
+    context = multiprocessing.get_context("spawn")  # Forking a process that runs pygame threads isn't safe
+    _sharedAlpha = context.Value('i', -CHECKMATE)
+    _stopSearch = context.Event()
+    _table = SharedTranspositionTable(_hashSizeMB)
+    _pool = ProcessPoolExecutor(workers, mp_context=context, initializer=_initWorker,
+                                initargs=(engine, _sharedAlpha, _stopSearch, _table.name))
+    _poolKey = (engine, workers)
+    return _pool
+
+
+def shutdown():
+    global _pool, _poolKey, _table
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+    if _table is not None:
+        _table.close()
+    _pool, _poolKey, _table = None, None, None
+
+
+def setHashSize(sizeMB):
+    """Size of the shared transposition table; the workers restart with it on the next search"""
+    global _hashSizeMB
+    _hashSizeMB = sizeMB
+    shutdown()
+
+
+def newGame():
+    """Clears the shared transposition table and makes every worker clear its move ordering tables"""
+    global _generation
+    _generation += 1
+    if _table is not None:
+        _table.clear()
+
+
+def _initWorker(engine, sharedAlpha, stopSearch, tableName):
+    global _engine, _sharedAlpha, _stopSearch
+    _engine, _sharedAlpha, _stopSearch = engine, sharedAlpha, stopSearch
+    computer.transpositionTable = SharedTranspositionTable(name=tableName)
+    multiprocessing.util.Finalize(None, computer.transpositionTable.close, exitpriority=0)
+
+
+def _loadPosition(fen, positionLog, generation):
+    """The worker's game state for a position, rebuilt only when the position changes"""
+    global _position
+    if _position is not None and _position[:3] == (fen, positionLog, generation):
+        return _position[3]
+    if _position is None or _position[2] != generation:
+        computer.newGame()
+    gs = _position[3] if _position is not None else _engine()
+    loadFen(gs, fen)
+    gs.positionLog = dict(positionLog)  # Keeps repetitions of earlier positions of the game visible
+    computer.transpositionTable.newSearch()
+    computer.moveOrderer.newSearch()
+    _position = (fen, positionLog, generation, gs)
+    return gs
+
+
+def _searchRootMove(fen, positionLog, generation, move, depth, deadline, scout):
+    """Searches one root move to depth and returns (move, score, exact, nodes), score being None if the
+    search ran out of time. Scouts first prove the move better than the shared alpha with a null window.
+    """
+    gs = _loadPosition(fen, positionLog, generation)
+    computer.deadline = None if deadline is None else time.perf_counter() + deadline - time.time()
+    computer.stopEvent = _stopSearch
+    computer.nodes = 0
+    gs.makePackedMove(move)
+    try:
+        turnMultiplier = 1 if gs.whiteToMove else -1
+        alpha = _sharedAlpha.value
+        if scout:
+            score = -computer.alphaBeta(gs, gs.getValidMovesPacked(), depth - 1, -alpha - 1, -alpha,
+                                        turnMultiplier, 1)
+            if score <= alpha:
+                return move, score, False, computer.nodes
+            alpha = _sharedAlpha.value
+        score = -computer.alphaBeta(gs, gs.getValidMovesPacked(), depth - 1, -CHECKMATE, -alpha, turnMultiplier, 1)
+        if score <= alpha:
+            return move, score, False, computer.nodes
+        with _sharedAlpha.get_lock():
+            if score > _sharedAlpha.value:
+                _sharedAlpha.value = score
+        return move, score, True, computer.nodes
+    except SearchTimeout:
+        return move, None, False, computer.nodes
+    finally:
+        gs.undoPackedMove()
+        computer.deadline = computer.stopEvent = None
+
+
+def _collect(futures, stop):
+    """Waits for the futures, passing a stop request on to the workers"""
+    while True:
+        _, pending = wait(futures, timeout=POLL_SECONDS)
+        if stop is not None and stop.is_set():
+            _stopSearch.set()
+        if not pending:
+            return [future.result() for future in futures]
+
+
+def searchRoot(pool, fen, positionLog, rootMoves, depth, deadline=None, stop=None):
+    """One iteration split over the root moves: the first (best so far) move is searched alone with the
+    full window and sets alpha, then all the others are scouted at once against the shared alpha.
+    Returns (results, nodes), results being None if time ran out.
+    """
+    _sharedAlpha.value = -CHECKMATE
+    _stopSearch.clear()
+    first = pool.submit(_searchRootMove, fen, positionLog, _generation, rootMoves[0], depth, deadline, False)
+    results = _collect([first], stop)
+    if len(rootMoves) > 1 and results[0][1] is not None:
+        _sharedAlpha.value = results[0][1]
+        results += _collect([pool.submit(_searchRootMove, fen, positionLog, _generation, move, depth, deadline, True)
+                             for move in rootMoves[1:]], stop)
+    nodes = sum(result[3] for result in results)
+    if any(result[1] is None for result in results):
+        return None, nodes
+    return results, nodes
+
+
+def findBestMoveParallel(gs, validMoves, maxDepth, softTime=None, hardTime=None, stop=None, workers=WORKERS):
+    """Iterative deepening like computer.findBestMoveIterative with each iteration's root moves spread
+    over a pool of worker processes. Positions go to the workers as FEN plus the Zobrist keys of earlier
+    positions, never as Move objects.
+    """
+    start = time.perf_counter()
+    pool = getPool(type(gs), workers)
+    _table.newSearch()
+    fen = toFen(gs)
+    positionLog = tuple((key, count) for key, count in gs.positionLog.items() if count)
+    rootMoves = list(gs.getValidMovesPacked())
+    totalNodes = 0
+    bestMove, bestScore = None, 0
+    computer.searchInfo.update(depth=0, score=0, nodes=0, seconds=0.0, pv=[], workers=workers, iterations=[])
+    if len(rootMoves) == 1:
+        return computer.findMove(validMoves, rootMoves[0])
+    for depth in range(1, maxDepth + 1):
+        deadline = None  # The first iteration always completes so there is a move
+        if hardTime is not None and bestMove is not None:
+            deadline = time.time() + hardTime - (time.perf_counter() - start)  # Wall clock, shared by the workers
+        results, nodes = searchRoot(pool, fen, positionLog, rootMoves, depth, deadline, stop)
+        totalNodes += nodes
+        if results is None:
+            break
+        exact = [(score, move) for move, score, isExact, _ in results if isExact]
+        bestScore, bestMove = max(exact) if exact else (results[0][1], results[0][0])
+        # Next iteration: best move first, then the rest by how well they scored
+        scores = {move: score for move, score, _, _ in results}
+        rootMoves.sort(key=lambda move: (move == bestMove, scores[move]), reverse=True)
+        elapsed = time.perf_counter() - start
+        computer.searchInfo.update(depth=depth, score=bestScore, nodes=totalNodes, seconds=elapsed, pv=[bestMove])
+        computer.searchInfo["iterations"].append((depth, totalNodes, elapsed))
+        if abs(bestScore) >= CHECKMATE or (softTime is not None and elapsed >= softTime):
+            break
+    return computer.findMove(validMoves, bestMove)
+
+
+def _lazySearch(fen, positionLog, generation, maxDepth, softTime, hardTime, maxNodes=None):
+    """A complete iterative deepening search in one worker, returning (packed move, depth, score, nodes)"""
+    gs = _loadPosition(fen, positionLog, generation)
+    move = computer.findBestMoveIterative(gs, gs.getValidMoves(), maxDepth, softTime, hardTime, _stopSearch,
+                                          maxNodes)
+    info = computer.searchInfo
+    return move.pack() if move is not None else None, info["depth"], info["score"], info["nodes"]
+
+
+def findBestMoveLazySMP(gs, validMoves, maxDepth, softTime=None, hardTime=None, stop=None, workers=WORKERS,
+                        maxNodes=None):
+    """Lazy SMP: every worker runs the whole search on the same position, sharing one transposition table.
+    Random tie breaks in the move ordering send them down different branches, so each keeps finding
+    results the others stored. The first to finish stops the rest, and the deepest search wins.
+
+    maxNodes is shared out evenly, so the workers together search about that many nodes.
+    """
+    start = time.perf_counter()
+    pool = getPool(type(gs), workers)
+    _table.newSearch()
+    _stopSearch.clear()
+    fen = toFen(gs)
+    positionLog = tuple((key, count) for key, count in gs.positionLog.items() if count)
+    workerNodes = max(1, maxNodes // workers) if maxNodes is not None else None
+    futures = [pool.submit(_lazySearch, fen, positionLog, _generation, maxDepth, softTime, hardTime, workerNodes)
+               for _ in range(workers)]
+    done = set()
+    while not done:
+        done, _ = wait(futures, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+        if stop is not None and stop.is_set():
+            _stopSearch.set()
+    _stopSearch.set()
+    first = next(iter(done)).result()
+    results = _collect(futures, None)
+    move, depth, score, _ = max(results, key=lambda result: (result[0] is not None, result[1], result is first))
+    computer.searchInfo.update(depth=depth, score=score, nodes=sum(result[3] for result in results),
+                               seconds=time.perf_counter() - start, pv=[move] if move else [], workers=workers,
+                               hashfull=_table.hashfull())
+    return computer.findMove(validMoves, move)
+
+
+def findBestMoveTimed(gs, validMoves, timeLeft, increment=0.0, maxDepth=MAX_DEPTH, stop=None, workers=WORKERS,
+                      lazy=LAZY_SMP):
+    computer.searchInfo.update(tablebase=False)
+    tableMove = computer.findTablebaseMove(gs, validMoves, gs.getValidMovesPacked())
+    if tableMove is not None:
+        return tableMove
+    softTime, hardTime = computer.allocateTime(timeLeft, increment)
+    search = findBestMoveLazySMP if lazy else findBestMoveParallel
+    return search(gs, validMoves, maxDepth, softTime, hardTime, stop, workers)
+
+
+def benchmark(fens, depth, workerCounts, engine, lazy=False):
+    """Times fixed-depth searches with each number of workers and prints the speedup over one worker"""
+    search = findBestMoveLazySMP if lazy else findBestMoveParallel
+    results = []
+    for workers in workerCounts:
+        getPool(engine, workers)
+        newGame()
+        search(engine(), [], 1, workers=workers)  # Start the processes before timing
+        nodes, seconds = 0, 0.0
+        for fen in fens:
+            newGame()
+            gs = loadFen(engine(), fen)
+            start = time.perf_counter()
+            search(gs, gs.getValidMoves(), depth, workers=workers)
+            seconds += time.perf_counter() - start
+            nodes += computer.searchInfo["nodes"]
+        results.append((workers, nodes, seconds))
+        print(f"{workers:>3} workers: {nodes:>9} nodes {seconds:8.2f}s {nodes / seconds:>10,.0f} nodes/sec  "
+              f"speedup {results[0][2] / seconds:.2f}x")
+    shutdown()
+    return results
+
+
+def main(argv=None):
+    from perft import ENGINES, POSITIONS
+    parser = argparse.ArgumentParser(description="Parallel search speedup per number of worker processes")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="bitboard")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--workers", type=int, nargs="*", help="worker counts to compare (default 1, 2, 4... up to "
+                                                                "the number of cores)")
+    parser.add_argument("--fen", nargs="*", help="positions to search instead of the perft reference positions")
+    parser.add_argument("--lazy", action="store_true", help="benchmark Lazy SMP instead of the root split")
+    parser.add_argument("--hash", type=int, default=_hashSizeMB, help="shared transposition table size in MB")
+    args = parser.parse_args(argv)
+    setHashSize(args.hash)
+    workerCounts = args.workers or [1 << i for i in range(WORKERS.bit_length()) if 1 << i <= WORKERS]
+    benchmark(args.fen or [fen for _, fen, _, _ in POSITIONS], args.depth, workerCounts, ENGINES[args.engine],
+              args.lazy)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from engine import GameState
+from bitboard import BitboardGameState
+from fen import STARTING_FEN, loadFen
+
+ENGINES = {"string": GameState, "bitboard": BitboardGameState}
+
+# Reference positions with their published node counts for depth 1, 2, 3...
+# and the depth each runs to by default
+POSITIONS = [
+    ("startpos", STARTING_FEN, [20, 400, 8902, 197281, 4865609, 119060324], 4),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603, 193690690], 3),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624, 11030083], 5),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333, 15833292], 4),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487, 89941194], 3),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594, 164075551], 3),
+]
+
+
+def perft(gs, depth):
+    """Counts leaf nodes of the legal move tree through the getValidMovesPacked/makePackedMove/undoPackedMove
+    contract the search uses, in which both engines list a promotion once per piece"""
+    if depth == 1:
+        return len(gs.getValidMovesPacked())
+    nodes = 0
+    for code in gs.getValidMovesPacked():
+        gs.makePackedMove(code)
+        nodes += perft(gs, depth - 1)
+        gs.undoPackedMove()
+    return nodes
+
+
+def countNodes(gs, depth):
+    """Uses the engine's own packed-move perft when it has one"""
+    if depth == 0:
+        return 1
+    if hasattr(gs, "perft"):
+        return gs.perft(depth)
+    return perft(gs, depth)
+
+
+def divide(gs, depth):
+    """Node count below each root move, for finding which move a generator gets wrong"""
+    results = []
+    for move in gs.getValidMoves():
+        for choice in ("QRBN" if move.isPawnPromotion else "Q"):
+            gs.makeMove(move, choice)
+            name = move.getChessNotation() + (choice.lower() if move.isPawnPromotion else "")
+            results.append((name, countNodes(gs, depth - 1)))
+            gs.undoMove()
+    return sorted(results)
+
+
+def timePerft(count, depth):
+    start = time.perf_counter()
+    nodes = count(depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed, nodes / elapsed if elapsed > 0 else 0.0
+
+
+def gitRevision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runSuite(engine, maxDepth=None, names=None):
+    """Runs the reference positions on one engine and returns a JSON-ready summary"""
+    results = []
+    totalNodes, totalSeconds = 0, 0.0
+    for name, fen, expected, defaultDepth in POSITIONS:
+        if names and name not in names:
+            continue
+        depth = min(defaultDepth, maxDepth) if maxDepth else defaultDepth
+        gs = loadFen(ENGINES[engine](), fen)
+        nodes, elapsed, nps = timePerft(lambda d: countNodes(gs, d), depth)
+        ok = nodes == expected[depth - 1]
+        print(f"{name:<10} depth {depth}: {nodes:>10} nodes {elapsed:8.3f}s {nps:>12,.0f} nodes/sec"
+              f"  {'ok' if ok else 'MISMATCH expected ' + str(expected[depth - 1])}")
+        results.append({"name": name, "fen": fen, "depth": depth, "nodes": nodes, "expected": expected[depth - 1],
+                        "ok": ok, "seconds": round(elapsed, 4), "nps": round(nps)})
+        totalNodes += nodes
+        totalSeconds += elapsed
+    nps = totalNodes / totalSeconds if totalSeconds > 0 else 0.0
+    print(f"Total: {totalNodes} nodes {totalSeconds:.3f}s {nps:,.0f} nodes/sec, "
+          f"{sum(r['ok'] for r in results)}/{len(results)} correct")
+    return {"engine": engine, "revision": gitRevision(), "python": platform.python_version(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "positions": results,
+            "totalNodes": totalNodes, "totalSeconds": round(totalSeconds, 4), "nps": round(nps)}
+
+
+def compareResults(summary, baselinePath):
+    """Prints the nodes/sec ratio of each position against an earlier JSON results file"""
+    with open(baselinePath) as f:
+        baseline = json.load(f)
+    previous = {(r["name"], r["depth"]): r for r in baseline["positions"]}
+    print(f"Compared with {baseline.get('engine')} @ {baseline.get('revision')}:")
+    for result in summary["positions"]:
+        old = previous.get((result["name"], result["depth"]))
+        if old is None or not old["nps"]:
+            print(f"{result['name']:<10} no baseline at depth {result['depth']}")
+            continue
+        change = "" if old["nodes"] == result["nodes"] else f"  node count changed from {old['nodes']}"
+        print(f"{result['name']:<10} {old['nps']:>12,} -> {result['nps']:>12,} nodes/sec "
+              f"({result['nps'] / old['nps']:.2f}x){change}")
+    if baseline.get("nps"):
+        print(f"Overall: {summary['nps'] / baseline['nps']:.2f}x")
+
+
+def compareEngines(depth):
+    """Runs perft from the start position on both engines and prints nodes/sec for each"""
+    gs = GameState()
+    results = [("MoveGenerator", timePerft(lambda d: perft(gs, d), depth))]
+    bb = BitboardGameState()
+    bb.perft(depth - 1)  # Fill the lazily built attack and move tables before timing
+    results.append(("Bitboard", timePerft(bb.perft, depth)))
+    for name, (nodes, elapsed, nps) in results:
+        print(f"{name:<14} depth {depth}: {nodes:>9} nodes {elapsed:8.3f}s {nps:>12,.0f} nodes/sec")
+    print(f"Speedup: {results[1][1][2] / results[0][1][2]:.1f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move generator correctness and speed benchmark")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="bitboard")
+    parser.add_argument("--depth", type=int, help="run perft on --fen to this depth, or cap the suite depths")
+    parser.add_argument("--fen", help="position for a single perft run instead of the reference suite")
+    parser.add_argument("--divide", action="store_true", help="print the node count below every root move")
+    parser.add_argument("--positions", nargs="*", help="only run these reference positions")
+    parser.add_argument("--json", help="write suite results to this file")
+    parser.add_argument("--compare", help="earlier JSON results file to compare nodes/sec against")
+    parser.add_argument("--engines", action="store_true", help="compare both engines from the start position")
+    args = parser.parse_args(argv)
+
+    if args.engines:
+        compareEngines(args.depth or 4)
+        return 0
+    if args.fen or args.divide:
+        gs = loadFen(ENGINES[args.engine](), args.fen or STARTING_FEN)
+        depth = args.depth or 3
+        if args.divide:
+            total = 0
+            for name, nodes in divide(gs, depth):
+                print(f"{name}: {nodes}")
+                total += nodes
+            print(f"\nNodes searched: {total}")
+        else:
+            nodes, elapsed, nps = timePerft(lambda d: countNodes(gs, d), depth)
+            print(f"depth {depth}: {nodes} nodes {elapsed:.3f}s {nps:,.0f} nodes/sec")
+        return 0
+
+    summary = runSuite(args.engine, args.depth, args.positions)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.compare:
+        compareResults(summary, args.compare)
+    return 0 if all(r["ok"] for r in summary["positions"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,336 @@
+import argparse
+import re
+import sys
+import time
+from moves import CAPTURE, CASTLE, DOUBLE_PUSH, ENPASSANT, PROMOTION_CHOICES, PROMOTION_PIECES, PROMOTION_SHIFT
+from moves import bishopRays, kingSteps, knightJumps, queenRays, rookRays
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+_TOKENS = re.compile(r'[{}();]|\$\d+|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s{}();$]+')
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+_PIECE_LETTERS = "NBRQK"
+_STEPS = {"N": knightJumps, "K": kingSteps}
+_RAYS = {"B": bishopRays, "R": rookRays, "Q": queenRays}
+
+
+def readGames(lines):
+    """Yields (tags, SAN moves, result) for every game in an iterable of PGN lines, such as an open file.
+
+    Comments, variations, NAGs and move numbers are skipped, and only one game is held in memory at a time.
+    """
+    tags, moves = {}, []
+    commentDepth = variationDepth = 0
+    for line in lines:
+        if not commentDepth and line.startswith("["):
+            if moves:  # A game without a result ends where the next one's tags start
+                yield tags, moves, tags.get("Result", "*")
+                tags, moves = {}, []
+            match = _TAG.match(line)
+            if match:
+                tags[match.group(1)] = match.group(2).replace('\\"', '"')
+            continue
+        if not commentDepth and line.startswith("%"):  # Escaped line
+            continue
+        for token in _TOKENS.findall(line):
+            if commentDepth:
+                if token == "}":
+                    commentDepth = 0
+            elif token == "{":
+                commentDepth = 1
+            elif token == ";":
+                break
+            elif token == "(":
+                variationDepth += 1
+            elif token == ")":
+                variationDepth = max(0, variationDepth - 1)
+            elif variationDepth or token[0] == "$" or token[0].isdigit() and token.endswith("."):
+                continue
+            elif token in RESULTS:
+                yield tags, moves, token
+                tags, moves = {}, []
+            else:
+                moves.append(token)
+    if moves or tags:
+        yield tags, moves, tags.get("Result", "*")
+
+
+def _splitSan(san):
+    """(piece letter, disambiguation hint, endRow, endCol, promotion choice) of a SAN move other than castling"""
+    text = san.rstrip("+#!?")
+    choice = 'Q'
+    if "=" in text:
+        text, choice = text.split("=", 1)
+        choice = choice[:1].upper()
+    elif len(text) > 2 and text[-1].upper() in "NBRQ" and text[-2].isdigit():  # e8Q
+        text, choice = text[:-1], text[-1].upper()
+    if not text:
+        raise ValueError(f"Unreadable move {san!r}")
+    piece = text[0] if text[0] in _PIECE_LETTERS else "p"
+    if piece != "p":
+        text = text[1:]
+    text = text.replace("x", "").replace("-", "").replace(":", "")
+    if len(text) < 2 or text[-2] not in "abcdefgh" or text[-1] not in "12345678":
+        raise ValueError(f"Unreadable move {san!r}")
+    return piece, text[:-2], 8 - int(text[-1]), ord(text[-2]) - ord("a"), choice
+
+
+def _castleSide(san):
+    """2 for a kingside and -2 for a queenside castling SAN, otherwise 0"""
+    text = san.rstrip("+#!?").replace("0", "O")
+    return 2 if text == "O-O" else -2 if text == "O-O-O" else 0
+
+
+def _matchesHint(hint, row, col):
+    return all(("a" <= char <= "h" and ord(char) - ord("a") == col) or
+               ("1" <= char <= "8" and 8 - int(char) == row) for char in hint)
+
+
+def parseSan(san, validMoves):
+    """Returns (move, promotion choice) of validMoves written as san, raising ValueError if it matches
+    no move or more than one"""
+    side = _castleSide(san)
+    if side:
+        for move in validMoves:
+            if move.isCastleMove and move.endCol - move.startCol == side:
+                return move, 'Q'
+        raise ValueError(f"Illegal move {san!r}")
+    piece, hint, endRow, endCol, choice = _splitSan(san)
+    matches = [move for move in validMoves
+               if move.pieceMoved[1] == piece and move.endRow == endRow and move.endCol == endCol and
+               not move.isCastleMove and _matchesHint(hint, move.startRow, move.startCol)]
+    if len(matches) != 1:
+        raise ValueError(f"{'Ambiguous' if matches else 'Illegal'} move {san!r}")
+    return matches[0], choice
+
+
+def _origins(board, name, endRow, endCol, enpassantPossible):
+    """Squares from which the piece name (such as "wN") moves to (endRow, endCol) by the rules of its kind,
+    before checking that the move doesn't leave the king attacked"""
+    if board[endRow][endCol][0] == name[0]:
+        return []
+    kind = name[1]
+    if kind == "p":
+        forward = -1 if name[0] == "w" else 1  # White pawns move towards row 0
+        row = endRow - forward
+        if not 0 <= row < 8:
+            return []
+        if board[endRow][endCol] != "--" or (endRow, endCol) == enpassantPossible:
+            return [(row, col) for col in (endCol - 1, endCol + 1) if 0 <= col < 8 and board[row][col] == name]
+        if board[row][endCol] == name:
+            return [(row, endCol)]
+        doublePushRow = 4 if name[0] == "w" else 3
+        if board[row][endCol] == "--" and endRow == doublePushRow and board[row - forward][endCol] == name:
+            return [(row - forward, endCol)]
+        return []
+    if kind in _STEPS:
+        return [(row, col) for row, col, _ in _STEPS[kind][endRow][endCol] if board[row][col] == name]
+    origins = []
+    for _, ray in _RAYS[kind][endRow][endCol]:
+        for row, col in ray:
+            if board[row][col] != "--":
+                if board[row][col] == name:
+                    origins.append((row, col))
+                break
+    return origins
+
+
+def _pack(board, startRow, startCol, endRow, endCol, choice='Q'):
+    """Packed move of a piece on board, with the flags getValidMovesPacked gives it"""
+    code = (startRow * 8 + startCol) | ((endRow * 8 + endCol) << 6)
+    if board[endRow][endCol] != "--":
+        code |= CAPTURE
+    if board[startRow][startCol][1] == "p":
+        if startCol != endCol and board[endRow][endCol] == "--":
+            code |= CAPTURE | ENPASSANT
+        if abs(startRow - endRow) == 2:
+            code |= DOUBLE_PUSH
+        if endRow in (0, 7):
+            code |= PROMOTION_CHOICES.get(choice, PROMOTION_CHOICES['Q']) << PROMOTION_SHIFT
+    return code
+
+
+def _isLegal(gs, code):
+    gs.makePackedMove(code)
+    try:
+        return not gs.movedIntoCheck()
+    finally:
+        gs.undoPackedMove()
+
+
+def _legalFrom(gs, name, endRow, endCol, hint=""):
+    """Legal packed moves of the piece name to (endRow, endCol), without generating every legal move"""
+    board = gs.board
+    codes = [_pack(board, row, col, endRow, endCol)
+             for row, col in _origins(board, name, endRow, endCol, gs.enpassantPossible)
+             if _matchesHint(hint, row, col)]
+    return [code for code in codes if _isLegal(gs, code)]
+
+
+def sanToCode(gs, san):
+    """Packed move of san in the current position of gs (either engine), raising ValueError if it matches no
+    legal move or more than one. Only the pieces that could reach the destination are tried, so the full
+    legal move list is never built except for castling."""
+    side = _castleSide(san)
+    if side:
+        for code in gs.getValidMovesPacked():
+            if code & CASTLE and ((code >> 6) & 7) - (code & 7) == side:
+                return code
+        raise ValueError(f"Illegal move {san!r}")
+    piece, hint, endRow, endCol, choice = _splitSan(san)
+    name = ('w' if gs.whiteToMove else 'b') + piece
+    codes = _legalFrom(gs, name, endRow, endCol, hint)
+    if len(codes) != 1:
+        raise ValueError(f"{'Ambiguous' if codes else 'Illegal'} move {san!r}")
+    code = codes[0]
+    if (code >> PROMOTION_SHIFT) & 7:
+        promotion = PROMOTION_CHOICES.get(choice, PROMOTION_CHOICES['Q'])
+        code = (code & ~(7 << PROMOTION_SHIFT)) | (promotion << PROMOTION_SHIFT)
+    return code
+
+
+def codeToSan(gs, code):
+    """SAN of a legal packed move in the current position of gs (either engine), with + or # when it gives
+    check or mate"""
+    board = gs.board
+    start, end = code & 63, (code >> 6) & 63
+    startRow, startCol, endRow, endCol = start >> 3, start & 7, end >> 3, end & 7
+    name = board[startRow][startCol]
+    destination = "abcdefgh"[endCol] + str(8 - endRow)
+    if code & CASTLE:
+        san = "O-O" if endCol > startCol else "O-O-O"
+    elif name[1] == "p":
+        san = ("abcdefgh"[startCol] + "x" if code & CAPTURE else "") + destination
+        promotion = (code >> PROMOTION_SHIFT) & 7
+        if promotion:
+            san += "=" + PROMOTION_PIECES[promotion]
+    else:
+        rivals = [other for other in _legalFrom(gs, name, endRow, endCol) if other & 63 != start]
+        hint = ""
+        if rivals:
+            if all(other & 7 != startCol for other in rivals):
+                hint = "abcdefgh"[startCol]
+            elif all(other >> 3 & 7 != startRow for other in rivals):
+                hint = str(8 - startRow)
+            else:
+                hint = "abcdefgh"[startCol] + str(8 - startRow)
+        san = name[1] + hint + ("x" if code & CAPTURE else "") + destination
+    gs.makePackedMove(code)
+    try:
+        if gs.isInCheck():
+            san += "+" if len(gs.getValidMovesPacked()) else "#"
+    finally:
+        gs.undoPackedMove()
+    return san
+
+
+def moveLogToSan(gs):
+    """SAN of every move in gs.moveLog, found by taking the moves back and playing them again, so gs ends
+    where it was. Only moves made with makeMove are in moveLog."""
+    moves = list(gs.moveLog)
+    choices = []
+    for move in reversed(moves):
+        choices.append(gs.board[move.endRow][move.endCol][1] if move.isPawnPromotion else 'Q')
+        gs.undoMove()
+    sans = []
+    for move, choice in zip(moves, reversed(choices)):
+        sans.append(codeToSan(gs, move.pack(choice)))
+        gs.makeMove(move, choice)
+    return sans
+
+
+def replay(gs, moves):
+    """Plays SAN moves on gs through sanToCode and returns their packed moves, raising ValueError at the first
+    one that isn't legal"""
+    codes = []
+    for san in moves:
+        code = sanToCode(gs, san)
+        gs.makePackedMove(code)
+        codes.append(code)
+    return codes
+
+
+def formatGame(tags, moves, result):
+    """PGN text of one game: the seven tag roster first, then the other tags, then the SAN moves wrapped
+    at 80 columns. A FEN tag sets the first move number and side."""
+    roster = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+    tags = dict(tags, Result=result)
+    lines = [f'[{name} "{tags.get(name, "?")}"]' for name in roster]
+    lines += [f'[{name} "{value}"]' for name, value in tags.items() if name not in roster]
+    number, whiteToMove = 1, True
+    if "FEN" in tags:
+        fields = tags["FEN"].split()
+        whiteToMove = fields[1] == "w"
+        number = int(fields[5]) if len(fields) > 5 else 1
+    tokens = []
+    for i, san in enumerate(moves):
+        if whiteToMove:
+            tokens.append(f"{number}.")
+        elif i == 0:
+            tokens.append(f"{number}...")
+        tokens.append(san)
+        if not whiteToMove:
+            number += 1
+        whiteToMove = not whiteToMove
+    tokens.append(result)
+    text, line = [], ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            text.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    text.append(line)
+    return "\n".join(lines) + "\n\n" + "\n".join(text) + "\n"
+
+
+def main(argv=None):
+    from perft import ENGINES
+    from fen import loadFen, STARTING_FEN
+    parser = argparse.ArgumentParser(description="Replay PGN files through the engine and report games/sec")
+    parser.add_argument("pgn", nargs="+", help="PGN files to read")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="bitboard")
+    parser.add_argument("--out", help="write the games again, with their moves in standard SAN, to this file")
+    parser.add_argument("--full-lists", action="store_true",
+                        help="resolve SAN against the full legal move list instead, for comparison")
+    parser.add_argument("--limit", type=int, help="stop after this many games")
+    args = parser.parse_args(argv)
+    gs = ENGINES[args.engine]()
+    out = open(args.out, "w") if args.out else None
+    games = plies = errors = 0
+    start = time.perf_counter()
+    try:
+        for path in args.pgn:
+            with open(path, encoding="utf-8", errors="replace") as file:
+                for tags, moves, result in readGames(file):
+                    if args.limit is not None and games >= args.limit:
+                        break
+                    games += 1
+                    loadFen(gs, tags.get("FEN", STARTING_FEN))
+                    sans = []
+                    try:
+                        for san in moves:
+                            if args.full_lists:
+                                move, choice = parseSan(san, gs.getValidMoves())
+                                code = move.pack(choice)
+                            else:
+                                code = sanToCode(gs, san)
+                            if out:
+                                sans.append(codeToSan(gs, code))
+                            gs.makePackedMove(code)
+                            plies += 1
+                    except ValueError as error:
+                        errors += 1
+                        print(f"Game {games}: {error}", file=sys.stderr)
+                    if out:
+                        out.write(formatGame(tags, sans, result) + "\n")
+    finally:
+        if out:
+            out.close()
+    seconds = time.perf_counter() - start
+    print(f"{games} games, {plies} plies in {seconds:.2f}s: {games / seconds if seconds else 0:,.0f} games/sec, "
+          f"{plies / seconds if seconds else 0:,.0f} plies/sec, {errors} games with unreadable moves")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
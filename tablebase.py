@@ -0,0 +1,378 @@
+import argparse
+import os
+import struct
+import sys
+import time
+from bitboard import KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, WHITE, EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN
+from bitboard import bishopAttacks, rookAttacks
+
+TABLEBASE_DIR = "tablebases"
+# Material sets by name: the pieces the stronger side has besides its king, against a bare king
+MATERIALS = {"KQK": (QUEEN,), "KRK": (ROOK,), "KPK": (PAWN,), "KBNK": (BISHOP, KNIGHT)}
+DEPENDENCIES = {"KPK": ("KQK", "KRK")}  # Tables a set promotes into
+DRAWN = ((), (KNIGHT,), (BISHOP,))  # Bare kings, or a lone minor piece
+MAX_PHASE = 4  # evaluation phase of the heaviest set (KQK); positions above it are never probed
+WIN = 29000  # Score of a won position less one per ply to mate, kept under computer.CHECKMATE
+HEADER = struct.Struct(">4sB8sI")  # Magic, version, name, positions per side to move
+MAGIC, VERSION = b"PCTB", 1
+
+# Squares are row * 8 + col with row 0 being rank 8, as everywhere else. Positions are lists of squares
+# [stronger king, weaker king, pieces in MATERIALS order], seen with the stronger side as white.
+SYMMETRIES = [[(r if s & 2 == 0 else 7 - r) * 8 + (c if s & 1 == 0 else 7 - c) if s < 4 else
+               (c if s & 2 == 0 else 7 - c) * 8 + (r if s & 1 == 0 else 7 - r)
+               for r in range(8) for c in range(8)] for s in range(8)]
+# Without pawns the stronger king is mapped into the a1-d1-d4 triangle; with a pawn, the pawn onto files a-d
+KING_DOMAIN = [sq for sq in range(64) if sq // 8 >= 4 and 7 - sq // 8 <= sq % 8 <= 3]
+PAWN_DOMAIN = [sq for sq in range(8, 56) if sq % 8 <= 3]
+KING_SYMMETRIES = [[SYMMETRIES[s] for s in range(8) if SYMMETRIES[s][sq] in KING_DOMAIN] for sq in range(64)]
+_kingIndex = {sq: i for i, sq in enumerate(KING_DOMAIN)}
+_pawnIndex = {sq: i for i, sq in enumerate(PAWN_DOMAIN)}
+
+
+class Tablebase:
+    """Distance to mate of every position of one material set, with either side to move.
+
+    Each position is one byte, 0 for a draw or else 1 + the plies to mate: won for the stronger side
+    when it is to move (wtm), lost when the bare king is (btm). Positions are indexed after symmetry
+    reduction, so each set of equivalent positions is stored once and found with one lookup.
+    """
+
+    def __init__(self, name, wtm=None, btm=None):
+        self.name = name
+        self.pieces = MATERIALS[name]
+        self.pawnSlot = 2 + self.pieces.index(PAWN) if PAWN in self.pieces else None
+        self.domain = KING_DOMAIN if self.pawnSlot is None else PAWN_DOMAIN
+        self.others = 64 ** (1 + len(self.pieces))  # Squares of everything but the king or pawn indexed first
+        self.size = len(self.domain) * self.others
+        self.wtm = wtm if wtm is not None else bytearray(self.size)
+        self.btm = btm if btm is not None else bytearray(self.size)
+
+    def index(self, squares):
+        """Index of the position equivalent to squares that the table stores"""
+        if self.pawnSlot is None:
+            candidates = KING_SYMMETRIES[squares[0]]
+            if len(candidates) == 1:
+                mapped = [candidates[0][sq] for sq in squares]
+            else:  # A king on the diagonal leaves two symmetries; take the smaller result so the index is unique
+                mapped = min([symmetry[sq] for sq in squares] for symmetry in candidates)
+            index = _kingIndex[mapped[0]]
+            for sq in mapped[1:]:
+                index = index * 64 + sq
+            return index
+        symmetry = SYMMETRIES[0] if squares[self.pawnSlot] % 8 <= 3 else SYMMETRIES[1]
+        index = _pawnIndex[symmetry[squares[self.pawnSlot]]]
+        for slot, sq in enumerate(squares):
+            if slot != self.pawnSlot:
+                index = index * 64 + symmetry[sq]
+        return index
+
+    def squaresOf(self, index):
+        rest, anchor = [], index // self.others
+        index %= self.others
+        for _ in range(1 + len(self.pieces)):
+            rest.append(index & 63)
+            index >>= 6
+        rest.reverse()
+        if self.pawnSlot is None:
+            return [self.domain[anchor]] + rest
+        rest.insert(self.pawnSlot, self.domain[anchor])
+        return rest
+
+    def attacks(self, squares, occupied, skip=None):
+        """Squares the stronger side attacks, leaving out the piece on skip"""
+        attacked = KING_ATTACKS[squares[0]]
+        for piece, sq in zip(self.pieces, squares[2:]):
+            if sq == skip:
+                continue
+            if piece == KNIGHT:
+                attacked |= KNIGHT_ATTACKS[sq]
+            elif piece == BISHOP:
+                attacked |= bishopAttacks(sq, occupied)
+            elif piece == ROOK:
+                attacked |= rookAttacks(sq, occupied)
+            elif piece == QUEEN:
+                attacked |= bishopAttacks(sq, occupied) | rookAttacks(sq, occupied)
+            else:
+                attacked |= PAWN_ATTACKS[WHITE][sq]
+        return attacked
+
+    def isLegal(self, squares):
+        if len(set(squares)) != len(squares) or KING_ATTACKS[squares[0]] >> squares[1] & 1:
+            return False
+        return self.pawnSlot is None or 8 <= squares[self.pawnSlot] < 56
+
+    def probe(self, squares, strongerToMove):
+        """Score of a position of this set for the side to move (see WIN)"""
+        value = (self.wtm if strongerToMove else self.btm)[self.index(squares)]
+        if not value:
+            return 0
+        return WIN - (value - 1) if strongerToMove else -WIN + (value - 1)
+
+    def generate(self, tables, log=None):
+        """Retrograde analysis: starting from the mates, unmake moves to find positions won one ply
+        further away, until no more are found. Every bare king position counts its moves that are still
+        unresolved and is lost once the last of them turns out to be lost. tables holds the sets
+        promotions lead to.
+        """
+        wtm, btm = self.wtm, self.btm
+        counts = bytearray(self.size)  # Unresolved moves of each bare king position; 0 if illegal or resolved
+        plies = {0: []}  # Ply -> positions found won or lost at it
+        pending = {}  # Ply -> positions won by leaving the set (promotion), unless found faster inside it
+        start = time.perf_counter()
+        for index in range(self.size):
+            squares = self.squaresOf(index)
+            if not self.isLegal(squares) or self.index(squares) != index:
+                continue
+            king = squares[1]
+            occupied = sum(1 << sq for sq in squares)
+            attacked = self.attacks(squares, occupied ^ (1 << king))
+            if self.pawnSlot is not None:
+                self.promotions(squares, occupied, attacked, index, tables, pending)
+            targets = KING_ATTACKS[king] & ~attacked
+            successors = set()
+            escapes = False
+            while targets:
+                bit = targets & -targets
+                targets ^= bit
+                if occupied & bit:  # Taking an undefended piece always leaves a draw
+                    escapes = True
+                    break
+                successors.add(self.index(squares[:1] + [bit.bit_length() - 1] + squares[2:]))
+            if escapes:
+                continue
+            if successors:
+                counts[index] = len(successors)
+            elif attacked >> king & 1:
+                btm[index] = 1
+                plies[0].append(index)
+            # Stalemates stay draws
+        if log:
+            log(f"{self.name}: {len(plies[0])} mates found in {time.perf_counter() - start:.1f}s")
+
+        ply = 0
+        while ply in plies or any(p >= ply for p in pending):
+            found = plies.pop(ply, [])
+            if ply % 2 == 0:
+                for index in found:
+                    self.retractStronger(self.squaresOf(index), ply + 1, plies)
+            else:
+                for index in pending.pop(ply, []):
+                    if not wtm[index]:
+                        wtm[index] = ply + 1
+                        found.append(index)
+                for index in found:
+                    self.retractWeaker(self.squaresOf(index), ply + 1, plies, counts)
+            ply += 1
+        if log:
+            log(f"{self.name}: {sum(1 for v in wtm if v)} won and {sum(1 for v in btm if v)} lost positions, "
+                f"longest mate {max(wtm) - 1} plies, {time.perf_counter() - start:.1f}s")
+
+    def promotions(self, squares, occupied, attacked, index, tables, pending):
+        """Queues the wins by promoting of the white to move position with the same squares, which is only
+        legal if the bare king isn't in check"""
+        pawn = squares[self.pawnSlot]
+        if pawn >= 16 or attacked >> squares[1] & 1 or occupied >> (pawn - 8) & 1:
+            return
+        for name in DEPENDENCIES[self.name]:
+            table = tables[name]
+            promoted = [squares[0], squares[1], pawn - 8]
+            if not table.isLegal(promoted):
+                continue
+            value = table.btm[table.index(promoted)]
+            if value:
+                pending.setdefault(value, []).append(index)
+
+    def retractStronger(self, squares, ply, plies):
+        """Marks every white to move position with a move into squares (lost for the bare king) as won in ply"""
+        wtm = self.wtm
+        king = squares[1]
+        occupied = sum(1 << sq for sq in squares)
+        found = plies.setdefault(ply, [])
+        for slot in range(len(squares)):
+            if slot == 1:
+                continue
+            sq = squares[slot]
+            piece = self.pieces[slot - 2] if slot >= 2 else None
+            if piece is None:
+                sources = KING_ATTACKS[sq] & ~occupied & ~KING_ATTACKS[king]
+            elif piece == KNIGHT:
+                sources = KNIGHT_ATTACKS[sq] & ~occupied
+            elif piece == BISHOP:
+                sources = bishopAttacks(sq, occupied) & ~occupied
+            elif piece == ROOK:
+                sources = rookAttacks(sq, occupied) & ~occupied
+            elif piece == QUEEN:
+                sources = (bishopAttacks(sq, occupied) | rookAttacks(sq, occupied)) & ~occupied
+            else:
+                sources = 0
+                if sq + 8 < 56 and not occupied >> (sq + 8) & 1:
+                    sources = 1 << (sq + 8)
+                    if sq // 8 == 4 and not occupied >> (sq + 16) & 1:
+                        sources |= 1 << (sq + 16)
+            while sources:
+                bit = sources & -sources
+                sources ^= bit
+                previous = squares[:]
+                previous[slot] = bit.bit_length() - 1
+                # The bare king can't be in check with white to move
+                if self.attacks(previous, occupied ^ (1 << sq) ^ bit) >> king & 1:
+                    continue
+                index = self.index(previous)
+                if not wtm[index]:
+                    wtm[index] = ply + 1
+                    found.append(index)
+
+    def retractWeaker(self, squares, ply, plies, counts):
+        """Resolves one move of every bare king position with a move into squares (won for white), marking
+        those left without a move that doesn't lose as lost in ply"""
+        btm = self.btm
+        king = squares[1]
+        occupied = sum(1 << sq for sq in squares)
+        sources = KING_ATTACKS[king] & ~occupied & ~KING_ATTACKS[squares[0]]
+        previous = set()
+        while sources:
+            bit = sources & -sources
+            sources ^= bit
+            previous.add(self.index(squares[:1] + [bit.bit_length() - 1] + squares[2:]))
+        found = plies.setdefault(ply, [])
+        for index in previous:  # Once per position, as its moves were counted once per position reached
+            count = counts[index]
+            if count:
+                counts[index] = count - 1
+                if count == 1:
+                    btm[index] = ply + 1
+                    found.append(index)
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.name.encode(), self.size))
+            file.write(self.wtm)
+            file.write(self.btm)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            magic, version, name, size = HEADER.unpack(file.read(HEADER.size))
+            name = name.rstrip(b"\0").decode()
+            if magic != MAGIC or version != VERSION or name not in MATERIALS:
+                raise ValueError(f"{path} is not a tablebase of this version")
+            wtm, btm = file.read(size), file.read(size)
+        table = cls(name, wtm, btm)
+        if len(wtm) != table.size or len(btm) != table.size:
+            raise ValueError(f"{path} is truncated")
+        return table
+
+
+tables = {}  # Name -> Tablebase of every set loaded
+
+
+def load(directory=TABLEBASE_DIR):
+    """Loads every table found in directory"""
+    for name in MATERIALS:
+        path = os.path.join(directory, name + ".tb")
+        if os.path.exists(path):
+            tables[name] = Tablebase.load(path)
+    return tables
+
+
+def _material(gs):
+    """(white pieces, black pieces, white king, black king), pieces being {piece type: square}, or None if
+    either side has two pieces of one type"""
+    pieces = ({}, {})
+    kings = [None, None]
+    squares = getattr(gs, "squares", None)
+    if squares is not None:
+        occupied = [(sq, piece) for sq, piece in enumerate(squares) if piece != EMPTY]
+    else:
+        occupied = [(r * 8 + c, "pNBRQK".index(square[1]) + (6 if square[0] == 'b' else 0))
+                    for r, row in enumerate(gs.board) for c, square in enumerate(row) if square != "--"]
+    if len(occupied) > 4:
+        return None
+    for sq, piece in occupied:
+        color, kind = divmod(piece, 6)
+        if kind == 5:
+            kings[color] = sq
+        elif kind in pieces[color]:
+            return None
+        else:
+            pieces[color][kind] = sq
+    return pieces[0], pieces[1], kings[0], kings[1]
+
+
+def probe(gs):
+    """Score of the current position of gs (either engine) for the side to move: WIN less the plies to
+    mate if it wins, the negative of that if it loses, 0 for a draw. None if no loaded table covers it."""
+    if gs.phase > MAX_PHASE:
+        return None
+    material = _material(gs)
+    if material is None:
+        return None
+    white, black, whiteKing, blackKing = material
+    if black and white:
+        return None
+    if tuple(sorted(white or black)) in DRAWN:
+        return 0
+    rights = gs.currentCastleRights
+    if rights.wks or rights.wqs or rights.bks or rights.bqs:
+        return None
+    stronger = white or black
+    name = next((name for name, pieces in MATERIALS.items() if sorted(pieces) == sorted(stronger)), None)
+    table = tables.get(name)
+    if table is None:
+        return None
+    flip = 0 if white else 56  # Black is the stronger side: mirror the ranks so it plays up the board as white
+    strongKing, weakKing = (whiteKing, blackKing) if white else (blackKing, whiteKing)
+    squares = [strongKing ^ flip, weakKing ^ flip] + [stronger[piece] ^ flip for piece in table.pieces]
+    return table.probe(squares, gs.whiteToMove == bool(white))
+
+
+def bestMove(gs, packedMoves):
+    """The packed move that mates fastest, or holds the draw, or resists longest, if the tables cover the
+    position and every position it leads to; otherwise None"""
+    if not tables or probe(gs) is None:
+        return None
+    best, bestScore = None, None
+    for code in packedMoves:
+        gs.makePackedMove(code)
+        try:
+            moveScore = probe(gs)
+        finally:
+            gs.undoPackedMove()
+        if moveScore is None:
+            return None
+        moveScore = -moveScore
+        if bestScore is None or moveScore > bestScore:
+            best, bestScore = code, moveScore
+    return best
+
+
+def generate(names, directory=TABLEBASE_DIR, log=print):
+    """Builds the tables named, and the ones they depend on, and saves them in directory"""
+    os.makedirs(directory, exist_ok=True)
+    built = dict(load(directory))
+    order = []
+    for name in names:
+        order += [dependency for dependency in DEPENDENCIES.get(name, ()) if dependency not in order] + [name]
+    for name in order:
+        if name in built and name not in names:
+            continue
+        table = Tablebase(name)
+        table.generate(built, log)
+        table.save(os.path.join(directory, name + ".tb"))
+        built[name] = tables[name] = table
+    return built
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate endgame tablebases by retrograde analysis")
+    parser.add_argument("names", nargs="*", choices=sorted(MATERIALS), help="material sets to build (default all)")
+    parser.add_argument("--dir", default=TABLEBASE_DIR, help="directory the tables are saved in")
+    args = parser.parse_args(argv)
+    generate(args.names or list(MATERIALS), args.dir)
+    return 0
+
+
+load()
+
+if __name__ == "__main__":
+    sys.exit(main())
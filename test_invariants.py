@@ -0,0 +1,377 @@
+import os
+import random
+import re
+import tempfile
+import unittest
+import book
+import computer
+import evaluation
+import tablebase
+import zobrist
+from bitboard import BitboardGameState
+from engine import GameState
+from fen import loadFen, toFen
+from moves import CAPTURE, PROMOTION_SHIFT
+from perft import POSITIONS
+from pgn import codeToSan, sanToCode
+from uci import UciEngine, uciToMove
+from transposition import EXACT, LOWERBOUND, UPPERBOUND, TranspositionTable
+
+ENGINES = (GameState, BitboardGameState)
+GAMES, PLIES = 12, 80  # Random games played for each check
+
+
+def playRandomMove(gs, rng):
+    """Makes a random legal move, with a random promotion piece, and returns False if the game is over"""
+    moves = gs.getValidMoves()
+    if not moves or gs.checkmate or gs.stalemate:
+        return False
+    gs.makeMove(rng.choice(moves), rng.choice("QRBN"))
+    return True
+
+
+def legalCodes(gs):
+    """The legal packed moves of gs, leaving out the en passant captures out of a pin the string engine lists"""
+    codes = []
+    for code in gs.getValidMovesPacked():
+        gs.makePackedMove(code)
+        if not gs.movedIntoCheck():
+            codes.append(code)
+        gs.undoPackedMove()
+    return codes
+
+
+def incrementalState(gs):
+    return gs.zobristKey, gs.mgScore, gs.egScore, gs.phase
+
+
+def recomputedState(gs):
+    """What incrementalState should hold, computed from the board alone"""
+    key = zobrist.computeKey(gs.board, gs.whiteToMove, gs.currentCastleRights, gs.enpassantPossible)
+    return (key,) + evaluation.computeTotals(gs.board)
+
+
+class IncrementalStateTest(unittest.TestCase):
+    """makeMove/undoMove keep the Zobrist key and evaluation totals equal to a full recompute"""
+
+    def testMakeAndUndo(self):
+        for engine in ENGINES:
+            rng = random.Random(1)
+            for _ in range(GAMES):
+                gs = engine()
+                states = []
+                for _ in range(PLIES):
+                    states.append(incrementalState(gs))
+                    if not playRandomMove(gs, rng):
+                        states.pop()
+                        break
+                    self.assertEqual(incrementalState(gs), recomputedState(gs), engine.__name__)
+                while states:
+                    gs.undoMove()
+                    self.assertEqual(incrementalState(gs), states.pop(), engine.__name__)
+                    self.assertEqual(incrementalState(gs), recomputedState(gs), engine.__name__)
+
+    def testEnginesAgree(self):
+        """The same moves give both engines the same key, castling rights included"""
+        rng = random.Random(6)
+        for _ in range(GAMES):
+            string, bitboard = GameState(), BitboardGameState()
+            for _ in range(PLIES):
+                moves = string.getValidMoves()
+                if not moves or string.checkmate or string.stalemate:
+                    break
+                move, choice = rng.choice(moves), rng.choice("QRBN")
+                same = [other for other in bitboard.getValidMoves() if other.moveID == move.moveID]
+                if not same:  # The string engine's illegal en passant captures
+                    break
+                string.makeMove(move, choice)
+                bitboard.makeMove(same[0], choice)
+                self.assertEqual(string.zobristKey, bitboard.zobristKey)
+
+    def testNullMove(self):
+        """makeNullMove keeps the incremental state equal to a full recompute and undoNullMove restores it"""
+        for engine in ENGINES:
+            rng = random.Random(2)
+            for _ in range(GAMES):
+                gs = engine()
+                for _ in range(PLIES):
+                    if not playRandomMove(gs, rng):
+                        break
+                    if gs.isInCheck():
+                        continue
+                    before = incrementalState(gs)
+                    gs.makeNullMove()
+                    self.assertEqual(incrementalState(gs), recomputedState(gs), engine.__name__)
+                    gs.undoNullMove()
+                    self.assertEqual(incrementalState(gs), before, engine.__name__)
+
+
+    def testFiftyMoveCounter(self):
+        """The counter counts plies since a capture or pawn move and undoMove restores it"""
+        for engine in ENGINES:
+            rng = random.Random(3)
+            for _ in range(GAMES):
+                gs = loadFen(engine(), "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 37 1")
+                counters = []
+                for _ in range(PLIES):
+                    moves = gs.getValidMoves()
+                    if not moves or gs.checkmate or gs.stalemate:
+                        break
+                    move = rng.choice(moves)
+                    counters.append(gs.fiftyMoveCounter)
+                    gs.makeMove(move)
+                    resets = move.pieceCaptured != "--" or move.pieceMoved[1] == "p"
+                    self.assertEqual(gs.fiftyMoveCounter, 0 if resets else counters[-1] + 1, engine.__name__)
+                while counters:
+                    gs.undoMove()
+                    self.assertEqual(gs.fiftyMoveCounter, counters.pop(), engine.__name__)
+
+
+class PerftTest(unittest.TestCase):
+    """The bitboard engine matches the published node counts of the reference positions"""
+
+    def testReferencePositions(self):
+        for name, fen, counts, _ in POSITIONS:
+            gs = loadFen(BitboardGameState(), fen)
+            for depth in range(1, 4):
+                self.assertEqual(gs.perft(depth), counts[depth - 1], f"{name} depth {depth}")
+
+
+class MoveGenerationTest(unittest.TestCase):
+
+    def testEnginesListSameMoves(self):
+        """Both engines give the same packed moves, flags and one code per promotion piece included"""
+        rng = random.Random(10)
+        for _ in range(GAMES):
+            fen = rng.choice(POSITIONS)[1]
+            string, bitboard = loadFen(GameState(), fen), loadFen(BitboardGameState(), fen)
+            for _ in range(PLIES):
+                codes = sorted(legalCodes(bitboard))
+                self.assertEqual(sorted(legalCodes(string)), codes, toFen(bitboard))
+                if not codes:
+                    break
+                code = rng.choice(codes)
+                string.makePackedMove(code)
+                bitboard.makePackedMove(code)
+
+    def testFindMoveKeepsPromotion(self):
+        """A promotion the search returns as a packed move is played with its piece by makeMove"""
+        for engine in ENGINES:
+            gs = loadFen(engine(), "1n5k/P7/8/8/8/8/8/K7 w - - 0 1")
+            for code in gs.getValidMovesPacked():
+                if not (code >> PROMOTION_SHIFT) & 7:
+                    continue
+                gs.makePackedMove(code)
+                expected = toFen(gs)
+                gs.undoPackedMove()
+                gs.makeMove(computer.findMove(gs.getValidMoves(), code))
+                self.assertEqual(toFen(gs), expected, engine.__name__)
+                gs.undoMove()
+
+    def testCapturesOnly(self):
+        """getCapturesPacked gives the captures and promotions of the full legal list, after isInCheck or not"""
+        for engine in ENGINES:
+            rng = random.Random(9)
+            for _ in range(GAMES):
+                gs = loadFen(engine(), rng.choice(POSITIONS)[1])
+                for _ in range(PLIES):
+                    if rng.random() < 0.5:
+                        gs.isInCheck()  # Quiescence asks first, and the generator reuses the pins it found
+                    captures = gs.getCapturesPacked()
+                    expected = [code for code in gs.getValidMovesPacked()
+                                if code & CAPTURE or (code >> PROMOTION_SHIFT) & 7]
+                    self.assertEqual(sorted(captures), sorted(expected), (engine.__name__, toFen(gs)))
+                    if not playRandomMove(gs, rng):
+                        break
+
+
+class TranspositionTableTest(unittest.TestCase):
+
+    def testStoreAndProbe(self):
+        table = TranspositionTable(1)
+        rng = random.Random(5)
+        entries = {}
+        while len(entries) < 200:
+            key = rng.getrandbits(64)
+            if all(key % table.numBuckets != other % table.numBuckets for other in entries):  # No replacements
+                entries[key] = (rng.randrange(1, 64), rng.randrange(-30000, 30001),
+                                rng.choice((EXACT, LOWERBOUND, UPPERBOUND)), rng.getrandbits(19))
+        for key, entry in entries.items():
+            table.store(key, *entry)
+        for key, entry in entries.items():
+            self.assertEqual(table.probe(key), entry)
+        self.assertIsNone(table.probe(rng.getrandbits(64)))
+
+    def testBoundOnlyUpdateKeepsMove(self):
+        table = TranspositionTable(1)
+        table.store(12345, 4, 30, EXACT, 777)
+        table.store(12345, 5, 10, UPPERBOUND)
+        self.assertEqual(table.probe(12345), (5, 10, UPPERBOUND, 777))
+
+
+def placementFen(pieces, whiteToMove):
+    """FEN of a position holding only pieces, a dict of square -> FEN letter"""
+    rows = ["".join(pieces.get(r * 8 + c, "1") for c in range(8)) for r in range(8)]
+    placement = "/".join(re.sub("1+", lambda run: str(len(run.group())), row) for row in rows)
+    return placement + (" w" if whiteToMove else " b") + " - - 0 1"
+
+
+class TablebaseTest(unittest.TestCase):
+    """A generated KQK table holds the known longest mate and agrees with its own children"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loaded = dict(tablebase.tables)
+        cls.directory = tempfile.TemporaryDirectory()
+        tablebase.generate(["KQK"], cls.directory.name, log=None)
+
+    @classmethod
+    def tearDownClass(cls):
+        tablebase.tables.clear()
+        tablebase.tables.update(cls.loaded)
+        cls.directory.cleanup()
+
+    def testLongestMate(self):
+        table = tablebase.tables["KQK"]
+        self.assertEqual(max(table.wtm) - 1, 19)  # Mate in 10
+        saved = tablebase.Tablebase.load(os.path.join(self.directory.name, "KQK.tb"))
+        self.assertEqual((saved.wtm, saved.btm), (table.wtm, table.btm))
+
+    def testProbeMatchesChildren(self):
+        rng = random.Random(7)
+        checked = 0
+        while checked < 200:
+            squares = rng.sample(range(64), 3)
+            pieces = dict(zip(squares, rng.choice(("KkQ", "kKq"))))
+            gs = loadFen(BitboardGameState(), placementFen(pieces, rng.random() < 0.5))
+            gs.makeNullMove()
+            kingsTouch = abs(squares[0] // 8 - squares[1] // 8) <= 1 and abs(squares[0] % 8 - squares[1] % 8) <= 1
+            illegal = kingsTouch or gs.isInCheck()
+            gs.undoNullMove()
+            if illegal:
+                continue
+            best = None
+            for code in gs.getValidMovesPacked():
+                gs.makePackedMove(code)
+                score = -tablebase.probe(gs)
+                gs.undoPackedMove()
+                score -= (score > 0) - (score < 0)  # One ply further from mate
+                best = score if best is None else max(best, score)
+            if best is None:
+                best = -tablebase.WIN if gs.isInCheck() else 0
+            self.assertEqual(tablebase.probe(gs), best, placementFen(pieces, gs.whiteToMove))
+            checked += 1
+
+
+class FenTest(unittest.TestCase):
+    """toFen and loadFen are inverse on both engines"""
+
+    def testReferencePositions(self):
+        for engine in ENGINES:
+            for name, fen, _, _ in POSITIONS:
+                self.assertEqual(toFen(loadFen(engine(), fen)), fen, f"{engine.__name__} {name}")
+
+    def testRandomGames(self):
+        for engine in ENGINES:
+            rng = random.Random(4)
+            for _ in range(GAMES):
+                gs = engine()
+                for _ in range(PLIES):
+                    if not playRandomMove(gs, rng):
+                        break
+                    fen = toFen(gs)
+                    copy = loadFen(engine(), fen)
+                    self.assertEqual(toFen(copy), fen, engine.__name__)
+                    self.assertEqual(incrementalState(copy), incrementalState(gs), fen)
+
+    def testRejectsMissingKings(self):
+        for fen in ("8/8/8/8/8/8/4P3/4K3 w - - 0 1", "4k3/8/8/8/8/8/8/3KK3 w - - 0 1", "8/8/8/8/8/8/8/8 w - - 0 1"):
+            for engine in ENGINES:
+                with self.assertRaises(ValueError, msg=fen):
+                    loadFen(engine(), fen)
+
+    def testDropsUnusableCastlingRights(self):
+        """Castling rights whose king or rook is not on its home square are dropped"""
+        fen = "r3k3/8/8/8/8/8/8/1R2K2R w KQkq - 0 1"
+        for engine in ENGINES:
+            self.assertEqual(toFen(loadFen(engine(), fen)), "r3k3/8/8/8/8/8/8/1R2K2R w Kq - 0 1", engine.__name__)
+
+
+class SanTest(unittest.TestCase):
+    """codeToSan and sanToCode are inverse for every legal move, promotions to each piece included"""
+
+    def testRandomGames(self):
+        for engine in ENGINES:
+            rng = random.Random(8)
+            for _ in range(GAMES // 2):
+                gs = engine()
+                for _ in range(PLIES):
+                    sans = set()
+                    for code in legalCodes(gs):
+                        san = codeToSan(gs, code)
+                        self.assertEqual(sanToCode(gs, san), code, f"{engine.__name__} {toFen(gs)} {san}")
+                        self.assertNotIn(san, sans, toFen(gs))
+                        sans.add(san)
+                    if not playRandomMove(gs, rng):
+                        break
+
+
+class PolyglotKeyTest(unittest.TestCase):
+    """polyglotKey gives the keys of the Polyglot book format specification"""
+
+    LINES = [[("", 0x463b96181691fc9c), ("e2e4", 0x823c9b50fd114196), ("d7d5", 0x0756b94461c50fb0),
+              ("e4e5", 0x662fafb965db29d4), ("f7f5", 0x22a48b5a8e47ff78), ("e1e2", 0x652a607ca3f242c1),
+              ("e8f7", 0x00fdd303c946bdd9)],
+             [("a2a4 b7b5 h2h4 b5b4 c2c4", 0x3c8123ea7b067637), ("b4c3 a1a3", 0x5c3f9b829b279560)]]
+
+    def testSpecificationKeys(self):
+        for engine in ENGINES:
+            for line in self.LINES:
+                gs = engine()
+                for moves, key in line:
+                    for text in moves.split():
+                        gs.makePackedMove(uciToMove(gs, text))
+                    self.assertEqual(book.polyglotKey(gs), key, f"{engine.__name__} after {moves}")
+
+
+class UciTest(unittest.TestCase):
+    """position, go and bestmove through the UCI front-end, as a GUI would send them"""
+
+    def send(self, *commands):
+        lines = []
+        engine = UciEngine(output=lines.append)
+        for command in commands:
+            engine.handle(command)
+        engine.waitSearch()
+        return engine, lines
+
+    def testHandshake(self):
+        _, lines = self.send("uci", "isready")
+        self.assertEqual(lines[0], "id name PyChessGame")
+        self.assertEqual(lines[-2:], ["uciok", "readyok"])
+
+    def testBestMoveIsLegal(self):
+        engine, lines = self.send("ucinewgame", "position startpos moves e2e4 e7e5 g1f3", "go depth 3")
+        self.assertTrue(lines[-1].startswith("bestmove "), lines)
+        self.assertIsNotNone(uciToMove(engine.gs, lines[-1].split()[1]), lines)
+        self.assertTrue(any(line.startswith("info depth 3 ") for line in lines), lines)
+
+    def testFindsMate(self):
+        _, lines = self.send("ucinewgame", "position fen 6k1/5ppp/8/8/8/8/8/R5K1 w - - 0 1", "go depth 3")
+        self.assertEqual(lines[-1], "bestmove a1a8")
+        self.assertIn(" score mate 1 ", lines[-2])
+
+    def testRejectsBadInput(self):
+        engine, lines = self.send("position startpos moves e2e5", "position fen not a fen")
+        self.assertEqual(lines, ["info string illegal move e2e5", "info string invalid fen not a fen"])
+        self.assertEqual(engine.gs.zobristKey, BitboardGameState().zobristKey)
+
+    def testRejectsPositionWithoutKing(self):
+        fen = "8/8/8/8/8/8/4P3/4K3 w - - 0 1"
+        _, lines = self.send(f"position fen {fen}", "go depth 2")
+        self.assertEqual(lines[0], f"info string invalid fen {fen}")
+        self.assertTrue(lines[-1].startswith("bestmove "), lines)  # Searched the starting position instead
+
+
+if __name__ == "__main__":
+    unittest.main()
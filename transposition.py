@@ -0,0 +1,152 @@
+from array import array
+from multiprocessing import shared_memory
+
+EXACT, LOWERBOUND, UPPERBOUND = 0, 1, 2  # Bound types stored with each score
+ENTRY_BYTES = 16  # 8 byte check word + 8 byte packed data
+BUCKET_SIZE = 2  # Slot 0 is depth-preferred, slot 1 is always-replace
+SCORE_OFFSET = 1 << 15  # Scores are stored unsigned in 16 bits
+HEADER_WORDS = 2  # Shared tables start with the search age and the number of buckets
+
+
+class TranspositionTable:
+    """Fixed-size hash table of search results keyed by the Zobrist key of a position.
+
+    Each entry packs score (16 bits), bound type (2), depth (8), search age (6) and
+    best move (32) into one 64-bit word, so the memory used never grows past sizeMB.
+    The key is stored XORed with that word: an entry only matches if both words belong
+    to the same write, which lets processes share a table without locks (see
+    SharedTranspositionTable), since a torn write just reads as a miss.
+    """
+
+    def __init__(self, sizeMB=16):
+        self.resize(sizeMB)
+
+    def resize(self, sizeMB):
+        self.sizeMB = sizeMB
+        self.numBuckets = max(1, sizeMB * 1024 * 1024 // (ENTRY_BYTES * BUCKET_SIZE))
+        self.keys = array('Q', bytes(8 * self.numBuckets * BUCKET_SIZE))
+        self.data = array('Q', bytes(8 * self.numBuckets * BUCKET_SIZE))
+        self.age = 0
+        self.hits, self.probes = 0, 0
+
+    def clear(self):
+        self.resize(self.sizeMB)
+
+    def newSearch(self):
+        """Ages the table so entries from earlier searches become replaceable"""
+        self.age = (self.age + 1) & 0x3F
+        self.hits, self.probes = 0, 0
+
+    def probe(self, key):
+        """Returns (depth, score, bound, move) for key, or None if it is not stored"""
+        self.probes += 1
+        index = (key % self.numBuckets) * BUCKET_SIZE
+        keys, data = self.keys, self.data
+        entry = data[index]
+        if keys[index] ^ entry != key:
+            entry = data[index + 1]
+            if keys[index + 1] ^ entry != key:
+                return None
+        self.hits += 1
+        return ((entry >> 18) & 0xFF, (entry & 0xFFFF) - SCORE_OFFSET, (entry >> 16) & 0x3, entry >> 32)
+
+    def store(self, key, depth, score, bound, move=0):
+        index = (key % self.numBuckets) * BUCKET_SIZE
+        keys, data = self.keys, self.data
+        oldData = data[index]
+        age = self.age
+        # Keep the deeper result of the current search in the depth-preferred slot
+        if keys[index] ^ oldData != key and depth < (oldData >> 18) & 0xFF and (oldData >> 26) & 0x3F == age:
+            index += 1
+        if move == 0 and keys[index] ^ data[index] == key:
+            move = data[index] >> 32  # Don't lose the best move of a bound-only update
+        score = max(-SCORE_OFFSET, min(SCORE_OFFSET - 1, int(score)))
+        entry = ((move & 0xFFFFFFFF) << 32) | (age << 26) | (min(depth, 0xFF) << 18) | (bound << 16) | \
+                (score + SCORE_OFFSET)
+        data[index] = entry
+        keys[index] = key ^ entry
+
+    def hashfull(self):
+        """Permille of the first 1000 slots used by the current search (UCI style)"""
+        sample = min(1000, len(self.data))
+        used = sum(1 for i in range(sample) if self.data[i] and (self.data[i] >> 26) & 0x3F == self.age)
+        return used * 1000 // sample
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """Transposition table in multiprocessing.shared_memory, so search processes share their results
+    without any messages per node (Lazy SMP).
+
+    The process that creates it owns it: only the owner resizes, clears and ages the table, and the
+    others attach by name. The search age lives in the shared header so every process stores entries
+    with the same one.
+    """
+
+    def __init__(self, sizeMB=16, name=None):
+        self.memory = None
+        self.owner = name is None
+        if self.owner:
+            self.resize(sizeMB)
+        else:
+            self.attach(name)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    @property
+    def age(self):
+        return self.header[0]
+
+    @age.setter
+    def age(self, value):
+        self.header[0] = value
+
+    def resize(self, sizeMB):
+        self.close()
+        self.sizeMB = sizeMB
+        self.numBuckets = max(1, sizeMB * 1024 * 1024 // (ENTRY_BYTES * BUCKET_SIZE))
+        slots = self.numBuckets * BUCKET_SIZE
+        self.memory = shared_memory.SharedMemory(create=True, size=8 * HEADER_WORDS + ENTRY_BYTES * slots)
+        self.mapViews(slots)
+        self.memory.buf[:] = bytes(self.memory.size)  # Not every platform hands out zeroed memory
+        self.header[1] = self.numBuckets
+        self.hits, self.probes = 0, 0
+
+    def attach(self, name):
+        self.memory = shared_memory.SharedMemory(name=name)
+        header = self.memory.buf[:8 * HEADER_WORDS].cast('Q')
+        self.numBuckets = header[1]
+        header.release()
+        self.mapViews(self.numBuckets * BUCKET_SIZE)
+        self.sizeMB = self.numBuckets * BUCKET_SIZE * ENTRY_BYTES // (1024 * 1024)
+        self.hits, self.probes = 0, 0
+
+    def mapViews(self, slots):
+        buffer = self.memory.buf
+        self.header = buffer[:8 * HEADER_WORDS].cast('Q')
+        start = 8 * HEADER_WORDS
+        self.keys = buffer[start:start + 8 * slots].cast('Q')
+        self.data = buffer[start + 8 * slots:start + 16 * slots].cast('Q')
+
+    def clear(self):
+        """Empties the table for every process sharing it"""
+        if self.owner:
+            self.memory.buf[8 * HEADER_WORDS:] = bytes(self.memory.size - 8 * HEADER_WORDS)
+            self.age = 0
+
+    def newSearch(self):
+        if self.owner:
+            self.age = (self.age + 1) & 0x3F
+        self.hits, self.probes = 0, 0
+
+    def close(self):
+        """Detaches this process; the owner also frees the memory"""
+        if self.memory is None:
+            return
+        for view in (self.header, self.keys, self.data):
+            view.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+        self.memory = None
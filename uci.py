@@ -0,0 +1,213 @@
+import sys
+import threading
+import time
+import computer
+import parallel
+import tablebase
+from bitboard import BitboardGameState
+from fen import loadFen, STARTING_FEN
+from moves import PROMOTION_PIECES, PROMOTION_SHIFT
+
+ENGINE_NAME = "PyChessGame"
+MAX_HASH_MB = 1024
+MAX_THREADS = 64
+
+
+def moveToUci(code):
+    """Long algebraic notation (e2e4, e7e8q) of a packed move"""
+    start, end = code & 63, (code >> 6) & 63
+    promotion = (code >> PROMOTION_SHIFT) & 7
+    text = "abcdefgh"[start & 7] + str(8 - (start >> 3)) + "abcdefgh"[end & 7] + str(8 - (end >> 3))
+    return text + (PROMOTION_PIECES[promotion].lower() if promotion else "")
+
+
+def uciToMove(gs, text):
+    """The legal packed move of gs written as text, or None"""
+    for code in gs.getValidMovesPacked():
+        if moveToUci(code) == text or moveToUci(code) == text + "q" and len(text) == 4:
+            return code
+    return None
+
+
+def formatScore(info, pv):
+    """UCI score of searchInfo from the side to move: mates as moves to mate, the rest in centipawns"""
+    score = info["score"]
+    if abs(score) >= computer.CHECKMATE:
+        moves = (len(pv) + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    if info.get("tablebase") and score:
+        moves = (tablebase.WIN - abs(score) + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {score}"
+
+
+class UciEngine:
+    """The engine behind the UCI protocol, for chess GUIs and test tools: commands are read from a text
+    stream and searches run in a worker thread, so stop and isready are answered while searching."""
+
+    def __init__(self, output=None, engine=BitboardGameState):
+        self.output = output or (lambda line: print(line, flush=True))
+        self.engine = engine
+        self.gs = engine()
+        self.threads = 1
+        self.searchThread = None
+        self.searchStop = None
+        self.searchInfinite = False  # Only stop ends the search, so other commands mustn't wait for it
+
+    def run(self, lines):
+        for line in lines:
+            if not self.handle(line):
+                break
+        self.stopSearch()
+        parallel.shutdown()
+
+    def handle(self, line):
+        """Carries out one command, returning False on quit"""
+        words = line.split()
+        if not words:
+            return True
+        command, args = words[0], words[1:]
+        if command == "uci":
+            self.output(f"id name {ENGINE_NAME}")
+            self.output("id author PyChessGame contributors")
+            self.output(f"option name Hash type spin default {computer.HASH_SIZE_MB} min 1 max {MAX_HASH_MB}")
+            self.output(f"option name Threads type spin default 1 min 1 max {MAX_THREADS}")
+            self.output("uciok")
+        elif command == "isready":
+            self.output("readyok")
+        elif command == "ucinewgame":
+            self.waitSearch()
+            computer.newGame()
+            parallel.newGame()
+        elif command == "setoption":
+            self.waitSearch()
+            self.setOption(args)
+        elif command == "position":
+            self.waitSearch()
+            self.setPosition(args)
+        elif command == "go":
+            self.waitSearch()
+            self.go(args)
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "quit":
+            return False
+        return True
+
+    def setOption(self, args):
+        text = " ".join(args)
+        name, _, value = text.partition(" value ")
+        name = name.replace("name", "", 1).strip().lower()
+        try:
+            number = int(value)
+        except ValueError:
+            self.output(f"info string bad value {value!r} for option {name}")
+            return
+        if name == "hash":
+            size = max(1, min(MAX_HASH_MB, number))
+            computer.setHashSize(size)
+            parallel.setHashSize(size)
+        elif name == "threads":
+            self.threads = max(1, min(MAX_THREADS, number))
+        else:
+            self.output(f"info string unknown option {name}")
+
+    def setPosition(self, args):
+        if "moves" in args:
+            split = args.index("moves")
+            args, moves = args[:split], args[split + 1:]
+        else:
+            moves = []
+        if args[:1] == ["fen"]:
+            fen = " ".join(args[1:])
+        else:
+            fen = STARTING_FEN
+        try:
+            loadFen(self.gs, fen)
+        except (ValueError, KeyError, IndexError):
+            self.output(f"info string invalid fen {fen}")
+            loadFen(self.gs, STARTING_FEN)
+            return
+        for text in moves:
+            code = uciToMove(self.gs, text)
+            if code is None:
+                self.output(f"info string illegal move {text}")
+                return
+            self.gs.makePackedMove(code)
+
+    def go(self, args):
+        """Starts a search for go depth/movetime/wtime/btime/winc/binc/nodes/infinite; bestmove is printed
+        when it ends. One thread prints an info line per completed depth. With Threads > 1 the workers
+        search in other processes, so only one info line is printed, for the result, when the search ends."""
+        limits = {}
+        for i, word in enumerate(args[:-1]):
+            if word in ("depth", "movetime", "wtime", "btime", "winc", "binc", "nodes", "movestogo"):
+                try:
+                    limits[word] = int(args[i + 1])
+                except ValueError:
+                    pass
+        maxDepth = limits.get("depth", computer.MAX_DEPTH)
+        softTime = hardTime = None
+        if "movetime" in limits:
+            softTime = hardTime = limits["movetime"] / 1000
+        elif "wtime" in limits or "btime" in limits:
+            side = "w" if self.gs.whiteToMove else "b"
+            timeLeft = limits.get(side + "time", 0) / 1000
+            softTime, hardTime = computer.allocateTime(timeLeft, limits.get(side + "inc", 0) / 1000)
+        gs, stop = self.gs, threading.Event()
+
+        def search():
+            validMoves = gs.getValidMoves()
+            start = time.perf_counter()
+            if not validMoves:
+                self.output("bestmove 0000")
+                return
+            if self.threads > 1:
+                move = parallel.findBestMoveLazySMP(gs, validMoves, maxDepth, softTime, hardTime, stop,
+                                                    self.threads, limits.get("nodes"))
+                self.report(computer.searchInfo, time.perf_counter() - start)
+            else:
+                move = computer.findBestMoveIterative(gs, validMoves, maxDepth, softTime, hardTime, stop,
+                                                      limits.get("nodes"),
+                                                      lambda info: self.report(info, time.perf_counter() - start))
+                if computer.searchInfo.get("tablebase") or not computer.searchInfo["depth"]:
+                    self.report(computer.searchInfo, time.perf_counter() - start)
+            if move is None:  # Stopped before depth 1 finished
+                move = validMoves[0]
+            code = move.pack()  # Promotes to the piece the search chose
+            self.output(f"bestmove {moveToUci(code)}")
+
+        self.searchStop = stop
+        self.searchInfinite = "infinite" in args or not limits.keys() & {"depth", "movetime", "wtime", "btime", "nodes"}
+        self.searchThread = threading.Thread(target=search, daemon=True)
+        self.searchThread.start()
+
+    def report(self, info, seconds):
+        pv = info.get("pv") or []
+        nodes = info.get("nodes", 0)
+        self.output(f"info depth {info.get('depth', 0)} score {formatScore(info, pv)} nodes {nodes} "
+                    f"nps {int(nodes / seconds) if seconds > 0 else 0} time {int(seconds * 1000)} "
+                    f"pv {' '.join(moveToUci(code) for code in pv)}".rstrip())
+
+    def stopSearch(self):
+        """Stops the running search, which then prints its bestmove, and waits for it"""
+        if self.searchThread is not None:
+            self.searchStop.set()
+        self.waitSearch()
+
+    def waitSearch(self):
+        """Lets a search with limits finish before the next command changes the position or settings"""
+        if self.searchThread is not None:
+            if self.searchInfinite:
+                self.searchStop.set()
+            self.searchThread.join()
+            self.searchThread, self.searchStop = None, None
+
+
+def main():
+    UciEngine().run(sys.stdin)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+import random
+
+# Piece order shared by every board representation, so the same position hashes to the same key
+PIECES = ["wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK"]
+pieceIndex = {piece: i for i, piece in enumerate(PIECES)}
+
+# Fixed seed keeps keys identical between runs and between worker processes
+_random = random.Random(0x5EED)
+pieceKeys = [[_random.getrandbits(64) for _ in range(64)] for _ in range(len(PIECES))]  # [piece][row * 8 + col]
+castleKeys = [_random.getrandbits(64) for _ in range(16)]  # One key per combination of castling rights
+enpassantKeys = [_random.getrandbits(64) for _ in range(8)]  # One key per en passant file
+sideKey = _random.getrandbits(64)  # Toggled whenever black is to move
+
+
+def castleIndex(castleRights):
+    """Packs the four castling rights into a 0-15 index for castleKeys"""
+    return castleRights.wks | (castleRights.bks << 1) | (castleRights.wqs << 2) | (castleRights.bqs << 3)
+
+
+def computeKey(board, whiteToMove, castleRights, enpassantPossible):
+    """Builds the key of a position from scratch; makeMove/undoMove keep it up to date afterwards"""
+    key = 0
+    for row in range(8):
+        for col in range(8):
+            piece = board[row][col]
+            if piece != "--":
+                key ^= pieceKeys[pieceIndex[piece]][row * 8 + col]
+    key ^= castleKeys[castleIndex(castleRights)]
+    if enpassantPossible:
+        key ^= enpassantKeys[enpassantPossible[1]]
+    if not whiteToMove:
+        key ^= sideKey
+    return key